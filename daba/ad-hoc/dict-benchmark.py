@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+
+# Benchmark dictionary loading (daba.formats.DictReader) on a large
+# synthetic Toolbox file. With --compare, the file is also loaded adding
+# items to DabaDict one by one, as DictReader used to, and both results
+# are checked to be equal.
+
+import os
+import time
+import random
+import argparse
+import tempfile
+
+import daba.formats
+
+VOWELS = u'aeiouɛɔ'
+CONSONANTS = u'bcdfgjkmnprstyɲŋ'
+TONES = [u'', u'́', u'̀', u'̌']
+PSLIST = ['n', 'v', 'adj', 'n/v', 'adv', 'prn']
+GLOSSES = ['house', 'dog', 'go', 'see', 'big', 'water', 'child']
+
+
+class ItemwiseDict(daba.formats.DabaDict):
+    """DabaDict filled item by item, hashing each item separately"""
+    def update_items(self, items, reprs=None):
+        for key, value in items:
+            self[key] = value
+
+
+def make_word():
+    return u''.join(random.choice(CONSONANTS) + random.choice(VOWELS) + random.choice(TONES)
+                    for i in range(random.randint(1, 3)))
+
+
+def write_dictionary(filename, entries, seed=0):
+    random.seed(seed)
+    with open(filename, 'w', encoding='utf-8') as out:
+        out.write(u'\\lang bam\n\\name synthetic\n\\ver {0}\n\n'.format(entries))
+        for i in range(entries):
+            word = make_word()
+            out.write(u'\\lx {0}\n'.format(word))
+            if random.random() < 0.2:
+                out.write(u'\\va {0}\n'.format(make_word()))
+            if random.random() < 0.3:
+                out.write(u'\\mm {0}:n:X\n\\mm {1}:mrph:PL\n'.format(word[:2], word[2:] or u'w'))
+            out.write(u'\\ps {0}\n'.format(random.choice(PSLIST)))
+            out.write(u'\\ge {0}{1}\n'.format(random.choice(GLOSSES), i % 97))
+            if random.random() < 0.3:
+                out.write(u'\\gf maison\n')
+            out.write(u'\\gv var\n\n')
+
+
+def load(filename, dictclass=None):
+    saved = daba.formats.DabaDict
+    if dictclass:
+        daba.formats.DabaDict = dictclass
+    try:
+        start = time.perf_counter()
+        reader = daba.formats.DictReader(filename, variants=True, polisemy=True)
+        return reader.get(), time.perf_counter() - start
+    finally:
+        daba.formats.DabaDict = saved
+
+
+def main():
+    aparser = argparse.ArgumentParser(description='Benchmark Toolbox dictionary loading')
+    aparser.add_argument('-n', '--entries', type=int, default=100000, help='Number of entries in synthetic dictionary')
+    aparser.add_argument('-d', '--dictionary', help='Benchmark given dictionary file instead of a synthetic one')
+    aparser.add_argument('-c', '--compare', action='store_true', help='Compare with item by item loading')
+    args = aparser.parse_args()
+
+    if args.dictionary:
+        filename = args.dictionary
+    else:
+        filename = os.path.join(tempfile.mkdtemp(), 'synthetic.txt')
+        write_dictionary(filename, args.entries)
+    size = os.path.getsize(filename)
+
+    dic, elapsed = load(filename)
+    print(u'batch:    {0:.2f}s, {1:.1f} MB/s, {2} keys, hash {3}'.format(
+        elapsed, size / elapsed / 1e6, len(dic), dic.hash))
+    if args.compare:
+        itemwise, elapsed = load(filename, ItemwiseDict)
+        print(u'itemwise: {0:.2f}s, {1:.1f} MB/s, {2} keys, hash {3}'.format(
+            elapsed, size / elapsed / 1e6, len(itemwise), itemwise.hash))
+        print(u'equal: {0}'.format(dic == itemwise and list(dic.items()) == list(itemwise.items())))
+
+    if not args.dictionary:
+        os.remove(filename)
+        os.rmdir(os.path.dirname(filename))
+
+
+if __name__ == '__main__':
+    main()
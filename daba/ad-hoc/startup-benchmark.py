@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+
+# Benchmark command line startup: time to import a daba module and to
+# print --help, each measured in a fresh interpreter. With --top, also
+# list the heaviest imports reported by python -X importtime.
+
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+
+def wall_time(command, repeat):
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def import_times(module):
+    """run python -X importtime, return list of (cumulative usec, module) for all imports"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {0}'.format(module)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True,
+                            universal_newlines=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            times.append((int(fields[1]), fields[2].rstrip()))
+        except ValueError:
+            # header line
+            pass
+    return times
+
+
+def main():
+    aparser = argparse.ArgumentParser(description='Benchmark daba command line startup time')
+    aparser.add_argument('-m', '--module', default='daba.mparser', help='Module to benchmark')
+    aparser.add_argument('-n', '--repeat', type=int, default=10, help='Number of runs (median is reported)')
+    aparser.add_argument('-t', '--top', type=int, default=0, help='Print N heaviest imports')
+    args = aparser.parse_args()
+
+    python = [sys.executable]
+    imported = wall_time(python + ['-c', 'import {0}'.format(args.module)], args.repeat)
+    baseline = wall_time(python + ['-c', 'pass'], args.repeat)
+    helptime = wall_time(python + ['-m', args.module, '--help'], args.repeat)
+    print(u'interpreter: {0:.3f}s'.format(baseline))
+    print(u'import:      {0:.3f}s (+{1:.3f}s)'.format(imported, imported - baseline))
+    print(u'--help:      {0:.3f}s (+{1:.3f}s)'.format(helptime, helptime - baseline))
+    if args.top:
+        for usec, module in sorted(import_times(args.module), reverse=True)[:args.top]:
+            print(u'{0:8.1f}ms {1}'.format(usec / 1000, module))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,7 @@ from collections import defaultdict
 import daba.mparser
 import daba.formats
 from daba.orthography import detone
-from daba2vert import INFLECTION
+from daba.daba2vert import INFLECTION
 import xml.etree.cElementTree as cElementTree
 
 
@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import io
 import os
 import re
+import sys
 import html
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 import daba.formats
 import pickle
 import unicodedata
@@ -52,11 +55,11 @@ def dedot(s, repl=''):
     return s.replace('.', repl)
 
 
-def print_fields(fields, unique=True):
+def print_fields(fields, unique=True, out=None):
     if unique:
-        print(u"\t".join([u'|'.join(filter(None, set(s))) for s in fields]))
+        print(u"\t".join([u'|'.join(filter(None, set(s))) for s in fields]), file=out)
     else:
-        print(u"\t".join([u'|'.join(filter(None, s)) for s in fields]))
+        print(u"\t".join([u'|'.join(filter(None, s)) for s in fields]), file=out)
 
 
 def make_lemmafunc(args):
@@ -82,19 +85,21 @@ def make_tagstring(gloss):
     return u'/'.join(gloss.ps or '_') + mtags
 
 
-def print_token(gt, args, vardict, polidict, get_lemma, sent=False):
+def print_token(gt, args, vardict, polidict, get_lemma, sent=False, out=None):
     if gt.type in ['Comment', '<s>', '<p>']:
         return
     if not gt.type == "w":
         if gt.value:
-           print(gt.token, end="\t")
+           print(gt.token, end="\t", file=out)
     if gt.type == 'w':
         normalized = gt.glosslist[0].form
         if ' ' in normalized:
             words = normalized.split(' ')
+            first = gt.glosslist[0]
             for word in words:
-                gt.glosslist[0] = gt.glosslist[0]._replace(form=word)
-                print_token(gt, args, vardict, polidict, get_lemma, sent=sent)
+                gt.glosslist[0] = first._replace(form=word)
+                print_token(gt, args, vardict, polidict, get_lemma, sent=sent, out=out)
+            gt.glosslist[0] = first
             return
         if args.convert and not args.keepsource:
             token = get_lemma(normalized)
@@ -102,7 +107,7 @@ def print_token(gt, args, vardict, polidict, get_lemma, sent=False):
                 token = detone(token)
         else:
             token = gt.token
-        print(token, end="\t")
+        print(token, end="\t", file=out)
 
         tonals = []
         fields = []
@@ -204,7 +209,7 @@ def print_token(gt, args, vardict, polidict, get_lemma, sent=False):
             if args.debugfields:
                 fields.append([make_tagstring(g) for g in gt.glosslist])
                 
-        print_fields(fields, unique=args.unique)
+        print_fields(fields, unique=args.unique, out=out)
 
     else:
         nfields = 5
@@ -223,21 +228,109 @@ def print_token(gt, args, vardict, polidict, get_lemma, sent=False):
             ctag = args.senttag
         else:
             ctag = gt.type
-        print(u"\t".join([gt.token, ctag] + [gt.token]*(nfields-2)))
+        print(u"\t".join([gt.token, ctag] + [gt.token]*(nfields-2)), file=out)
 
 
-def print_metafield(name, store):
+def print_metafield(name, store, out=None):
     value = html.escape(store.setdefault(name, 'UNDEF'))
-    print(u'{0}="{1}"'.format(name.replace(':', '_'), value), end=" ")
+    print(u'{0}="{1}"'.format(name.replace(':', '_'), value), end=" ", file=out)
 
 
 def reversedEnumerate(l):
     return zip(range(len(l)-1, -1, -1), l)
 
 
-def main():
+def print_doc(infile, args, vardict, polidict, out=None):
+    reader = daba.formats.HtmlReader(infile)
+    print_annotation(os.path.basename(infile), reader.metadata, reader.glosses,
+                     args, vardict, polidict, out=out)
+
+
+def print_annotation(docid, metadata, glosses, args, vardict, polidict, out=None):
+    """print parsed paragraphs (as in HtmlReader.glosses) as a <doc>"""
+    get_lemma = make_lemmafunc(args)
+
+    print("<doc", end=" ", file=out)
+    print(u'id="{0}"'.format(docid), end=" ", file=out)
+    
+    metad = dict(metadata)
+    for f in ['source:type', 'source:year', 'text:translation', 'text:medium', 'author:name']:
+        print_metafield(f, metad, out=out)
+    try:
+        genres = metad['text:genre'].split(';')
+        hgenres = [g.split(' : ')[0] for g in genres] + genres
+        hgenres.sort()
+        metad['text:genre'] = u';'.join(hgenres)
+        print(u'text_genre="{0}"'.format(metad['text:genre']), end=" ", file=out)
+    except (KeyError):
+        print('text_genre="UNDEF"', end=" ", file=out)
+    try:
+        print_metafield('text:title', metad, out=out)
+    except (KeyError):
+        print('text_title="UNDEF"', end="", file=out)
+    print(">", file=out)
+
+    for par in glosses:
+        print("<p>", file=out)
+        for sent, annot in par:
+            print("<s>", file=out)
+            for i, token in reversedEnumerate(annot):
+                print_token(token, args, vardict, polidict, get_lemma, sent=(i == 0), out=out)
+            print("</s>", file=out)
+        print("</p>", file=out)
+
+    print("</doc>", file=out)
+
+
+_worker = {}
+
+
+def init_worker(args, vardict, polidict):
+    _worker['args'] = args
+    _worker['vardict'] = vardict
+    _worker['polidict'] = polidict
+
+
+def convert_file_worker(infile):
+    """convert a file in a pool worker
+
+    Returns (infile, vertical text, error). With --outdir the output is
+    written into a file and text is None.
+    """
+    args = _worker['args']
+    out = io.StringIO()
+    try:
+        print_doc(infile, args, _worker['vardict'], _worker['polidict'], out=out)
+    except Exception as e:
+        return (infile, None, u'{0}: {1}'.format(e.__class__.__name__, e))
+    if args.outdir:
+        outfile = os.path.join(args.outdir, os.path.basename(infile) + '.vert')
+        with open(outfile, 'w', encoding='utf-8') as vert:
+            vert.write(out.getvalue())
+        return (infile, None, None)
+    return (infile, out.getvalue(), None)
+
+
+def convert_list(filenames, args, vardict, polidict):
+    """convert files in a pool of workers, yield results in the input order"""
+    initargs = (args, vardict, polidict)
+    if args.jobs == 1:
+        init_worker(*initargs)
+        for infile in filenames:
+            yield convert_file_worker(infile)
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker,
+                                 initargs=initargs) as pool:
+            for result in pool.map(convert_file_worker, filenames, chunksize=4):
+                yield result
+
+
+def make_parser():
     oparser = argparse.ArgumentParser(description='Native Daba format to vertical format converter')
-    oparser.add_argument('infile', help='Input file (.html)')
+    oparser.add_argument('infile', nargs='?', help='Input file (.html)')
+    oparser.add_argument('-l', '--list', help='Read input filenames from a file (one per line) and export them all as a single vertical corpus')
+    oparser.add_argument('-j', '--jobs', type=int, default=1, help='Number of files to process in parallel (with --list)')
+    oparser.add_argument('-o', '--outdir', help='With --list, write a separate .vert file for each input file into this directory')
     oparser.add_argument("-t", "--tonal", action="store_true", help="Make tonal lemmas")
     oparser.add_argument("-u", "--unique", action="store_true", help="Print only unique lemmas and glosses")
     oparser.add_argument("-n", "--nullify", action="store_true", help="Transliterate all non-ascii characters")
@@ -252,9 +345,15 @@ def main():
     oparser.add_argument("-C", "--conll", action="store_true", help="Output CONLL-compatible format")
     oparser.add_argument("-s", "--senttag", action="store", default="c", help="Tag to use for SentPunct tokens")
     oparser.add_argument("-g", "--nogloss", action="store_true", help="Omit glosses in other language (keep only grammatical)")
+    return oparser
+
+
+def main():
+    oparser = make_parser()
     args = oparser.parse_args()
 
-    reader = daba.formats.HtmlReader(args.infile)
+    if not args.infile and not args.list:
+        oparser.error('either infile or --list is required')
 
     if args.variants:
         vardict, polidict = VariantsLoader(args.variants).get()
@@ -262,39 +361,19 @@ def main():
         vardict = None
         polidict = None
 
-    print("<doc", end=" ")
-    print(u'id="{0}"'.format(os.path.basename(args.infile)), end=" ")
-    
-    metad = dict(reader.metadata)
-    for f in ['source:type', 'source:year', 'text:translation', 'text:medium', 'author:name']:
-        print_metafield(f, metad)
-    try:
-        genres = metad['text:genre'].split(';')
-        hgenres = [g.split(' : ')[0] for g in genres] + genres
-        hgenres.sort()
-        metad['text:genre'] = u';'.join(hgenres)
-        print(u'text_genre="{0}"'.format(metad['text:genre']), end=" ")
-    except (KeyError):
-        print('text_genre="UNDEF"', end=" ")
-    try:
-        print_metafield('text:title', metad)
-    except (KeyError):
-        print('text_title="UNDEF"', end="")
-    print(">")
-
-    for par in reader.glosses:
-        print("<p>")
-        for sent, annot in par:
-            print("<s>")
-            for i, token in reversedEnumerate(annot):
-                if i > 0:
-                    print_token(token, args, vardict, polidict, make_lemmafunc(args))
-                else:
-                    print_token(token, args, vardict, polidict, make_lemmafunc(args), sent=True)
-            print("</s>")
-        print("</p>")
+    if not args.list:
+        print_doc(args.infile, args, vardict, polidict)
+        return
 
-    print("</doc>")
+    with open(args.list, encoding='utf-8') as filelist:
+        filenames = [line.strip() for line in filelist if line.strip()]
+    if args.outdir:
+        os.makedirs(args.outdir, exist_ok=True)
+    for infile, vert, error in convert_list(filenames, args, vardict, polidict):
+        if error:
+            sys.stderr.write(u'ERROR {0}: {1}\n'.format(infile, error))
+        elif vert:
+            sys.stdout.write(vert)
 
 if __name__ == '__main__':
     main()
@@ -129,12 +129,16 @@ right side.
 """
 
 
+import os
 import sys
 import re
+import json
+import time
 import argparse
+import concurrent.futures
 from funcparserlib.lexer import LexerError
 from funcparserlib.parser import NoParseError
-from collections import namedtuple
+from collections import namedtuple, defaultdict
 from itertools import islice, zip_longest
 import unicodedata as u
 
@@ -153,24 +157,269 @@ class ReplaceRule(namedtuple('ReplaceRule', 'inlist outlist')):
     def symmetric(self):
         return len(self.inlist) == len(self.outlist)
 
+    @property
+    def deep(self):
+        """one-to-one gloss rule applied to morphemes at any depth
+        (see StreamEditor.make_replace_func)"""
+        return (self.symmetric and self.winsize == 1 and self.inlist[0].type == 'w'
+                and not (self.inlist[0].gloss.morphemes and self.outlist[0].gloss.morphemes))
+
+    @property
+    def tokentypes(self):
+        """types of tokens the rule may match or produce (None if any)"""
+        if not self.inlist:
+            return None
+        return set(token.type for token in self.inlist + self.outlist)
+
+
+def pattern_anchor(pattern):
+    """a (feature, value) pair any token matching the pattern must have
+
+    Returns None for patterns without a literal feature to index by.
+    """
+    if isinstance(pattern, daba.formats.WordToken):
+        gloss = pattern.gloss
+        if gloss.form and isinstance(gloss.form, str):
+            return ('form', gloss.form)
+        if gloss.gloss and isinstance(gloss.gloss, str):
+            return ('gloss', gloss.gloss)
+        # NB: WordToken.matches compares ps strictly
+        return ('ps', tuple(gloss.ps))
+    elif pattern.type != 'w':
+        return ('type', pattern.type)
+    return None
+
+
+def pattern_features(pattern):
+    """all literal features a token matching the pattern must have (or None)"""
+    anchor = pattern_anchor(pattern)
+    if anchor is None or anchor[0] == 'type':
+        return anchor and [anchor]
+    gloss = pattern.gloss
+    return [feature for feature in gloss_features(gloss)
+            if feature[0] == 'ps' or (feature[1] and isinstance(feature[1], str))]
+
+
+def gloss_features(gloss):
+    return [('form', gloss.form), ('gloss', gloss.gloss), ('ps', tuple(gloss.ps))]
+
+
+def iter_glosses(gloss):
+    """gloss and all its morphemes at any depth"""
+    yield gloss
+    if gloss is not None:
+        for morph in gloss.morphemes or ():
+            for g in iter_glosses(morph):
+                yield g
+
+
+def deep_stable(token):
+    """check if a deep replacement rule that does not match anywhere in the
+    token is guaranteed to leave it unchanged (see make_replace_func)"""
+    return (len(token.glosslist) == 1 and token.glosslist[0] == token.gloss
+            and all(g is not None and (g.form or g.ps or g.gloss)
+                    for g in iter_glosses(token.gloss)))
+
+
+def script_requirements(rules):
+    """features a file should have for any of the rules to apply
+
+    Returns a list of (deep, features) pairs, one per rule, or None if
+    some rule may apply to any file.
+    """
+    requirements = []
+    for rule in rules:
+        if not rule.inlist:
+            return None
+        features = set()
+        for token in rule.inlist:
+            tokenfeatures = pattern_features(token)
+            if tokenfeatures is None:
+                return None
+            features.update(tokenfeatures)
+        requirements.append((rule.deep, features))
+    return requirements
+
+
+def stream_features(stream):
+    """collect features of all tokens in a stream for FeatureIndex"""
+    top = set()
+    deep = set()
+    unstable = False
+    for token in stream:
+        if token.type == 'w':
+            if token.gloss is None or not deep_stable(token):
+                unstable = True
+            if token.gloss is not None:
+                top.update(gloss_features(token.gloss))
+                for gloss in iter_glosses(token.gloss):
+                    if gloss is not None:
+                        deep.update(gloss_features(gloss))
+        else:
+            top.add(('type', token.type))
+    return {'top': sorted(top, key=repr), 'deep': sorted(deep, key=repr), 'unstable': unstable}
+
+
+def feature_key(feature):
+    """restore hashable feature from JSON"""
+    name, value = feature
+    if isinstance(value, list):
+        value = tuple(value)
+    return (name, value)
+
+
+class FeatureIndex(object):
+    """per-file index of forms, glosses, ps tags and token types
+
+    Index entries are kept in a JSON file and rebuilt for the files
+    changed since the last run (by modification time and size).
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        self._sets = {}
+        if os.path.exists(filename):
+            with open(filename, encoding='utf-8') as indexfile:
+                self.entries = json.load(indexfile)
+
+    def stamp(self, path):
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size]
+
+    def outdated(self, paths):
+        return [path for path in paths
+                if path not in self.entries or self.entries[path]['stamp'] != self.stamp(path)]
+
+    def refresh(self, paths, jobs=1):
+        """reindex new and changed files, return list of files that failed"""
+        failed = []
+        paths = self.outdated(paths)
+        if jobs == 1:
+            results = map(file_features_worker, paths)
+            self._store(results, failed)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+                self._store(pool.map(file_features_worker, paths), failed)
+        return failed
+
+    def _store(self, results, failed):
+        for path, entry in results:
+            if entry is None:
+                failed.append(path)
+                self.entries.pop(path, None)
+            else:
+                self.entries[path] = entry
+            self._sets.pop(path, None)
+
+    def save(self):
+        tmpfile = self.filename + '.tmp'
+        with open(tmpfile, 'w', encoding='utf-8') as indexfile:
+            json.dump(self.entries, indexfile, ensure_ascii=False)
+        os.replace(tmpfile, self.filename)
+
+    def features(self, path):
+        if path not in self._sets:
+            entry = self.entries[path]
+            self._sets[path] = (set(feature_key(f) for f in entry['top']),
+                                set(feature_key(f) for f in entry['deep']),
+                                entry['unstable'])
+        return self._sets[path]
+
+    def may_apply(self, path, requirements):
+        """check if any of the script rules may change a file"""
+        if requirements is None or path not in self.entries:
+            return True
+        top, deep, unstable = self.features(path)
+        for isdeep, features in requirements:
+            if isdeep:
+                if unstable or features <= deep:
+                    return True
+            elif features <= top:
+                return True
+        return False
+
+
+def file_features_worker(path):
+    try:
+        entry = stream_features(daba.formats.HtmlReader(path, compatibility_mode=False))
+    except Exception:
+        return (path, None)
+    st = os.stat(path)
+    entry['stamp'] = [st.st_mtime_ns, st.st_size]
+    return (path, entry)
+
+
+class RuleIndex(object):
+    """a group of single-token rules applied in one pass
+
+    Rules are indexed by the anchor features of their patterns, so that
+    for each token only the rules that may match it are tried, in script
+    order.
+    """
+    def __init__(self):
+        self.rules = []
+        self.funcs = []
+        self.anchors = defaultdict(list)
+        self.deep = defaultdict(list)
+        self.unanchored = []
+
+    def __len__(self):
+        return len(self.rules)
+
+    def add(self, rule, replace_func):
+        num = len(self.rules)
+        self.rules.append(rule)
+        self.funcs.append(replace_func)
+        domatch, func = replace_func
+        anchor = pattern_anchor(rule.inlist[0])
+        if anchor is None:
+            self.unanchored.append(num)
+        elif domatch:
+            self.anchors[anchor].append(num)
+        else:
+            self.deep[anchor].append(num)
+
+    def candidates(self, token, start=0):
+        """numbers of rules starting from start that may apply to a token"""
+        found = set(self.unanchored)
+        if token.type == 'w':
+            if token.gloss is None:
+                # malformed token, try all rules
+                return list(range(start, len(self.rules)))
+            for feature in gloss_features(token.gloss):
+                found.update(self.anchors.get(feature, ()))
+            if self.deep:
+                if deep_stable(token):
+                    for gloss in iter_glosses(token.gloss):
+                        for feature in gloss_features(gloss):
+                            found.update(self.deep.get(feature, ()))
+                else:
+                    for nums in self.deep.values():
+                        found.update(nums)
+        else:
+            found.update(self.anchors.get(('type', token.type), ()))
+        return sorted(num for num in found if num >= start)
+
 
 class ScriptParser(object):
     def __init__(self, scriptfile):
         self.commands_list = []
+        # (line number, source text) for each rule in commands_list
+        self.sources = []
         with open(scriptfile, encoding='utf-8') as script:
-            for command in script:
+            for lineno, command in enumerate(script, 1):
                 if not command.isspace() and not command.startswith('#'):
-                    self.commands_list.append(self.parse_command(command))
-        self.commands_list = filter(None, self.commands_list)
+                    rule = self.parse_command(command)
+                    if rule:
+                        self.commands_list.append(rule)
+                        self.sources.append((lineno, command.strip()))
 
     def __iter__(self):
         for rule in self.commands_list:
             yield rule
 
     def parse_gloss(self, gloss_string):
-        gloss = daba.grammar.fullgloss_parser().parse(
-            daba.grammar.tokenize(gloss_string)
-        )
+        gloss = daba.grammar.parse_gloss(gloss_string)
         gt = daba.formats.WordToken([gloss], stage='dabased')
         return gt
 
@@ -216,9 +465,34 @@ class ScriptParser(object):
 
 
 class StreamEditor(object):
-    def __init__(self, verbose=False):
+    def __init__(self, verbose=False, stats=False):
         self.dirty = False
+        self.changes = 0
         self.verbose = verbose
+        # id(rule) -> [attempts, replacements, time], if collecting stats
+        self.rulestats = {} if stats else None
+
+    def rule_counts(self, rule):
+        if self.rulestats is None:
+            return None
+        return self.rulestats.setdefault(id(rule), [0, 0, 0.0])
+
+    def rule_report(self, rules):
+        """[attempts, replacements, time] for each rule, in script order"""
+        return [list(self.rulestats.get(id(rule), [0, 0, 0.0])) for rule in rules]
+
+    def timed_rule(self, counts, stream):
+        """add time spent producing the stream to rule counts"""
+        it = iter(stream)
+        while True:
+            start = time.perf_counter()
+            try:
+                token = next(it)
+            except StopIteration:
+                counts[2] += time.perf_counter() - start
+                return
+            counts[2] += time.perf_counter() - start
+            yield token
 
     def getstr(self, tokens):
         return u' ++ '.join([str(token) for token in tokens])
@@ -305,13 +579,45 @@ class StreamEditor(object):
                 domatch = True
         return (domatch, replace_func)
 
+    def replaced(self, tokens, replacement):
+        """check if replacement differs from source tokens, log changes"""
+        if not all(g == r for g, r
+                   in zip_longest(
+                       tokens,
+                       replacement,
+                       fillvalue=daba.formats.PlainToken())):
+            self.dirty = True
+            self.changes += 1
+            if self.verbose:
+                sys.stderr.write(
+                    u'{0} -> {1}\n'.format(
+                        self.getstr(tokens),
+                        self.getstr(replacement))
+                    )
+            return True
+        return False
+
     def apply_rule(self, rule, stream):
+        """apply a rule to a list of tokens, return an iterator"""
+        counts = self.rule_counts(rule)
+        if counts is None:
+            return self._apply_rule(rule, stream, counts)
+        return self.timed_rule(counts, self._apply_rule(rule, stream, counts))
+
+    def _apply_rule(self, rule, stream, counts=None):
+        if len(stream) < rule.winsize:
+            # no window to match (e.g. a short sentence)
+            for token in stream:
+                yield token
+            return
         domatch, replace_func = self.make_replace_func(rule)
         # sys.stderr.write(u'Domatch {}\n'.format(str(domatch)))
         success = -rule.winsize
         for pos, tokens in self.feed_tokens(rule.winsize, stream):
             if pos < success + rule.winsize:
                 continue
+            if counts:
+                counts[0] += 1
             if (
                     (not domatch and tokens[0].type == 'w')
                     or
@@ -324,57 +630,300 @@ class StreamEditor(object):
                 # sys.stderr.write(
                 #     u'replacement: {}\n'.format(self.getstr(replacement))
                 # )
-                if not all(g == r for g, r
-                           in zip_longest(
-                               tokens,
-                               replacement,
-                               fillvalue=daba.formats.PlainToken())):
-                    self.dirty = True
-                    if self.verbose:
-                        sys.stderr.write(
-                            u'{0} -> {1}\n'.format(
-                                self.getstr(tokens),
-                                self.getstr(replacement))
-                            )
-                    tokens = replacement
+                if self.replaced(tokens, replacement):
+                    if counts:
+                        counts[1] += 1
                     success = pos
-                    for token in tokens:
+                    for token in replacement:
                         yield token
                     continue
             yield tokens[0]
         else:
-            for token in tokens[1:]:
+            # rest of the last window, except tokens already replaced
+            for token in tokens[max(1, success + rule.winsize - pos):]:
                 yield token
 
+    def apply_token(self, index, token, start=0):
+        """apply rules from the index to a token in script order"""
+        for num in index.candidates(token, start):
+            rule = index.rules[num]
+            domatch, replace_func = index.funcs[num]
+            counts = self.rule_counts(rule)
+            if counts:
+                counts[0] += 1
+                started = time.perf_counter()
+            replacement = None
+            if (
+                    (not domatch and token.type == 'w')
+                    or
+                    (domatch and self.match((token,), rule.inlist))
+            ):
+                replacement = replace_func((token,), rule)
+                if not self.replaced((token,), replacement):
+                    replacement = None
+            if counts:
+                counts[2] += time.perf_counter() - started
+                if replacement is not None:
+                    counts[1] += 1
+            if replacement is not None:
+                out = []
+                for newtoken in replacement:
+                    out.extend(self.apply_token(index, newtoken, num+1))
+                return out
+        return [token]
+
+    def apply_index(self, index, stream):
+        for token in stream:
+            for outtoken in self.apply_token(index, token):
+                yield outtoken
+
+    def compile_script(self, script):
+        """group rules into passes giving the same result as applying
+        the rules one by one
+
+        Single-token rules only depend on the token itself, so any run of
+        them is applied in one pass (RuleIndex). Multi-token rules see
+        the neighbouring tokens and get a pass of their own. A one-to-one
+        single-token rule is moved to an earlier pass over the multi-token
+        rules that never match or produce tokens of the same types.
+        """
+        passes = []
+        for rule in script:
+            if rule.winsize != 1:
+                passes.append(rule)
+                continue
+            pos = len(passes)
+            if rule.symmetric:
+                types = rule.tokentypes
+                while pos and not isinstance(passes[pos-1], RuleIndex):
+                    steptypes = passes[pos-1].tokentypes
+                    if steptypes is None or steptypes & types:
+                        break
+                    pos -= 1
+            if pos and isinstance(passes[pos-1], RuleIndex):
+                target = passes[pos-1]
+            else:
+                target = RuleIndex()
+                passes.insert(pos, target)
+            target.add(rule, self.make_replace_func(rule))
+        return passes
+
     def apply_script(self, script, stream):
+        return self.apply_passes(self.compile_script(script), stream)
+
+    def apply_passes(self, passes, stream):
+        """apply script compiled with compile_script"""
         tokens = stream
-        for rule in script:
-            tokens = self.apply_rule(rule, list(tokens))
+        for step in passes:
+            if isinstance(step, RuleIndex):
+                tokens = self.apply_index(step, list(tokens))
+            else:
+                tokens = self.apply_rule(step, list(tokens))
         return tokens
 
 
+def process_file(sed, passes, infile, outfile=None, dryrun=False):
+    """apply compiled script to a file, write it only if anything changed
+
+    Returns number of replacements made.
+    """
+    sed.dirty = False
+    sed.changes = 0
+    if sed.rulestats is not None:
+        sed.rulestats = {}
+    in_handler = daba.formats.HtmlReader(infile, compatibility_mode=False)
+    processed_tokens = list(sed.apply_passes(passes, in_handler))
+    if sed.dirty and not dryrun:
+        out_handler = daba.formats.HtmlWriter((in_handler.metadata, in_handler.make_compatible_glosses(processed_tokens)), outfile or infile)
+        out_handler.write()
+    return sed.changes
+
+
+# Pool workers: the script is parsed once in the main process, and
+# compiled once in each worker.
+_worker = {}
+
+
+def init_worker(rules, verbose=False, dryrun=False, stats=False):
+    sed = StreamEditor(verbose=verbose, stats=stats)
+    _worker['sed'] = sed
+    _worker['rules'] = rules
+    _worker['passes'] = sed.compile_script(rules)
+    _worker['dryrun'] = dryrun
+
+
+def process_file_worker(infile):
+    """process file in a pool worker
+
+    Returns (infile, changes, error, rulestats), rulestats is a list of
+    [attempts, replacements, time] for each rule or None.
+    """
+    sed = _worker['sed']
+    try:
+        changes = process_file(sed, _worker['passes'], infile, dryrun=_worker['dryrun'])
+    except Exception as e:
+        return (infile, 0, u'{0}: {1}'.format(e.__class__.__name__, e), None)
+    rulestats = None
+    if sed.rulestats is not None:
+        rulestats = sed.rule_report(_worker['rules'])
+    return (infile, changes, None, rulestats)
+
+
+def process_list(filenames, rules, jobs=1, verbose=False, dryrun=False, stats=False):
+    """process files in a pool of workers, yield results in the input order"""
+    initargs = (rules, verbose, dryrun, stats)
+    if jobs == 1:
+        init_worker(*initargs)
+        for infile in filenames:
+            yield process_file_worker(infile)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                 initargs=initargs) as pool:
+            for result in pool.map(process_file_worker, filenames):
+                yield result
+
+
+class ScriptReport(object):
+    """per-rule and per-file statistics of a dabased run"""
+    def __init__(self, sources):
+        self.rules = [{'line': lineno, 'rule': text, 'attempts': 0,
+                       'replacements': 0, 'time': 0.0, 'files': 0}
+                      for lineno, text in sources]
+        self.files = []
+
+    def add_file(self, infile, changes, status, rulestats=None):
+        self.files.append({'file': infile, 'changes': changes, 'status': status})
+        for entry, (attempts, replacements, elapsed) in zip(self.rules, rulestats or ()):
+            entry['attempts'] += attempts
+            entry['replacements'] += replacements
+            entry['time'] += elapsed
+            if replacements:
+                entry['files'] += 1
+
+    def dump(self, filename):
+        report = {
+            'rules': self.rules,
+            'dead': [entry['line'] for entry in self.rules if not entry['replacements']],
+            'files': self.files,
+            }
+        with open(filename, 'w', encoding='utf-8') as out:
+            json.dump(report, out, ensure_ascii=False, indent=1)
+
+    def write_table(self, stream):
+        """print rules table, most expensive rules first"""
+        stream.write(u'line\tattempts\treplacements\tfiles\ttime\trule\n')
+        for entry in sorted(self.rules, key=lambda e: -e['time']):
+            stream.write(u'{line}\t{attempts}\t{replacements}\t{files}\t{time:.4f}\t{rule}\n'.format(**entry))
+
+
 def main():
 
     aparser = argparse.ArgumentParser(description='Stream editor for files in Daba format')
-    aparser.add_argument('infile', help='Input file (.html)')
+    aparser.add_argument('infile', nargs='?', help='Input file (.html)')
     aparser.add_argument('-o', '--outfile', help='Output file', default=None)
     aparser.add_argument('-s', '--script', help='File with edit commands', required=True)
+    aparser.add_argument('-l', '--list', help='Read input filenames list from file (files are edited in place)', default=None)
+    aparser.add_argument('-j', '--jobs', help='Number of files to process in parallel (with --list)', type=int, default=1)
+    aparser.add_argument('-i', '--index', help='Feature index file used to skip files the rules cannot apply to (with --list, created and updated as needed)', default=None)
+    aparser.add_argument('-n', '--dry-run', help='Do not write any files', action='store_true')
+    aparser.add_argument('-r', '--report', help='Write per-rule statistics (attempts, replacements, time) and per-file changes into a JSON file', default=None)
     aparser.add_argument('-v', '--verbose', help='Print info messages', action='store_true')
     args = aparser.parse_args()
+    if not args.infile and not args.list:
+        aparser.error('either infile or --list is required')
+    script = ScriptParser(args.script)
+    report = ScriptReport(script.sources) if args.report else None
+    written = u'would be written' if args.dry_run else u'written'
+    if args.list:
+        with open(args.list, encoding='utf-8') as filelist:
+            filenames = [os.path.normpath(line.strip()) for line in filelist if line.strip()]
+        selected = filenames
+        if args.index:
+            index = FeatureIndex(args.index)
+            index.refresh(filenames, jobs=args.jobs)
+            requirements = script_requirements(script.commands_list)
+            selected = [f for f in filenames if index.may_apply(f, requirements)]
+            if args.verbose:
+                sys.stderr.write(u'Skipping {0} of {1} files\n'.format(len(filenames) - len(selected), len(filenames)))
+        results = dict((f, (0, u'skipped')) for f in filenames)
+        total = 0
+        changed = []
+        for infile, changes, error, rulestats in process_list(
+                selected, script.commands_list, jobs=args.jobs, verbose=args.verbose,
+                dryrun=args.dry_run, stats=bool(report)):
+            if error:
+                status = u'ERROR {0}'.format(error)
+            elif changes:
+                status = written
+                changed.append(infile)
+            else:
+                status = u'unchanged'
+            total += changes
+            results[infile] = (changes, status, rulestats)
+        for infile in filenames:
+            changes, status = results[infile][:2]
+            print(u'{0}\t{1}\t{2}'.format(infile, changes, status))
+            if report:
+                report.add_file(infile, *results[infile])
+        print(u'TOTAL\t{0}\t{1} of {2} files {3}'.format(total, len(changed), len(filenames), written))
+        if args.index:
+            if not args.dry_run:
+                index.refresh(changed, jobs=args.jobs)
+            index.save()
+        if report:
+            report.dump(args.report)
+            if args.verbose:
+                report.write_table(sys.stderr)
+        return
     if not args.outfile:
         args.outfile = args.infile
     # start processing
     if args.verbose:
         sys.stderr.write(u'Processing {0} with rules from {1}...\n'.format(args.infile, args.script))
-    sed = StreamEditor(verbose=args.verbose)
-    script = ScriptParser(args.script)
-    in_handler = daba.formats.HtmlReader(args.infile, compatibility_mode=False)
-    processed_tokens = list(sed.apply_script(script, in_handler))
-    if sed.dirty:
-        out_handler = daba.formats.HtmlWriter((in_handler.metadata, in_handler.make_compatible_glosses(processed_tokens)), args.outfile)
-        out_handler.write()
+    sed = StreamEditor(verbose=args.verbose, stats=bool(report))
+    changes = process_file(sed, sed.compile_script(script), args.infile, args.outfile, dryrun=args.dry_run)
+    if changes and args.verbose and not args.dry_run:
+        sys.stderr.write(u'Written {0}\n'.format(args.outfile))
+    if report:
+        report.add_file(args.infile, changes, written if changes else u'unchanged',
+                        sed.rule_report(script.commands_list))
+        report.dump(args.report)
         if args.verbose:
-            sys.stderr.write(u'Written {0}\n'.format(args.outfile))
+            report.write_table(sys.stderr)
+
+
+import unittest
+import tempfile
+
+
+class TestStreamEditor(unittest.TestCase):
+
+    def setUp(self):
+        from daba.ntgloss import Gloss
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as script:
+            script.write(u'i:pers: ++ taa:v: >> i:pers:1SG ++ taa:v:go\n')
+        self.addCleanup(os.remove, script.name)
+        self.script = list(ScriptParser(script.name))
+        self.i = daba.formats.WordToken([Gloss(u'i', ('pers',), u'', ())], u'i')
+        self.taa = daba.formats.WordToken([Gloss(u'taa', ('v',), u'', ())], u'taa')
+        self.done = self.script[0].outlist
+
+    def apply(self, stream):
+        return list(StreamEditor().apply_script(self.script, stream))
+
+    def test_empty_sentence(self):
+        self.assertEqual(self.apply([]), [])
+
+    def test_short_sentence(self):
+        self.assertEqual(self.apply([self.taa]), [self.taa])
+
+    def test_window_sentence(self):
+        self.assertEqual(self.apply([self.i, self.taa]), self.done)
+        self.assertEqual(self.apply([self.taa, self.i]), [self.taa, self.i])
+
+    def test_boundary_tokens(self):
+        s = daba.formats.PlainToken(('<s>', u''))
+        self.assertEqual(self.apply([s, self.i, self.taa]), [s] + self.done)
 
 
 if __name__ == '__main__':
@@ -22,14 +22,16 @@ import sys
 import codecs
 import time
 import os
+import pickle
+import hashlib
 import argparse
 import daba.formats
 import daba.grammar
 import collections
 from daba.ntgloss import Gloss
 from nltk.tag.crf import CRFTagger
-from gdisamb import FileParser
-from differential_tone_coding import encoder_tones, repr, token_seperator, _get_features_customised_for_tones, code_dispatcher, code_resort, mode_indicators
+from daba.gdisamb import FileParser
+from daba.differential_tone_coding import encoder_tones, repr, token_seperator, _get_features_customised_for_tones, code_dispatcher, code_resort, mode_indicators
 import unicodedata
 import pycrfsuite
 import csv
@@ -37,10 +39,12 @@ import nltk.tag.util
 import itertools
 from nltk.metrics.scores import accuracy
 import zipfile
-from orthography import detone
-
-sys.stdin = codecs.getreader('utf8')(sys.stdin)
-sys.stdout = codecs.getwriter('utf8')(sys.stdout)
+import json
+import threading
+import socket
+import socketserver
+from concurrent.futures import ProcessPoolExecutor
+from daba.orthography import detone
 
 
 def unzip(input):
@@ -102,6 +106,267 @@ def sampling(allsents, p, ratio = 1):
             eval_set.append(sent)
     return [train_set, eval_set]
 
+def sample_stream(sents, p):
+    """streaming version of sampling: yield (is_train, sent) for each sent"""
+    ntrain, neval = 0, 0
+    for sent in sents:
+        p_approx = float(ntrain + 1) / float(ntrain + neval + 1)
+        if p_approx <= p :
+            ntrain += 1
+            yield True, sent
+        else:
+            neval += 1
+            yield False, sent
+
+
+def file_sentences(html_parser, pos, enc):
+    """yield training sentences (lists of (token, tag)) found in a parsed file"""
+    sent = []
+    for snum, sentence in enumerate(html_parser.glosses):
+        for tnum, token in enumerate(sentence[2]):
+            if token.type == 'w' or token.type == 'c':
+                tags = ''
+                if pos:
+                    tags = '/'.join(token.gloss.ps)
+                    wordform = detone(token.gloss.form)
+                    sent.append((wordform, tags))
+                elif enc:
+                    # Pourquoi ne pas apprendre la forme tonale contenant une barre veticale ?
+                    # Parce que dans l'ensemble des corpus désambiguïsés, son occurrence est
+                    # au dessous de 10, ce cas de figure semble trop peu fréquent pour apporter
+                    # une réélle amélioration dans la modélisation de tonalisation. Néanmoins,
+                    # dans la conception du cadre logiciel, rien n'interdit de l'inclure dans
+                    # les données d'entraînement et d'en observer le apport
+                    if '|' not in token.gloss.form :
+                        [codes, chunks] = enc.differential_encode(token.token, token.gloss.form)
+                        for chunk, code in zip(chunks, codes) :
+                            try : sent.append((chunk, code))
+                            except LookupError: pass
+
+        if len(sent) > 1:
+            yield sent
+            sent = []
+
+
+# Feature extraction workers: each process reads files and computes CRF
+# features for their sentences, results are cached by file content.
+_worker = {}
+
+
+def init_worker(root, pos, tone, cachedir=None, enc=None):
+    if tone and enc is None:
+        enc = encoder_tones()
+    _worker['root'] = root
+    _worker['pos'] = pos
+    _worker['enc'] = enc if tone else None
+    _worker['cachedir'] = cachedir
+
+
+def extract_file_worker(infile):
+    """return list of (tokens, labels, features) for training sentences in infile"""
+    path = os.path.join(_worker['root'], infile)
+    cachefile = None
+    if _worker['cachedir']:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        mode = 'pos' if _worker['pos'] else 'tone'
+        cachefile = os.path.join(_worker['cachedir'], '{0}.{1}.features'.format(digest, mode))
+        try:
+            with open(cachefile, 'rb') as cache:
+                return pickle.load(cache)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            pass
+
+    html_parser = FileParser()
+    html_parser.read_file(path)
+    result = []
+    for sent in file_sentences(html_parser, _worker['pos'], _worker['enc']):
+        tokens, labels = unzip(sent)
+        features = [_get_features_customised_for_tones(tokens, i) for i in range(len(tokens))]
+        result.append((tokens, labels, features))
+
+    if cachefile:
+        tmpfile = '{0}.{1}'.format(cachefile, os.getpid())
+        with open(tmpfile, 'wb') as cache:
+            pickle.dump(result, cache, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpfile, cachefile)
+    return result
+
+
+def extract_features(allfiles, root, pos, tone, cachedir=None, jobs=1, enc=None):
+    """yield (tokens, labels, features) for all training sentences in allfiles, in order
+
+    With jobs > 1 files are processed in a pool, a few files at a time,
+    so that only features for the files in flight are held in memory.
+    """
+    if cachedir and not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+    initargs = (root, pos, tone, cachedir)
+    if jobs == 1:
+        init_worker(*initargs, enc=enc)
+        for infile in allfiles:
+            print('-', infile)
+            yield from extract_file_worker(infile)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=initargs) as pool:
+            for start in range(0, len(allfiles), jobs * 2):
+                batch = allfiles[start:start + jobs * 2]
+                for infile, sents in zip(batch, pool.map(extract_file_worker, batch)):
+                    print('-', infile)
+                    yield from sents
+
+
+def sentence_marginals(tagger, tokens, options):
+    """return marginal probabilities of tags in options for each token
+
+    options is a list of lists of candidate tags, one list per token.
+    """
+    features = [_get_features_customised_for_tones(tokens, i) for i in range(len(tokens))]
+    tagger._tagger.set(features)
+    return [[tagger._tagger.marginal(tag, tnum) for tag in tags]
+            for tnum, tags in enumerate(options)]
+
+
+def option_tag(option):
+    try:
+        return option.ps[0]
+    except IndexError:
+        return ''
+
+
+def rank_options(tagger, sentannot, select=False):
+    """yield (token number, glosslist ordered by probability) for each word
+    token in sentannot (only the most likely glosses if select)"""
+    tokens = [token.token for token in sentannot]
+    options = []
+    for token in sentannot:
+        if token.value and len(token.value) > 2:
+            options.append([option_tag(option) for option in token.value[2]])
+        else:
+            options.append([])
+    marginals = sentence_marginals(tagger, tokens, options)
+    for tnum, token in enumerate(sentannot):
+        if token.value and len(token.value) > 2:
+            options = list(zip(marginals[tnum], token.value[2]))
+            reordered_probs, reordered_options = unzip(sorted(options, reverse = True))
+            if select:
+                prob_max = reordered_probs[0]
+                reordered_options = tuple([
+                    reordered_options[i]
+                    for i, p in enumerate(reordered_probs)
+                    if p >= prob_max])
+            yield tnum, reordered_options
+
+
+def disambiguate_sentences(tagger, html_parser, select=False):
+    """reorder glosslists in html_parser by probability (keep only the most likely if select)"""
+    for snum, sentence in enumerate(html_parser.glosses):
+        for tnum, reordered_options in rank_options(tagger, sentence[2], select):
+            html_parser.glosses[snum][1][tnum] = reordered_options
+
+
+def disambiguate_tokens(tagger, sentannot, select=False):
+    """reorder glosslists of word tokens in a parsed sentence, in place"""
+    for tnum, reordered_options in rank_options(tagger, sentannot, select):
+        sentannot[tnum].setGlosslist(list(reordered_options))
+
+
+def load_tagger(model):
+    tagger = CRFTagger()
+    tagger.set_model_file(model)
+    return tagger
+
+
+def disambiguated_name(infile):
+    """output filename for infile in batch mode: name.pars.html -> name.dis.html"""
+    if infile.endswith('.pars.html'):
+        return infile[:-len('.pars.html')] + '.dis.html'
+    return os.path.splitext(infile)[0] + '.dis.html'
+
+
+# Disambiguation workers: the model is loaded once per process.
+def init_disambiguate_worker(model, select):
+    _worker['tagger'] = load_tagger(model)
+    _worker['select'] = select
+
+
+def disambiguate_file_worker(infile, outfile):
+    """disambiguate infile into outfile, return (infile, error message or None)"""
+    try:
+        html_parser = FileParser()
+        html_parser.read_file(infile)
+        disambiguate_sentences(_worker['tagger'], html_parser, _worker['select'])
+        html_parser.write(outfile)
+    except Exception as e:
+        return infile, '{0}: {1}'.format(type(e).__name__, e)
+    return infile, None
+
+
+def disambiguate_list(model, filelist, select=False, jobs=1):
+    """disambiguate (infile, outfile) pairs, yield (infile, error) as files are done"""
+    if jobs == 1:
+        init_disambiguate_worker(model, select)
+        for infile, outfile in filelist:
+            yield disambiguate_file_worker(infile, outfile)
+    else:
+        infiles, outfiles = unzip(filelist) or ([], [])
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_disambiguate_worker,
+                                 initargs=(model, select)) as pool:
+            for result in pool.map(disambiguate_file_worker, infiles, outfiles):
+                yield result
+
+
+class MarginalsHandler(socketserver.StreamRequestHandler):
+    """Answer marginals requests, one JSON object per line
+
+    Request: {"tokens": [token, ...], "options": [[tag, ...], ...]}
+    Response: {"marginals": [[prob, ...], ...]} or {"error": message}
+    """
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+                with self.server.lock:
+                    marginals = sentence_marginals(self.server.tagger, request['tokens'], request['options'])
+                response = {'marginals': marginals}
+            except Exception as e:
+                response = {'error': '{0}: {1}'.format(type(e).__name__, e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class MarginalsServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Daemon keeping a CRF model loaded and serving marginals for sentences"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, model, address=('localhost', 8765)):
+        socketserver.TCPServer.__init__(self, address, MarginalsHandler)
+        self.tagger = load_tagger(model)
+        self.lock = threading.Lock()
+
+
+class MarginalsClient(object):
+    """Client for MarginalsServer keeping a persistent connection"""
+    def __init__(self, address=('localhost', 8765)):
+        self.sock = socket.create_connection(address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile('rb')
+
+    def marginals(self, tokens, options):
+        """return marginal probabilities of candidate tags for each token of a sentence"""
+        request = json.dumps({'tokens': tokens, 'options': options})
+        self.sock.sendall(request.encode('utf-8') + b'\n')
+        response = json.loads(self.rfile.readline().decode('utf-8'))
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response['marginals']
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
 def get_duration(t1_secs, t2_secs):
     secs = abs(t1_secs - t2_secs)
     days = secs // 86400
@@ -118,7 +383,7 @@ def main():
     aparser.add_argument('-p', '--pos', help='Prediction for POS', default=False, action='store_true')
     aparser.add_argument('-t', '--tone', help='Prediction for tones', default=False, action='store_true')
     aparser.add_argument('-r', '--root', help='Corpus root dir')
-    aparser.add_argument('-f', '--filelist', help='Path to a list of files to learn from')
+    aparser.add_argument('-f', '--filelist', help='Path to a list of files to learn from (or to disambiguate with -d, writing name.dis.html for each)')
     # aparser.add_argument('-g', '--gloss', help='Prediction for gloses', default=False, action='store_true')
     aparser.add_argument('-e', '--evalsize', type=int, default=10,
                          help='Percent of training data with respect to training and test one (default 10)')
@@ -127,6 +392,9 @@ def main():
     aparser.add_argument('-i', '--infile' , help='Input file (.html)' , default=sys.stdin)
     aparser.add_argument('-o', '--outfile', help='Output file (.html)', default=sys.stdout)
     aparser.add_argument('-s', '--store', help='Store tagged raw data in file (.csv) for further research purpose', default=None)
+    aparser.add_argument('-j', '--jobs', type=int, default=1, help='Number of processes to extract features (with -l) or disambiguate files (with -d -f) with')
+    aparser.add_argument('--serve', help='With -d, keep the model loaded and serve marginals for sentences on [HOST:]PORT', default=None)
+    aparser.add_argument('-c', '--cache', help='Directory to cache extracted features per file (for -l)', default=None)
 
     args = aparser.parse_args()
     if args.verbose:
@@ -142,12 +410,13 @@ def main():
         allfiles = []
         with codecs.open(args.filelist, 'r', encoding="utf-8") as filelist:
             for line in filelist:
-                allfiles.append(line.strip())
-        allsents = []
+                if line.strip():
+                    allfiles.append(line.strip())
 
         # pour le débogage
         # allfiles = '../corbama/sisoko-daa_ka_kore.dis.html'
 
+        enc = None
         if args.tone:
             try:
                 enc = encoder_tones()
@@ -155,89 +424,60 @@ def main():
                 enc = None
                 print(("Error : unable to initialize the tone encoder !"))
 
-        print('Open files and find features / supervision tags')
-        for infile in allfiles:
-            if(infile):
-                print('-', infile)
-                sent = []
-
-                html_parser = FileParser()
-                html_parser.read_file(os.path.join(args.root, infile))
-
-                for snum, sentence in enumerate(html_parser.glosses):
-                    for tnum, token in enumerate(sentence[2]):
-                        tag = ''
-                        if token.type == 'w' or token.type == 'c':
-                            tags = ''
-                            if args.pos:
-                                tags = '/'.join(token.gloss.ps)
-                                wordform = detone(token.gloss.form)
-                                sent.append((wordform, tags))
-                            elif args.tone:
-                                # Pourquoi ne pas apprendre la forme tonale contenant une barre veticale ?
-                                # Parce que dans l'ensemble des corpus désambiguïsés, son occurrence est
-                                # au dessous de 10, ce cas de figure semble trop peu fréquent pour apporter
-                                # une réélle amélioration dans la modélisation de tonalisation. Néanmoins,
-                                # dans la conception du cadre logiciel, rien n'interdit de l'inclure dans
-                                # les données d'entraînement et d'en observer le apport
-                                if '|' not in token.gloss.form :
-                                    [codes, chunks] = enc.differential_encode(token.token, token.gloss.form)
-                                    for chunk, code in zip(chunks, codes) :
-                                        try : sent.append((chunk, code))
-                                        except LookupError: pass
-                            """
-                            elif args.gloss:
-                                tags += token.gloss.gloss
-                                sent.append((token.token, tags))
-                            """
-
-                    if len(sent) > 1:
-                        allsents.append(sent)
-                        sent = []
-
-        if args.verbose and args.tone:
-            enc.report()
-
-        # Constitution des ensmebles d'entraînement de d'évaluation
-        p = (1 - args.evalsize / 100.0)
-        train_set, eval_set = sampling(allsents, p)
-        print('Split the data in train (', len(train_set),' sentences) / test (', len(eval_set),' sentences)')
-
         print('Building classifier (CRF/NLTK)')
         # Initialization
         t1 = time.time()
         if args.tone:
             num_phases = len([False, True]) * len(mode_indicators)
-            myzip = zipfile.ZipFile(args.learn + '.zip', 'w')
         else:
             num_phases = 1
 
-        # Training
+        trainers = []
         for phase in range(num_phases):
             tagger = CRFTagger(verbose = args.verbose, training_opt = {'feature.minfreq' : 10})
             trainer = pycrfsuite.Trainer(verbose = tagger._verbose)
             trainer.set_params(tagger._training_options)
+            trainers.append(trainer)
+
+        # Sentences are streamed from feature extraction into the trainers,
+        # only the evaluation set is kept in memory
+        print('Open files and find features / supervision tags')
+        p = (1 - args.evalsize / 100.0)
+        eval_set, eval_features = [], []
+        ntrain = 0
+        sents = extract_features(allfiles, args.root, args.pos, args.tone,
+                                 cachedir=args.cache, jobs=args.jobs, enc=enc)
+        for is_train, (tokens, labels, features) in sample_stream(sents, p):
+            if is_train:
+                ntrain += 1
+                for phase, trainer in enumerate(trainers):
+                    if num_phases > 1:
+                        trainer.append(features, [code_dispatcher(label)[phase] for label in labels])
+                    else:
+                        trainer.append(features, labels)
+            else:
+                eval_set.append(list(zip(tokens, labels)))
+                eval_features.append(features)
+        print('Split the data in train (', ntrain,' sentences) / test (', len(eval_set),' sentences)')
+
+        if args.verbose and args.tone and args.jobs == 1:
+            enc.report()
+
+        # Training
+        if num_phases > 1:
+            myzip = zipfile.ZipFile(args.learn + '.zip', 'w')
+        for phase, trainer in enumerate(trainers):
             if num_phases > 1:
                 model_name = args.learn + '.' + str(phase)
             else:
                 model_name = args.learn
-
-            # train_set : list(list((str,list(str))))
-            for sent in train_set:
-                tokens = unzip(sent)[0]
-                labels = unzip(sent)[1]
-                if num_phases > 1:
-                    for lab in labels:
-                        pass
-                    labels = [code_dispatcher(label)[phase] for label in labels]
-                features = [_get_features_customised_for_tones(tokens, i) for i in range(len(tokens))]
-                trainer.append(features, labels)
             trainer.train(model = model_name)
             if num_phases > 1:
                 myzip.write(model_name)
                 os.remove(model_name)
         if num_phases > 1:
             myzip.close()
+        del trainers
 
         print("... done in", get_duration(t1_secs=t1, t2_secs=time.time()))
 
@@ -252,8 +492,6 @@ def main():
             myzip = zipfile.ZipFile(args.learn + '.zip', 'r')
         for phase in range(num_phases):
             tagger = CRFTagger(verbose=args.verbose, training_opt={'feature.minfreq' : 10})
-            trainer = pycrfsuite.Trainer(verbose=tagger._verbose)
-            trainer.set_params(tagger._training_options)
             if num_phases > 1:
                 model_name = args.learn + '.' + str(phase)
                 myzip.extract(model_name)
@@ -261,8 +499,7 @@ def main():
                 model_name = args.learn
             tagger.set_model_file(model_name)
             for i, sent in enumerate(input_set):
-                features = [_get_features_customised_for_tones(sent,j) for j in range(len(sent))]
-                labels = tagger._tagger.tag(features)
+                labels = tagger._tagger.tag(eval_features[i])
                 if num_phases > 1:
                     labels = [code_dispatcher(label)[phase] for label in labels]
                 tagged_sent = list(zip(sent, labels))
@@ -274,7 +511,8 @@ def main():
                     predicted_set[i] = list(zip(sent_acc, labels_acc))
             if num_phases > 1:
                 os.remove(model_name)
-                myzip.close()
+        if num_phases > 1:
+            myzip.close()
 
         # gold_tokens, predicted_tokens : list((str,str))
         predicted_tokens = list(itertools.chain(*predicted_set))
@@ -300,6 +538,31 @@ def main():
         if args.verbose and args.store:
             print(("Tagged result is exported in {}".format(args.store)))
 
+    elif args.disambiguate and args.serve:
+        host, _, port = args.serve.rpartition(':')
+        server = MarginalsServer(args.disambiguate, (host or 'localhost', int(port)))
+        print('Serving marginals on {0}:{1}'.format(*server.server_address))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+
+    elif args.disambiguate and args.filelist:
+        filelist = []
+        with codecs.open(args.filelist, 'r', encoding="utf-8") as files:
+            for line in files:
+                if line.strip():
+                    infile = os.path.join(args.root or '', line.strip())
+                    filelist.append((infile, disambiguated_name(infile)))
+        failed = 0
+        for infile, error in disambiguate_list(args.disambiguate, filelist, args.select, args.jobs):
+            if error:
+                failed += 1
+                print("Error : unable to disambiguate {0} ({1})".format(infile, error))
+            elif args.verbose:
+                print('-', infile)
+        exit(1 if failed else 0)
+
     elif args.disambiguate and args.infile and args.outfile:
         # Lecture de texte en .HTML
         html_parser = FileParser()
@@ -318,28 +581,7 @@ def main():
                 exit(1)
 
             # Exportation du résultat de désambiguïsation en .HTML
-            for snum, sentence in enumerate(html_parser.glosses):
-                tokens = [token.token for token in sentence[2]]
-                features = [_get_features_customised_for_tones(tokens, i) for i in range(len(tokens))]
-                tagger._tagger.set(features)
-                for tnum, token in enumerate(sentence[2]):
-                    options = list()
-                    if token.value and len(token.value) > 2:
-                        for nopt, option in enumerate(token.value[2]):
-                            try:
-                                tag = option.ps[0]
-                            except IndexError:
-                                tag = ''
-                            prob = tagger._tagger.marginal(tag, tnum)
-                            options.append((prob, option))
-                        reordered_probs, reordered_options = unzip(sorted(options, reverse = True))
-                        if args.select:
-                            prob_max = reordered_probs[0]
-                            reordered_options = tuple([
-                                reordered_options[i]
-                                for i, p in enumerate(reordered_probs)
-                                if p >= prob_max])
-                        html_parser.glosses[snum][1][tnum] = reordered_options
+            disambiguate_sentences(tagger, html_parser, args.select)
 
         elif args.tone:
             pass
@@ -25,15 +25,19 @@
 # t: (start|end|tag, name)
 # comment: (text,)
 
+import gc
 import os
 import re
-import codecs
+import pickle
 import unicodedata
 import hashlib
 import xml.etree.ElementTree as e
 from pytrie import StringTrie as trie
 from collections import defaultdict, OrderedDict
 from collections.abc import MutableMapping
+import concurrent.futures
+from contextlib import contextmanager
+from itertools import repeat
 from abc import abstractmethod
 
 import daba.grammar
@@ -47,6 +51,18 @@ normalizeText = lambda t: unicodedata.normalize('NFKD', str(t))
 def ddlist():
     return defaultdict(list)
 
+
+@contextmanager
+def gc_paused():
+    """suspend garbage collector while building large structures"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
 def gloss_to_html(gloss, spanclass='lemma', variant=False):
     if variant:
         spanclass = 'lemma var'
@@ -74,8 +90,7 @@ def gloss_to_html(gloss, spanclass='lemma', variant=False):
 
 def glosstext_to_html(glosstext, variant=False, **kwargs):
     """Serialize text representation of a gloss into HTML string"""
-    toks = daba.grammar.str_tokenize(glosstext)
-    gloss = daba.grammar.stringgloss_parser().parse(toks)
+    gloss = daba.grammar.parse_gloss_string(glosstext)
     html = gloss_to_html(gloss, variant=variant)
     return e.tostring(html, **kwargs)
 
@@ -188,6 +203,38 @@ class WordToken(BaseToken):
         self.value = self.token, self.stage, self.glosslist
 
 
+def make_compatible_glosses(tokens):
+    """group a token stream into paragraphs of (sentence token, annotation) pairs"""
+    glosses = []
+    par = []
+    sentannot = []
+    for gt in tokens:
+        if gt.type == '</p>':
+            glosses.append(par)
+            par = []
+        elif gt.type == '</s>':
+            par.append((gt, sentannot))
+            sentannot = []
+        elif gt.type in ['<s>', '<p>']:
+            continue
+        else:
+            sentannot.append(gt)
+    return glosses
+
+
+def iter_tokens(glosses):
+    """token stream of paragraphs with <p> and <s> boundary tokens, as
+    HtmlReader yields it (inverse of make_compatible_glosses)"""
+    for par in glosses:
+        yield PlainToken(('<p>', None))
+        for senttoken, sentannot in par:
+            yield PlainToken(('<s>', None))
+            for gt in sentannot:
+                yield gt
+            yield senttoken
+        yield PlainToken(('</p>', u' '.join(senttoken.value for senttoken, sentannot in par)))
+
+
 class BaseReader(object):
     def data(self):
         return (self.metadata, self.para)
@@ -321,21 +368,7 @@ class HtmlReader(BaseReader):
         return PlainToken((toktype, elemtext), attrs=attrs)        
 
     def make_compatible_glosses(self, tokens):
-        glosses = []
-        par = []
-        sentannot = []
-        for gt in tokens:
-            if gt.type == '</p>':
-                glosses.append(par)
-                par = []
-            elif gt.type == '</s>':
-                par.append((gt, sentannot))
-                sentannot = []
-            elif gt.type in ['<s>', '<p>']:
-                continue
-            else:
-                sentannot.append(gt)
-        return glosses
+        return make_compatible_glosses(tokens)
 
     def elem_to_gloss(self, xgloss):
         form = normalizeText(xgloss.text)
@@ -449,6 +482,43 @@ class TokensWriter(object):
                 outfile.write("\n")
 
 
+class ConllWriter(object):
+    """CoNLL-U: first (most likely) gloss of each word, daba part of
+    speech in XPOS and gloss in MISC"""
+    def __init__(self, metadata_para, filename, encoding="utf-8"):
+        metadata, para = metadata_para
+        self.encoding = encoding
+        self.metadata = metadata
+        self.para = para
+        self.filename = filename
+
+    def format_token(self, num, gt):
+        if gt.type == 'w':
+            gloss = gt.glosslist[0]
+            xpos = '/'.join(gloss.ps or ()) or '_'
+            misc = u'Gloss={}'.format(gloss.gloss) if gloss.gloss else '_'
+            columns = [str(num), gt.token, gloss.form or '_', '_', xpos]
+        else:
+            misc = '_'
+            columns = [str(num), gt.value, gt.value, 'PUNCT', 'c']
+        return u'\t'.join(columns + ['_', '_', '_', '_', misc])
+
+    def write(self):
+        with open(self.filename, 'w', encoding=self.encoding) as outfile:
+            snum = 0
+            for p in self.para:
+                for (senttoken, sentannot) in p:
+                    snum += 1
+                    outfile.write(u'# sent_id = {}\n'.format(snum))
+                    outfile.write(u'# text = {}\n'.format(' '.join(senttoken.value.split())))
+                    num = 0
+                    for gt in sentannot:
+                        if gt.type in ('w', 'c'):
+                            num += 1
+                            outfile.write(self.format_token(num, gt) + u'\n')
+                    outfile.write(u'\n')
+
+
 class SentenceListWriter(object):
     def __init__(self, metadata_para, filename, encoding="utf-8"):
         metadata, para = metadata_para
@@ -599,7 +669,7 @@ class HtmlWriter(object):
 class FileWrapper(object):
     def __init__(self, encoding='utf-8'):
         self.encoding = encoding
-        self.output_formats = ["html", "txt", "sentlist", "tokens"]
+        self.output_formats = ["html", "txt", "sentlist", "tokens", "conll"]
 
     def read(self, filename, sentlist=False):
         try:
@@ -644,12 +714,34 @@ class FileWrapper(object):
             TxtWriter((metadata, result), filename, self.encoding).write()
         elif format == "tokens":
             TokensWriter((metadata, result), filename, self.encoding).write()
+        elif format == "conll":
+            ConllWriter((metadata, result), filename, self.encoding).write()
         else:
             print("Unknown output format: {}".format(format))
 
 
+def gloss_to_sfm(gloss, morpheme=False):
+    """Serialize Gloss as a Toolbox dictionary entry (or \\mm line for morphemes)"""
+    if not morpheme:
+        sfm = r"""
+\lx {0}
+\ps {1}
+\ge {2}
+                """.format(gloss.form, '/'.join(gloss.ps), gloss.gloss)
+        for m in gloss.morphemes:
+            sfm = sfm + gloss_to_sfm(m, morpheme=True)
+    else:
+        sfm = r'\mm ' + ':'.join([gloss.form or '', '/'.join(gloss.ps or ()), gloss.gloss or '']) + os.linesep
+    return sfm
+
+
 class DictWriter(object):
     def __init__(self, udict, filename, lang='', name='', ver='', add=False, encoding='utf-8'):
+        """Toolbox dictionary writer
+
+        add — on repeated writes, append only entries added since the
+        previous write (or since mark_saved) instead of rewriting the file
+        """
         self.lang = lang
         self.name = name
         self.ver = ver
@@ -657,34 +749,37 @@ class DictWriter(object):
         self.filename = filename
         self.encoding = encoding
         self.add = add
+        self.saved = set()
+
+    def glosses(self, skip=()):
+        """unique glosses of the dictionary in sorting order, except those in skip"""
+        unique = set()
+        for glosslist in self.udict.values():
+            unique.update(glosslist)
+        unique.difference_update(skip)
+        #FIXME: poor man's ordering of dictionary articles
+        return sorted(unique)
+
+    def mark_saved(self):
+        """consider all current dictionary entries as already written to the file"""
+        self.saved = set(self.glosses())
 
     def write(self):
-        def makeGlossSfm(gloss,morpheme=False):
-            if not morpheme:
-                sfm = r"""
-\lx {0}
-\ps {1}
-\ge {2}
-                """.format(gloss.form, '/'.join(gloss.ps), gloss.gloss)
-                for m in gloss.morphemes:
-                    sfm = sfm + makeGlossSfm(m, morpheme=True)
-            else:
-                sfm = r'\mm ' + ':'.join([gloss.form or '', '/'.join(gloss.ps or ()), gloss.gloss or '']) + os.linesep
-            return sfm
-
-        with codecs.open(self.filename, 'w', encoding=self.encoding) as dictfile:
-            dictfile.write(u'\\lang {0}\n'.format(self.lang))
-            dictfile.write(u'\\name {0}\n'.format(self.name))
-            dictfile.write(u'\\ver {0}\n'.format(self.ver))
-            wordlist = []
-            for glosslist in self.udict.values():
-                for gloss in glosslist:
-                    if gloss not in wordlist:
-                        wordlist.append(gloss)
-            #FIXME: poor man's ordering of dictionary articles
-            wordlist.sort()
-            for gloss in wordlist:
-                dictfile.write(makeGlossSfm(gloss))
+        if self.add and self.saved and os.path.exists(self.filename):
+            glosses = self.glosses(skip=self.saved)
+            mode = 'a'
+        else:
+            glosses = self.glosses()
+            mode = 'w'
+        # newline='' keeps line endings as they are, like codecs writer did
+        with open(self.filename, mode, encoding=self.encoding, newline='') as dictfile:
+            if mode == 'w':
+                dictfile.write(u'\\lang {0}\n'.format(self.lang))
+                dictfile.write(u'\\name {0}\n'.format(self.name))
+                dictfile.write(u'\\ver {0}\n'.format(self.ver))
+            dictfile.writelines(map(gloss_to_sfm, glosses))
+        self.saved.update(glosses)
+
 
 class DabaDict(MutableMapping):
     def __init__(self):
@@ -723,6 +818,32 @@ class DabaDict(MutableMapping):
         self.sha.update(repr((key,value)).encode('utf-8'))
         return self._data.setdefault(key, []).append(value)
 
+    def update_items(self, items, reprs=None):
+        """add a batch of (key, Gloss) pairs
+
+        Gives the same dictionary and hash as setting the pairs one by
+        one, but hashes them in one go and walks the trie once per key.
+        reprs — precomputed strings concatenating to the items reprs
+        """
+        items = list(items)
+        if reprs is None:
+            reprs = [''.join(map(repr, items))]
+        for text in reprs:
+            self.sha.update(text.encode('utf-8'))
+        grouped = {}
+        for key, value in items:
+            assert isinstance(value, Gloss)
+            try:
+                grouped[key].append(value)
+            except KeyError:
+                grouped[key] = [value]
+        if not self._data:
+            for key, values in grouped.items():
+                self._data[key] = values
+        else:
+            for key, values in grouped.items():
+                self._data.setdefault(key, []).extend(values)
+
     def __delitem__(self, key):
         return self._data.__delitem__(key)
 
@@ -741,12 +862,33 @@ class DabaDict(MutableMapping):
     def iter_prefixes(self, string):
         return self._data.iter_prefixes(string)
 
+    def has_prefix(self, prefix):
+        """check if any key starts with prefix"""
+        for key in self._data.iterkeys(prefix):
+            return True
+        return False
+
 
 class VariantsDict(MutableMapping):
     def __init__(self, canonical=False):
         self._data = defaultdict(list)
+        # (form, ps, gloss) -> first variants group containing the form
+        self._index = {}
         self.canonical = canonical
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if '_index' not in state:
+            # pickled before the index was introduced
+            self._index = {}
+            for (ps, gs), variants in self._data.items():
+                for varlist in variants:
+                    self._add_index(varlist, ps, gs)
+
+    def _add_index(self, varlist, ps, gs):
+        for form in varlist:
+            self._index.setdefault((form, ps, gs), varlist)
+
     def __len__(self):
         return len(self._data)
 
@@ -757,26 +899,19 @@ class VariantsDict(MutableMapping):
 
     def __getitem__(self, gloss):
         form, ps, gs, ms = gloss
-        lookup = []
+        varlist = None
         if gs:
-            lookup.append((form, (ps, gs)))
-        if ms:
+            varlist = self._index.get((form, ps, gs))
+        if varlist is None and ms:
             stems = [m for m in ms if 'mrph' not in m.ps]
             if len(stems) == 1:
                 g = stems[0]
-                lookup.append((g.form, (g.ps, g.gloss)))
-        for f, lkp in lookup:
-            try:
-                variants = self._data[lkp]
-                for varlist in variants:
-                    if f in varlist:
-                        if self.canonical:
-                            return varlist[0]
-                        else:
-                            return varlist
-            except KeyError:
-                pass
-        return []
+                varlist = self._index.get((g.form, g.ps, g.gloss))
+        if varlist is None:
+            return []
+        if self.canonical:
+            return varlist[0]
+        return varlist
 
     def __setitem__(self, gloss, value):
         assert isinstance(value, set)
@@ -785,25 +920,92 @@ class VariantsDict(MutableMapping):
 
     def add(self, glosslist):
         f, ps, gs, ms = glosslist[0]
-        self._data[(ps, gs)].append([gloss.form for gloss in glosslist])
+        varlist = [gloss.form for gloss in glosslist]
+        self._data[(ps, gs)].append(varlist)
+        self._add_index(varlist, ps, gs)
 
     def __delitem__(self, gloss):
         form, ps, gs, ms = gloss
         index = (ps, gs)
         self._data[index].remove(form)
+        self._index.pop((form, ps, gs), None)
         if not self._data[index]:
             self._data.__delitem__(index)
         return
 
 
+def split_records(lines, parts, minlines=20000):
+    """split Toolbox file lines into about `parts` chunks at record boundaries
+
+    Chunks are cut only after blank lines and are at least minlines long.
+    Returns a list of (number of lines before chunk, chunk lines).
+    """
+    size = max(minlines, len(lines) // parts + 1)
+    chunks = []
+    start = 0
+    while start < len(lines):
+        end = start + size
+        while end < len(lines) and not lines[end-1].isspace():
+            end += 1
+        chunks.append((start, lines[start:end]))
+        start = end
+    return chunks
+
+
+def read_dict_chunk(options, chunk):
+    """parse a chunk of a Toolbox file in a pool worker
+
+    Returns pickled results, to avoid slow (un)pickling of lots of
+    objects with garbage collector running.
+    """
+    with gc_paused():
+        return pickle.dumps(DictReader(None, chunk=chunk, **options).parsed,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_dictionaries(filenames, jobs=1, encoding='utf-8', **options):
+    """read several Toolbox dictionaries in a pool of processes
+
+    All files are split into chunks at record boundaries, chunks of all
+    files are parsed concurrently and merged per file in order, giving
+    the same result as reading files one by one. Returns list of
+    DictReader objects in the order of filenames.
+    """
+    options['encoding'] = encoding
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = []
+        for filename in filenames:
+            chunks = split_records(read_lines(filename, encoding), jobs)
+            pending.append((filename, [pool.submit(read_dict_chunk, options, chunk) for chunk in chunks]))
+        return [DictReader(filename, parsed=[future.result() for future in futures], **options)
+                for filename, futures in pending]
+
+
+def read_lines(filename, encoding='utf-8'):
+    """read file lines with the same line boundaries as codecs reader"""
+    with open(filename, 'rb') as dictfile:
+        return dictfile.read().decode(encoding).splitlines(True)
+
+
 class DictReader(object):
     def __init__(self, filename, encoding='utf-8', store=True,
                  variants=False, polisemy=False, keepmrph=False,
                  normalize=True, ignorelist=('i',), inverse=False,
                  lemmafields=('lx', 'le'),
                  variantfields=('ve', 'va', 'vc', 'a'),
-                 glossfields=('gf', 'ge', 'dff'), canonical=False):
+                 glossfields=('gf', 'ge', 'dff'), canonical=False,
+                 jobs=1, chunk=None, parsed=None):
+        """read Toolbox dictionary
 
+        jobs — number of processes to parse a large file with
+        chunk — (first line, lines) to parse instead of the file, used in pool workers
+        parsed — results of parsing the file by chunks to merge instead of reading it
+"""
+        self.options = dict(encoding=encoding, store=store, variants=variants,
+                            polisemy=polisemy, keepmrph=keepmrph, normalize=normalize,
+                            ignorelist=ignorelist, inverse=inverse, lemmafields=lemmafields,
+                            variantfields=variantfields, glossfields=glossfields,
+                            canonical=canonical)
         self._dict = DabaDict()
         self._variants = VariantsDict(canonical=canonical)
         self._polisemy = defaultdict(ddlist)
@@ -833,9 +1035,11 @@ class DictReader(object):
             except (ValueError):
                 print("Error line:", str(self.line), str(v))
 
+        undot = {ord(u'.'): None, ord(u'-'): None}
+
         def normalize(value):
             try:
-                return normalizeText(value.translate({ord(u'.'): None, ord(u'-'):None}).lower())
+                return normalizeText(value.translate(undot).lower())
             except AttributeError:
                 return value
 
@@ -851,12 +1055,18 @@ class DictReader(object):
                 key = value
             return [key, Gloss(form=value, ps=(), gloss="", morphemes=())]
 
+        # results are collected and added to the dictionary in one batch
+        items = []
+        attrs = {}
+        vargroups = []
+        polidict = defaultdict(ddlist)
+
         def push_items(primarykey, lemmalist):
             for key, lx in lemmalist:
-                self._dict[key] = lx
+                items.append((key, lx))
                 detonedkey = detone(key)
                 if not detonedkey == key:
-                    self._dict[detonedkey] = lx
+                    items.append((detonedkey, lx))
 
         def select_gloss(glossdict):
             ge = ''
@@ -880,18 +1090,31 @@ class DictReader(object):
                 ge = select_gloss(glossdict)
                 if self.inverse:
                     key = u'_'.join(['/'.join(ps), ge])
-                    lemmalist = [(key, g._replace(ps=ps, gloss=ge)) for k, g in lemmalist]
+                    lemmalist = [(key, Gloss(g.form, ps, ge, g.morphemes)) for k, g in lemmalist]
                     push_items(key, lemmalist)
                 else:
-                    lemmalist = [(key, item._replace(ps=ps, gloss=ge)) for key, item in lemmalist]
+                    lemmalist = [(key, Gloss(item.form, ps, ge, item.morphemes)) for key, item in lemmalist]
                     if not ps == ('mrph',) or self.keepmrph:
                         if store:
                             push_items(key, lemmalist)
                         if variants and len(lemmalist) > 1:
-                            self._variants.add(list(zip(*lemmalist))[1])
+                            vargroups.append(list(zip(*lemmalist))[1])
 
-        with codecs.open(filename, 'r', encoding=encoding) as dictfile:
-            for line in dictfile:
+        if chunk is not None:
+            self.line, lines = chunk
+        elif parsed is not None:
+            lines = []
+        else:
+            lines = read_lines(filename, encoding)
+            if jobs > 1:
+                chunks = split_records(lines, jobs)
+                if len(chunks) > 1:
+                    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+                        parsed = list(pool.map(read_dict_chunk, repeat(self.options), chunks))
+                    lines = []
+
+        with gc_paused():
+            for line in lines:
                 self.line = self.line + 1
                 # end of the artice/dictionary
                 if not line or line.isspace():
@@ -908,7 +1131,7 @@ class DictReader(object):
                     tag, space, value = line[1:].partition(' ')
                     value = value.strip()
                     if tag in ['lang', 'ver', 'name']:
-                        self._dict.__setattr__(tag, value)
+                        attrs[tag] = value
                     elif tag in self.ignorelist:
                         ignore = True
                     elif tag in self.lemmafields:
@@ -936,12 +1159,17 @@ class DictReader(object):
                         glossdict[tag] = value
                     elif tag in ['gv']:
                         if polisemy:
-                            self._polisemy[key][select_gloss(glossdict)].append(value)
+                            polidict[key][select_gloss(glossdict)].append(value)
                             dk = detone(key)
                             if not dk == key:
-                                self._polisemy[dk][select_gloss(glossdict)].append(value)
+                                polidict[dk][select_gloss(glossdict)].append(value)
             else:
                 process_record(key, lemmalist, ps, glossdict)
+            if chunk is not None:
+                # hash input is also computed in parallel
+                self.parsed = (items, ''.join(map(repr, items)), attrs, vargroups, polidict, self.line)
+                return
+            self.merge(parsed or [(items, None, attrs, vargroups, polidict, self.line)])
 
             if not self._dict.attributed():
                 print(r"Dictionary does not contain obligatory \lang, \name or \ver fields.\
@@ -949,6 +1177,28 @@ class DictReader(object):
                 print(self._dict.lang, self._dict.name, self._dict.ver)
             
 
+    def merge(self, parsed):
+        """add results of parsing the file chunks (pickled by workers), in file order"""
+        allitems = []
+        allreprs = []
+        for result in parsed:
+            if isinstance(result, bytes):
+                result = pickle.loads(result)
+            items, reprs, attrs, vargroups, polidict, lastline = result
+            allitems.extend(items)
+            allreprs.append(reprs)
+            for tag, value in attrs.items():
+                setattr(self._dict, tag, value)
+            for glosslist in vargroups:
+                self._variants.add(glosslist)
+            for key, glosses in polidict.items():
+                for ge, values in glosses.items():
+                    self._polisemy[key][ge].extend(values)
+            self.line = lastline
+        if None in allreprs:
+            allreprs = None
+        self._dict.update_items(allitems, allreprs)
+
     #FIXME: kept for backward compatibility, remove after refactoring
     def values(self):
         try:
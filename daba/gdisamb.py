@@ -18,10 +18,16 @@
 import codecs
 import datetime
 import itertools
+import json
 import os
+import queue
 import re
+import sys
+import threading
+import time
 import unicodedata
 from collections import defaultdict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import wx.lib.colourselect as csel
 import wx.lib.newevent
@@ -34,7 +40,8 @@ from intervaltree import IntervalTree
 
 import daba.formats
 import daba.grammar
-from daba.ntgloss import Gloss
+from daba.ntgloss import Gloss, emptyGloss
+from daba.orthography import detone
 
 
 # EVENTS 
@@ -177,6 +184,60 @@ class SentAnnot(object):
         return (self, newsent)
 
 
+def gloss_to_record(gloss):
+    """convert Gloss into JSON-serializable nested list"""
+    return [gloss.form, list(gloss.ps), gloss.gloss,
+            [gloss_to_record(m) for m in gloss.morphemes]]
+
+
+def record_to_gloss(record):
+    """restore Gloss from a nested list"""
+    form, ps, gloss, morphemes = record
+    return Gloss(form, tuple(ps), gloss, tuple(record_to_gloss(m) for m in morphemes))
+
+
+def copy_attrs(attrs):
+    """snapshot token attributes, keeping None as is"""
+    return dict(attrs) if attrs else attrs
+
+
+def sent_to_record(sent):
+    """convert SentAnnot into JSON-serializable dict (for the edit journal)"""
+    tokens = []
+    for token in sent.glosslist:
+        if token.type == 'w':
+            tokens.append({'type': 'w', 'token': token.token, 'stage': token.stage,
+                           'glosslist': [gloss_to_record(g) for g in token.glosslist],
+                           'attrs': copy_attrs(token.attrs)})
+        else:
+            tokens.append({'type': token.type, 'value': token.value, 'attrs': copy_attrs(token.attrs)})
+    return {'pnum': sent.pnum,
+            'type': sent.senttoken.type,
+            'text': sent.senttoken.value,
+            'attrs': copy_attrs(sent.senttoken.attrs),
+            'tokens': tokens,
+            'selectlist': [[gloss_to_record(g) for g in selectlist]
+                           for selectlist in sent.selectlist]}
+
+
+def record_to_sent(snum, record):
+    """restore SentAnnot from a journal record"""
+    glosslist = []
+    for token in record['tokens']:
+        if token['type'] == 'w':
+            glosslist.append(daba.formats.WordToken(
+                [record_to_gloss(g) for g in token['glosslist']],
+                token['token'], token['stage'], token['attrs']))
+        else:
+            glosslist.append(daba.formats.PlainToken(
+                (token['type'], token['value']), token['attrs']))
+    senttoken = daba.formats.PlainToken((record['type'], record['text']), record['attrs'])
+    sent = SentAnnot(record['pnum'], snum, (senttoken, glosslist))
+    sent.selectlist = [[record_to_gloss(g) for g in selectlist]
+                       for selectlist in record['selectlist']]
+    return sent
+
+
 class FileParser(object):
     """A wrapper class for file IO operations and for keeping annotated data
 
@@ -189,6 +250,8 @@ class FileParser(object):
     def __init__(self):
         self.glosses = []
         self.dirty = False
+        self.dirtysents = {}
+        self.changes = []
 
     def read_file(self, filename):
         """read daba html file and store annotated data as a list of tuples in self.glosses"""
@@ -221,6 +284,51 @@ class FileParser(object):
         fwriter = daba.formats.HtmlWriter((self.metadata, out), filename)
         fwriter.write()
 
+    def touch(self, sent):
+        """mark sentence as changed, to be recorded in the edit journal"""
+        self.dirty = True
+        self.dirtysents[id(sent)] = sent
+
+    def flush_dirty(self):
+        """turn changed sentences into journal records"""
+        for sent in self.dirtysents.values():
+            self.changes.append({'op': 'sent', 'snum': sent.snum, 'sent': sent_to_record(sent)})
+        self.dirtysents = {}
+
+    def journal_insert(self, snum, sent):
+        """record sentence insertion (call before glosses are changed)"""
+        self.flush_dirty()
+        self.changes.append({'op': 'insert', 'snum': snum, 'sent': sent_to_record(sent)})
+        self.dirty = True
+
+    def journal_delete(self, snum):
+        """record sentence deletion (call before glosses are changed)"""
+        self.flush_dirty()
+        self.changes.append({'op': 'delete', 'snum': snum})
+        self.dirty = True
+
+    def collect_changes(self):
+        """return journal records for all changes since the last call"""
+        self.flush_dirty()
+        changes = self.changes
+        self.changes = []
+        return changes
+
+    def replay(self, records):
+        """apply journal records to glosses"""
+        for record in records:
+            op = record['op']
+            snum = record['snum']
+            if op == 'sent':
+                self.glosses[snum] = record_to_sent(snum, record['sent'])
+            elif op == 'insert':
+                self.glosses.insert(snum, record_to_sent(snum, record['sent']))
+            elif op == 'delete':
+                del self.glosses[snum]
+        for snum, sent in enumerate(self.glosses):
+            sent.snum = snum
+        self.numsent = len(self.glosses)
+
 
 class EditLogger(object):
     """log token edit operations"""
@@ -250,8 +358,271 @@ class EditLogger(object):
         self.fileobj.close()
 
 
+class EditJournal(object):
+    """append-only journal of sentence changes not yet written into the output file
+
+    The first line of the journal names the base file the records should be
+    applied to, each following line is a JSON record as produced by
+    FileParser.collect_changes.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.fileobj = None
+
+    @property
+    def timestamp(self):
+        """timestamp for journal records"""
+        return datetime.datetime.now().isoformat()
+
+    def exists(self):
+        """check if there is an unfinished journal left from the previous session"""
+        return os.path.exists(self.filename) and os.path.getsize(self.filename) > 0
+
+    def read(self):
+        """read journal, return base filename and a list of change records"""
+        basefile = None
+        records = []
+        with codecs.open(self.filename, 'r', encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # incomplete last record after a crash
+                    break
+                if record['op'] == 'base':
+                    basefile = record['file']
+                else:
+                    records.append(record)
+        return basefile, records
+
+    def reset(self, basefile):
+        """start a new journal for changes made on top of basefile"""
+        self.close()
+        self.fileobj = codecs.open(self.filename, 'w', encoding='utf-8')
+        self.append([{'op': 'base', 'file': basefile}])
+
+    def append(self, records):
+        """write records and make sure they reach the disk"""
+        for record in records:
+            record = dict(record, time=self.timestamp)
+            self.fileobj.write(u'{0}\n'.format(json.dumps(record, ensure_ascii=False)))
+        self.fileobj.flush()
+        os.fsync(self.fileobj.fileno())
+
+    def close(self):
+        """close journal file"""
+        if self.fileobj:
+            self.fileobj.close()
+            self.fileobj = None
+
+    def remove(self):
+        """close and delete journal file"""
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+class AutoSaver(threading.Thread):
+    """background worker saving user's changes
+
+    Changes are appended to the EditJournal as soon as they are submitted.
+    From time to time (and on explicit request) the journaled changes are
+    compacted: applied to a private copy of the file data and written into
+    the output file, after which the journal is started anew.
+    """
+    def __init__(self, journal, basefile, pending=(), interval=60):
+        threading.Thread.__init__(self, name='autosave')
+        self.daemon = True
+        self.journal = journal
+        self.basefile = basefile
+        self.target = None
+        self.interval = interval
+        self.queue = queue.Queue()
+        self.pending = list(pending)
+        self.mirror = None
+        self.lastcompact = time.time()
+        self.journal.reset(self.basefile)
+        if self.pending:
+            self.journal.append(self.pending)
+
+    def submit(self, records):
+        """queue change records for journaling"""
+        if records:
+            self.queue.put(('changes', records))
+
+    def compact(self, target):
+        """request writing all changes into target file"""
+        self.queue.put(('compact', target))
+
+    def close(self):
+        """write remaining changes and stop the worker"""
+        self.queue.put(('stop', None))
+        self.join()
+
+    def run(self):
+        while True:
+            try:
+                op, arg = self.queue.get(timeout=self.interval)
+            except queue.Empty:
+                op, arg = 'timeout', None
+            try:
+                if op == 'changes':
+                    self.journal.append(arg)
+                    self.pending.extend(arg)
+                elif op == 'compact':
+                    self.target = arg
+                    self.do_compact()
+                elif op == 'stop':
+                    if self.target:
+                        self.do_compact()
+                    if self.pending:
+                        self.journal.close()
+                    else:
+                        self.journal.remove()
+                    return
+                if self.target and time.time() - self.lastcompact > self.interval:
+                    self.do_compact()
+            except (IOError, OSError) as e:
+                sys.stderr.write(u'Autosave error: {0}\n'.format(e))
+
+    def do_compact(self):
+        """apply pending changes to the file copy and write it into target"""
+        self.lastcompact = time.time()
+        if not self.pending and self.basefile == self.target:
+            return
+        if self.mirror is None:
+            self.mirror = FileParser()
+            self.mirror.read_file(self.basefile)
+        self.mirror.replay(self.pending)
+        tmpfile = self.target + '.tmp'
+        self.mirror.write(tmpfile)
+        os.replace(tmpfile, self.target)
+        # reload on next compaction: write() alters mirror's tokens
+        self.mirror = None
+        self.pending = []
+        self.basefile = self.target
+        self.journal.reset(self.basefile)
+
+
+def itergloss(gloss):
+    """iterate over a gloss and all its morphemes at any depth"""
+    yield gloss
+    for m in gloss.morphemes or ():
+        for g in itergloss(m):
+            yield g
+
+
+def token_keys(token, selectlist=(), lower=True):
+    """collect searchable strings for a token (used by SearchIndex)
+
+    Returns dict with the following keys:
+    form : token string and lemma forms (with tones)
+    bare : the same strings with tonemarks removed
+    gloss : glosses of the lemmas and morphemes
+    ps : part of speech tags of the lemmas and morphemes
+    """
+    fold = (lambda s: s.lower()) if lower else (lambda s: s)
+    keys = {'form': set(), 'bare': set(), 'gloss': set(), 'ps': set()}
+    forms = [token.token]
+    for gloss in itertools.chain(token.glosslist or (), selectlist or ()):
+        for g in itergloss(gloss):
+            if isinstance(g.form, str):
+                forms.append(g.form)
+            if g.gloss and isinstance(g.gloss, str):
+                keys['gloss'].add(fold(g.gloss))
+            for ps in g.ps or ():
+                keys['ps'].add(fold(ps))
+    for form in filter(None, forms):
+        form = fold(normalizeText(form))
+        keys['form'].add(form)
+        keys['bare'].add(detone(form))
+    return keys
+
+
+class SearchIndex(object):
+    """in-memory inverted index of a file's annotation
+
+    Maps lowercased searchable strings (tokens, detoned tokens, lemmas,
+    glosses and ps tags, see :func:`token_keys`) to the sentences they
+    occur in. Sentences are referenced by SentAnnot objects, so that
+    index stays valid when sentences are renumbered after
+    split/join. The index is built once when a file is loaded and
+    updated sentence-wise on edits.
+
+    Attributes
+    ----------
+    keys (dict) : field -> key -> set of sentence ids
+    sents (dict) : sentence id -> SentAnnot
+    sentkeys (dict) : sentence id -> field -> set of keys
+    senttext (dict) : sentence id -> lowercased detoned sentence text
+    """
+    fields = ('form', 'bare', 'gloss', 'ps')
+
+    def __init__(self, glosses=()):
+        self.keys = dict((field, defaultdict(set)) for field in self.fields)
+        self.sents = {}
+        self.sentkeys = {}
+        self.senttext = {}
+        for sent in glosses:
+            self.add(sent)
+
+    def add(self, sent):
+        """index sentence's tokens and text"""
+        sid = id(sent)
+        self.sents[sid] = sent
+        sentkeys = dict((field, set()) for field in self.fields)
+        for token, selectlist in zip(sent.glosslist, sent.selectlist):
+            try:
+                for field, keys in token_keys(token, selectlist).items():
+                    sentkeys[field].update(keys)
+            # FIXME: should not happen if all words are proper GlossTokens
+            except (AttributeError):
+                print(token)
+        for field, keys in sentkeys.items():
+            for key in keys:
+                self.keys[field][key].add(sid)
+        self.sentkeys[sid] = sentkeys
+        self.senttext[sid] = detone(normalizeText(sent.senttext).lower())
+
+    def remove(self, sent):
+        """drop sentence from the index"""
+        sid = id(sent)
+        if sid not in self.sents:
+            return
+        for field, keys in self.sentkeys.pop(sid).items():
+            for key in keys:
+                sids = self.keys[field][key]
+                sids.discard(sid)
+                if not sids:
+                    del self.keys[field][key]
+        del self.sents[sid]
+        del self.senttext[sid]
+
+    def update(self, sent):
+        """reindex sentence after its tokens or annotation were edited"""
+        self.remove(sent)
+        self.add(sent)
+
+    def lookup(self, field, predicate):
+        """return list of SentAnnot objects having a key matching predicate"""
+        sids = set()
+        for key, keysids in self.keys[field].items():
+            if predicate(key):
+                sids.update(keysids)
+        return [self.sents[sid] for sid in sids]
+
+    def iter_texts(self):
+        """iterate over (SentAnnot, normalized sentence text) pairs"""
+        for sid, text in self.senttext.items():
+            yield self.sents[sid], text
+
+
 class SearchTool(object):
-    """class for searching strings in annotated data"""
+    """class for searching strings in annotated data
+
+    Search is tone-insensitive unless the query itself has tonemarks,
+    and is run against a SearchIndex built with :meth:`build_index`.
+    """
     def __init__(self, processor):
         """processor — FileParser object wrapping list of glosses"""
         self.processor = processor
@@ -260,47 +631,96 @@ class SearchTool(object):
         self.position = 0
         self.ignorecase = True
         self.searchstr = ""
+        self.index = None
 
     @property
     def nmatches(self):
         """property holding the number of mathces"""
         return len(self.matches)
 
+    def build_index(self):
+        """index processor's glosses (called when a file is loaded)"""
+        self.index = SearchIndex(self.processor.glosses)
+
+    def update_sentence(self, *sents):
+        """reindex sentences after edits"""
+        if self.index is not None:
+            for sent in sents:
+                self.index.update(sent)
+
+    def remove_sentence(self, *sents):
+        """remove sentences from the index (after sentence join)"""
+        if self.index is not None:
+            for sent in sents:
+                self.index.remove(sent)
+
+    def _make_predicate(self, searchstr, searchtype):
+        """return (field, predicate) to test keys for a given query"""
+        if searchtype == 'ps':
+            return 'ps', lambda key: key == searchstr
+        elif searchtype == 'gloss':
+            return 'gloss', lambda key: searchstr in key
+        elif detone(searchstr) == searchstr:
+            return 'bare', lambda key: searchstr in key
+        else:
+            return 'form', lambda key: searchstr in key
+
     def _searcher(self, searchstr, searchtype, startsent):
         """class-internal search engine"""
         self.position = 0
         self.matches = []
         self.searchstr = searchstr
         self.history.append(self.searchstr)
-        if self.ignorecase:
-            searchstr = searchstr.lower()
-        glosses = self.processor.glosses
-        if startsent:
-            glosses = glosses[startsent:] + glosses[:startsent]
-        for sent in glosses:
-            if searchtype == 'word part':
-                for wnum, word in enumerate(sent.glosslist):
+        if self.index is None:
+            self.build_index()
+        searchstr = normalizeText(searchstr)
+        numsent = len(self.processor.glosses) or 1
+        order = lambda sent: (sent.snum - startsent) % numsent
+        if searchtype == 'sentence part':
+            querystr = detone(searchstr.lower() if self.ignorecase else searchstr)
+            try:
+                query = re.compile(querystr)
+            except (re.error):
+                query = re.compile(re.escape(querystr))
+            for sent, text in sorted(self.index.iter_texts(), key=lambda p: order(p[0])):
+                if not self.ignorecase:
+                    text = detone(normalizeText(sent.senttext))
+                for matchobj in query.finditer(text):
+                    self.matches.append((sent.snum, matchobj))
+        else:
+            field, predicate = self._make_predicate(searchstr.lower(), searchtype)
+            if not self.ignorecase:
+                _, exact = self._make_predicate(searchstr, searchtype)
+            for sent in sorted(self.index.lookup(field, predicate), key=order):
+                for wnum, (word, selectlist) in enumerate(zip(sent.glosslist, sent.selectlist)):
                     try:
-                        if self.searchstr in word.token:
-                            match = (sent.snum, wnum)
-                            self.matches.append(match)
-                    # FIXME: should not happen if all words are proper GlossTokens
+                        keys = token_keys(word, selectlist, lower=self.ignorecase)[field]
                     except (AttributeError):
-                        print(word)
-            elif searchtype == 'sentence part':
-                for matchobj in re.finditer(self.searchstr, sent.senttext):
-                    self.matches.append((sent.snum, matchobj))
+                        continue
+                    if self.ignorecase:
+                        found = any(predicate(key) for key in keys)
+                    else:
+                        found = any(exact(key) for key in keys)
+                    if found:
+                        self.matches.append((sent.snum, wnum))
         return self.matches
-        
+
     def find(self, searchstr, startsent=0):
-        """search for a given string 
+        """search for a given string
 
-        By default, a query is interpreted as a word part. It is
-        treated as a sentence part in case query contains spaces.
+        By default, a query is interpreted as a word part, matched
+        against tokens and lemma forms. It is treated as a sentence
+        part in case query contains spaces. Queries prefixed with
+        `gloss:` or `ps:` search for glosses and part of speech tags.
+        Queries without tonemarks match forms with any tones.
 
         Returns sentence match position tuple (sentid, tokid)
         """
-        if ' ' in searchstr:
+        prefix, colon, rest = searchstr.partition(':')
+        if colon and prefix in ('gloss', 'ps') and rest:
+            searchtype = prefix
+            searchstr = rest.strip()
+        elif ' ' in searchstr:
             searchtype = 'sentence part'
         else:
             searchtype = 'word part'
@@ -331,6 +751,135 @@ class SearchTool(object):
             return ()
 
 
+TokenLayout = namedtuple('TokenLayout', 'index token selectlist toktype form stage glosslist statecode')
+SentLayout = namedtuple('SentLayout', 'signature tokens charspans notfound')
+
+
+def token_statecode(glosslist, selectlist):
+    """state code of a token's selector (see GlossSelector.statecode)"""
+    if selectlist:
+        if len(glosslist) > 1 and len(selectlist) > 1:
+            return 3
+        return 5
+    elif len(glosslist) > 1:
+        return 2
+    elif ''.join(glosslist[0].ps) in ['', None, '<?>'] and glosslist[0].gloss in ['', None, '<?>'] and not glosslist[0].morphemes:
+        return 4
+    else:
+        return 1
+
+
+def make_token_layout(index, glosstoken, selectlist):
+    """collect data needed to show a token in a GlossSelector"""
+    toktype, tokvalue = glosstoken.as_tuple()
+    if toktype == 'w':
+        form, stage, glosslist = tokvalue
+    else:
+        form = tokvalue
+        stage = ''
+        glosslist = [Gloss(form, (toktype,), '', ())]
+    statecode = token_statecode(glosslist, selectlist)
+    return TokenLayout(index, glosstoken, selectlist, toktype, form, stage, glosslist, statecode)
+
+
+def calc_charspans(text, tokens):
+    """find (start, length) character spans for each token in a sentence text
+
+    Returns a tuple of a list of spans and a list of tokens not found in text
+    """
+    charspans = []
+    notfound = []
+    startchar = 0
+    for token in tokens:
+        charlength = len(token)
+        tokenindex = text[startchar:].find(token)
+        if tokenindex == -1:
+            # FIXME: handle missing tokens properly
+            tokenindex = startchar
+            charlength = 0
+            notfound.append(token)
+        else:
+            tokenindex += startchar
+        charspans.append((tokenindex, charlength))
+        startchar = tokenindex+charlength
+    return charspans, notfound
+
+
+def sent_signature(sent):
+    """cheap fingerprint of sentence data to check if its layout is still valid"""
+    return (id(sent), sent.senttoken.value,
+            tuple((id(t), t.token) for t in sent.glosslist),
+            tuple(id(s) for s in sent.selectlist))
+
+
+def make_sent_layout(sent):
+    """compute layout data for a SentAnnot (may run in a background thread)"""
+    signature = sent_signature(sent)
+    tokens = [make_token_layout((sent.snum, toknum), token, selectlist)
+              for toknum, (token, selectlist)
+              in enumerate(zip(sent.glosslist, sent.selectlist))]
+    charspans, notfound = calc_charspans(sent.senttoken.value, [t.token.token for t in tokens])
+    return SentLayout(signature, tokens, charspans, notfound)
+
+
+class SentLayoutCache(object):
+    """layout data for sentences, precomputed in a background thread
+
+    Layouts for the neighbours of the shown sentence are computed in
+    advance with :meth:`prefetch`. Cached layouts are checked against
+    current sentence data, so that they never need to be invalidated
+    explicitly on edits.
+    """
+    def __init__(self, processor, keep=2):
+        """processor — FileParser object wrapping list of glosses
+        keep — number of neighbouring sentences to keep layouts for"""
+        self.processor = processor
+        self.keep = keep
+        self.cache = {}
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def get(self, sent):
+        """return layout for a SentAnnot, precomputed if possible"""
+        future = self.cache.get(sent.snum)
+        if future is not None:
+            try:
+                layout = future.result()
+                if layout.signature == sent_signature(sent):
+                    return layout
+            # sentence data changed during computation
+            except (Exception):
+                pass
+        layout = make_sent_layout(sent)
+        future = Future()
+        future.set_result(layout)
+        self.cache[sent.snum] = future
+        return layout
+
+    def prefetch(self, *snums):
+        """start computing layouts for given sentence numbers"""
+        glosses = self.processor.glosses
+        for snum in snums:
+            if not 0 <= snum < len(glosses):
+                continue
+            future = self.cache.get(snum)
+            if future is not None and not future.done():
+                continue
+            sent = glosses[snum]
+            if future is not None and not future.exception() and future.result().signature == sent_signature(sent):
+                continue
+            self.cache[snum] = self.executor.submit(make_sent_layout, sent)
+        if snums:
+            center = sum(snums) / len(snums)
+            for snum in list(self.cache):
+                if abs(snum - center) > self.keep:
+                    del self.cache[snum]
+
+    def close(self):
+        """stop background computations"""
+        self.cache = {}
+        self.executor.shutdown(wait=False)
+
+
 # WIDGETS
 
 class SentText(wx.StaticText):
@@ -528,8 +1077,7 @@ class GlossInputDialog(wx.Dialog):
             glosstext = normalizeText(self.glosstext.GetValue())
             oldgloss = self.as_gloss
             try:
-                toks = daba.grammar.str_tokenize(glosstext)
-                self.as_gloss = daba.grammar.stringgloss_parser().parse(toks)
+                self.as_gloss = daba.grammar.parse_gloss_string(glosstext)
                 if not self.as_gloss == oldgloss:
                     self.glosstext.SetBackgroundColour(wx.NullColour)
                     self.glosstext.Refresh()
@@ -623,6 +1171,11 @@ class GlossEditButton(wx.Panel):
         self.SetSizer(sizer)
         self.button.Bind(wx.EVT_BUTTON, self.OnEditGloss)
 
+    def SetGlosslist(self, glosslist):
+        """reset button to a new list of selections (when selector is reused)"""
+        self.gloss = glosslist[0]
+        self.state = None
+
     def CalculateGloss(self, glosslist):
         """compute a gloss to be shown on the button as current selection for a list of selections"""
         def recursiveGlossDigger(gloss):
@@ -707,33 +1260,21 @@ class GlossSelector(wx.Panel):
     tbutton (TokenEditButton) : button for a token
     mbutton (GlossEditButton) : leading button indicating state
     children ([GlossButton]) : gloss variant buttons in a selector
+
+    Selector widgets are pooled by SentPanel: a selector is created
+    once and then filled with token data with :meth:`SetToken`.
     """
-    def __init__(self, parent, index, glosstoken, selectlist, vertical=True, *args, **kwargs):
+    def __init__(self, parent, vertical=True, *args, **kwargs):
         wx.Panel.__init__(self, parent, *args, **kwargs)
-        self.token = glosstoken
-        self.toktype, tokvalue = glosstoken.as_tuple()
-        if self.toktype == 'w':
-            self.form, self.stage, self.glosslist = tokvalue
-        else:
-            self.form = tokvalue
-            self.stage = ''
-            self.glosslist = [Gloss(self.form, (self.toktype,), '', ())]
-        self.selectlist = selectlist
         self.vertical = vertical
         self.parent = parent
         self.children = []
-        self.parserstage = self.stage
-        self.index = index
+        self.index = None
 
         self.Bind(wx.EVT_CONTEXT_MENU, self.OnContextMenu)
         self.Bind(EVT_GLOSS_SELECTED, self.OnGlossSelected)
         self.Bind(EVT_GLOSS_EDITED, self.OnEdition)
 
-        try:
-            self.gloss = self.selectlist[0]
-        except (IndexError):
-            self.gloss = self.glosslist[0]
-        self.statecode = self.CalculateState()
         config = wx.Config.Get(False)
 
         def getforeback(config, name):
@@ -751,10 +1292,8 @@ class GlossSelector(wx.Panel):
             'deselected': getforeback(config, 'deselected'),
                 }
 
-        self.tbutton = TokenEditButton(self, self.index, self.toktype, self.form)
-        self.mbutton = GlossEditButton(self, self.selectlist or self.glosslist, self.statecolours)
-
-        self.UpdateState(self.statecode, self.gloss)
+        self.tbutton = TokenEditButton(self, self.index, '', '')
+        self.mbutton = GlossEditButton(self, [emptyGloss], self.statecolours)
 
         if self.vertical:
             self.sizer = wx.BoxSizer(wx.VERTICAL)
@@ -766,16 +1305,39 @@ class GlossSelector(wx.Panel):
         self.SetSizer(self.sizer)
         self.Layout()
 
+    def SetToken(self, layout):
+        """fill selector with token data (TokenLayout), reusing its widgets"""
+        self.token = layout.token
+        self.toktype = layout.toktype
+        self.form = layout.form
+        self.stage = layout.stage
+        self.parserstage = self.stage
+        self.glosslist = layout.glosslist
+        self.selectlist = layout.selectlist
+        self.index = layout.index
+
+        try:
+            self.gloss = self.selectlist[0]
+        except (IndexError):
+            self.gloss = self.glosslist[0]
+        self.statecode = self.CalculateState()
+
+        self.tbutton.SetToken(self.index, self.toktype, self.form)
+        self.mbutton.SetGlosslist(self.selectlist or self.glosslist)
+        self.UpdateState(self.statecode, self.gloss)
+
+        self.ClearButtons()
         self.AddButtons(self.glosslist)
 
-        if selectlist:
-            for gloss in selectlist:
+        if self.selectlist:
+            for gloss in self.selectlist:
                 for button in self.children:
                     if button.gloss == gloss:
                         button.main.SetValue(True)
                         button.DoToggle()
                 else:
                     self.OnSelection(gloss)
+        self.Layout()
 
     def CalculateState(self):
         """Calculate current state code (self.state)"""
@@ -787,6 +1349,13 @@ class GlossSelector(wx.Panel):
             statecode = 1
         return statecode
 
+    def ClearButtons(self):
+        """remove variant buttons left from the previous token"""
+        for gbutton in self.children:
+            self.sizer.Detach(gbutton)
+            gbutton.Destroy()
+        self.children = []
+
     def AddButtons(self, glosslist):
         """generate buttons for each variant in a glosslist"""
         if len(self.glosslist) > 1:
@@ -961,7 +1530,7 @@ class SearchDialog(wx.Dialog):
 
         sizer = wx.BoxSizer(wx.VERTICAL)
         self.searchfield = NormalizedTextCtrl(self, wx.ID_ANY, searchstr)
-        sizer.Add(wx.StaticText(self, wx.ID_ANY, "Search for word or sentence part:"))
+        sizer.Add(wx.StaticText(self, wx.ID_ANY, "Search for word or sentence part (use gloss: or ps: prefix to search annotation):"))
         sizer.Add(self.searchfield)
         sizer.Add(self.CreateButtonSizer(wx.OK | wx.CANCEL), 0, wx.TOP | wx.BOTTOM, 10)
         self.SetSizer(sizer)
@@ -1037,6 +1606,13 @@ class TokenEditButton(wx.Panel):
         self.SetSizer(sizer)
         self.button.Bind(wx.EVT_BUTTON, self.OnEditToken)
 
+    def SetToken(self, index, tokentype, tokenstr):
+        """reset button to another token (when selector is reused)"""
+        self.index = index
+        self.tokentype = tokentype
+        self.tokenstr = tokenstr
+        self.button.SetLabel(self.tokenstr)
+
     def OnEditToken(self, event):
         """collect user's changes to token's type and value, post TokenEditEvent"""
         dlg = TokenInputDialog(self, wx.ID_ANY, 'Edit token', self.tokentype, self.tokenstr)
@@ -1071,7 +1647,7 @@ class SentenceText(wx.stc.StyledTextCtrl):
     token (PlainToken) : sentence token
     text (str) : sentence text
     charspans ([(start, length)]) : list of character spans for each token in a sentence
-    intervals (IntervalTree) : button ids corresponding to text spans for each token
+    intervals (IntervalTree) : token numbers corresponding to text spans for each token
     sentpanel (SentPanel) : backref to a perent frame to access its attributes (snum, numsent)
     """
     def __init__(self, parent, *args, **kwargs):
@@ -1125,59 +1701,40 @@ class SentenceText(wx.stc.StyledTextCtrl):
         except (UnicodeDecodeError):
             self.calcCharPos(self.text, bytepos-1)
 
-    def calcCharSpans(self, tokenbuttons):
-        """set spans in text for each token (given a list of token button widgets)"""
-        self.charspans = []
-        startchar = 0
-        charlength = 0
-        for btn in tokenbuttons:
-            token = btn.token.token
-            charlength = len(token)
-            tokenindex = self.text[startchar:].find(token)
-            if tokenindex == -1:
-                # FIXME: handle missing tokens properly
-                tokenindex = startchar
-                charlength = 0
-                notfound = wx.MessageDialog(self, u'Token not found in the source sentence: ' + token, 'Token not found', wx.OK)
-                notfound.ShowModal()
-                notfound.Destroy()
-            else:
-                tokenindex += startchar
-            charspan = (tokenindex, charlength)
-            startchar = tokenindex+charlength
-            self.charspans.append(charspan)
-        self.calcButtonIntervals(tokenbuttons, self.charspans)
-        return self.charspans
-
-    def calcButtonIntervals(self, tokenbuttons, charspans):
-        """assign token button ids to corresponding character intervals in text"""
+    def calcTokenIntervals(self, charspans):
+        """assign token numbers to corresponding character intervals in text"""
         self.intervals = IntervalTree()
-        for btn, span in zip(tokenbuttons, charspans):
+        for toknum, span in enumerate(charspans):
             start, length = span
             if length == 0:
                 # FIXME: need to find better solution for the missing tokens
                 length = 1
-            self.intervals[start:start+length] = btn.GetId()
+            self.intervals[start:start+length] = toknum
 
-    def getButtonHere(self, pos):
-        """return button id for a given char position"""
+    def getTokenHere(self, pos):
+        """return token number for a given char position"""
         if pos == 0:
             return sorted(self.intervals)[0][2]
         try:
             return sorted(self.intervals[pos])[0][2]
         except (IndexError):
-            return self.getButtonHere(pos-1)
+            return self.getTokenHere(pos-1)
 
-    def SetSentence(self, senttoken, tokenbuttons):
-        """typeset and color sentence text, attach button ids"""
+    def SetSentence(self, senttoken, layout):
+        """typeset and color sentence text given its SentLayout"""
         self.token = senttoken
         self.text = senttoken.value
-        self.calcCharSpans(tokenbuttons)
+        self.charspans = list(layout.charspans)
+        self.calcTokenIntervals(self.charspans)
+        for token in layout.notfound:
+            notfound = wx.MessageDialog(self, u'Token not found in the source sentence: ' + token, 'Token not found', wx.OK)
+            notfound.ShowModal()
+            notfound.Destroy()
         self.SetText(self.text)
         self.SetReadOnly(True)
         self.StartStyling(0)
         self.SetStyling(self.calcByteLen(self.text), 0)
-        self.DoColorSentence(tokenbuttons)
+        self.DoColorSentence(layout.tokens)
 
     def ClearSentence(self):
         """clear sentence text widget"""
@@ -1187,7 +1744,7 @@ class SentenceText(wx.stc.StyledTextCtrl):
         self.ClearAll()
         
     def DoColorToken(self, btn):
-        """color character span corresponding to a token button"""
+        """color character span corresponding to a token (selector or TokenLayout)"""
         snum, toknum = btn.index
         token = btn.token.token
         try:
@@ -1216,8 +1773,8 @@ class SentenceText(wx.stc.StyledTextCtrl):
         """post event to move clicked token's selector into view"""
         bytepos = self.GetCurrentPos()
         charpos = self.calcCharPos(bytepos)
-        btn_id = self.getButtonHere(charpos)
-        btnevt = ShowSelectorEvent(btn_id)
+        toknum = self.getTokenHere(charpos)
+        btnevt = ShowSelectorEvent(self.GetId(), toknum=toknum)
         wx.PostEvent(self.GetEventHandler(), btnevt)
         evt.Skip()
 
@@ -1481,6 +2038,9 @@ class SentPanel(wx.Panel):
 
     savedstate (bool) : 
     isshown (bool) : sentence is loaded, widgets shown
+    layout (SentLayout) : layout data for the current sentence
+    rendered (int) : number of tokens shown in selectors
+    renderbatch (int) : number of selectors to show at once
 
     Widgets
     -------
@@ -1492,6 +2052,7 @@ class SentPanel(wx.Panel):
     sentsource (SentenceText) : sentence text widget
     sentattrs (SentAttributes) : sentence-level attributes panel
     annotlist (ScrolledPanel) : token annotation buttons
+    selectors ([GlossSelector]) : pool of selector widgets in annotlist
     """
     def __init__(self, parent, vertical=True, *args, **kwargs):
         wx.Panel.__init__(self, parent, *args, **kwargs)
@@ -1499,6 +2060,11 @@ class SentPanel(wx.Panel):
         self.savedstate = None
         self.isshown = False
         self.snum = 0
+        self.layout = None
+        self.rendered = 0
+        self.renderbatch = 20
+        self.generation = 0
+        self.selectors = []
         self.numsent = self.GetTopLevelParent().processor.numsent
         self.sentfont = self.GetFont()
         self.sentfont.SetPointSize(self.sentfont.GetPointSize() + 2)
@@ -1539,9 +2105,17 @@ class SentPanel(wx.Panel):
         self.navsizer.Add(copybutton)
         self.sentsource = SentenceText(self)
         self.sentattrs = SentAttributes(self)
+        self.annotlist = wx.lib.scrolledpanel.ScrolledPanel(self, wx.ID_ANY)
+        self.annotlist.SetScrollRate(20, 20)
+        if self.vertical:
+            annotsizer = wx.BoxSizer(wx.HORIZONTAL)
+        else:
+            annotsizer = wx.BoxSizer(wx.VERTICAL)
+        self.annotlist.SetSizer(annotsizer)
         self.Sizer.Add(self.navsizer)
         self.Sizer.Add(self.sentsource, 0, wx.EXPAND)
         self.Sizer.Add(self.sentattrs, 0, wx.EXPAND)
+        self.Sizer.Add(self.annotlist, 1, wx.EXPAND)
         self.SetSizer(self.Sizer)
         self.Layout()
 
@@ -1554,40 +2128,70 @@ class SentPanel(wx.Panel):
         self.Bind(EVT_SENTENCE_JOIN, self.OnSentenceJoin)
         self.Bind(EVT_SENTENCE_SPLIT, self.OnSentenceSplit)
 
-    def CreateGlossButtons(self):
-        """generate GlossSelector widgets for each token in a sentence"""
-        tokenbuttons = []
-        self.annotlist = wx.lib.scrolledpanel.ScrolledPanel(self, wx.ID_ANY)
-        self.annotlist.SetScrollRate(20, 20)
-        if self.vertical:
-            annotsizer = wx.BoxSizer(wx.HORIZONTAL)
-        else:
-            annotsizer = wx.BoxSizer(wx.VERTICAL) 
-        for (toknum, (token, selectlist)) in enumerate(zip(self.tokenlist, self.selectlist)):
-            abox = GlossSelector(self.annotlist, (self.snum, toknum), token, selectlist, vertical=self.vertical)
-            tokenbuttons.append(abox)
-            annotsizer.Add(abox)
-        self.annotlist.SetSizer(annotsizer)
+    def GetSelector(self, toknum):
+        """get selector widget for a token number from the pool, extending it if needed"""
+        while len(self.selectors) <= toknum:
+            selector = GlossSelector(self.annotlist, vertical=self.vertical)
+            selector.Hide()
+            self.annotlist.GetSizer().Add(selector)
+            self.selectors.append(selector)
+        return self.selectors[toknum]
+
+    def CreateGlossButtons(self, upto):
+        """show GlossSelector widgets for the tokens of a sentence up to a given token number"""
+        upto = min(upto, len(self.layout.tokens))
+        if upto <= self.rendered:
+            return
+        self.annotlist.Freeze()
+        for toknum in range(self.rendered, upto):
+            selector = self.GetSelector(toknum)
+            selector.SetToken(self.layout.tokens[toknum])
+            selector.Show()
+        self.rendered = upto
         self.annotlist.Layout()
-        return tokenbuttons
+        self.annotlist.FitInside()
+        self.annotlist.Thaw()
+
+    def RenderMore(self, generation):
+        """show selectors for the rest of the tokens batch by batch, letting UI respond in between"""
+        # panel destroyed or another sentence shown meanwhile
+        if not self or generation != self.generation:
+            return
+        self.CreateGlossButtons(self.rendered + self.renderbatch)
+        if self.rendered < len(self.layout.tokens):
+            wx.CallLater(10, self.RenderMore, generation)
 
     def ShowSent(self, sentannot):
-        """set sentence data attributes and show widgets"""
+        """set sentence data attributes and show widgets
+
+        Only the first batch of tokens is shown immediately, the rest
+        of the selectors are filled in the background. Layout data for
+        the neighbouring sentences is precomputed meanwhile.
+        """
         self.senttoken, self.selectlist, self.tokenlist, self.sentindex = sentannot.as_tuple()
         self.senttext = sentannot.senttext.strip()
         if self.isshown:
             self.sentsource.ClearSentence()
             self.sentattrs.ClearSentence()
-            self.Sizer.Remove(self.annotlist.GetSizer())
-            self.annotlist.Destroy()
         self.snum = sentannot.snum
         self.sentnumbutton.SetValue(self.snum+1)
-        tokenbuttons = self.CreateGlossButtons()
-        self.sentsource.SetSentence(self.senttoken, tokenbuttons)
+        layouts = self.GetTopLevelParent().layouts
+        self.layout = layouts.get(sentannot)
+        self.generation += 1
+        self.rendered = 0
+        self.annotlist.Freeze()
+        for selector in self.selectors:
+            selector.Hide()
+        self.CreateGlossButtons(self.renderbatch)
+        self.annotlist.Scroll(0, 0)
+        self.annotlist.Thaw()
+        self.sentsource.SetSentence(self.senttoken, self.layout)
         self.sentattrs.SetSentence(self.senttoken, self.snum)
-        self.Sizer.Add(self.annotlist, 1, wx.EXPAND)
         self.Layout()
         self.isshown = True
+        if self.rendered < len(self.layout.tokens):
+            wx.CallLater(10, self.RenderMore, self.generation)
+        layouts.prefetch(self.snum-1, self.snum+1)
 
     def PrevSentence(self, event):
         """show previous sentence"""
@@ -1630,9 +2234,9 @@ class SentPanel(wx.Panel):
 
     def OnShowSelector(self, evt):
         """move requested gloss selector into view"""
-        btn_id = evt.GetId()
-        btn = self.annotlist.FindWindowById(btn_id)
-        self.annotlist.ScrollChildIntoView(btn)
+        self.CreateGlossButtons(evt.toknum+1)
+        if evt.toknum < self.rendered:
+            self.annotlist.ScrollChildIntoView(self.selectors[evt.toknum])
 
     def UpdateNumsent(self, numsent):
         """update numsent value and its display"""
@@ -1759,7 +2363,7 @@ class MainFrame(wx.Frame):
 
         # Custom events
         self.Bind(EVT_SELECTOR_UPDATED, self.OnSelectorUpdate)
-        self.Bind(EVT_SAVE_RESULTS, self.OnSave)
+        self.Bind(EVT_SAVE_RESULTS, self.OnSaveResults)
         self.Bind(EVT_TOKEN_SPLIT, self.OnTokenSplit)
         self.Bind(EVT_TOKEN_JOIN, self.OnTokenJoin)
         self.Bind(EVT_TOKEN_EDIT, self.OnTokenEdit)
@@ -1781,6 +2385,11 @@ class MainFrame(wx.Frame):
             self.localdict = daba.formats.DictReader(dictfile).get()
         else:
             self.localdict = daba.formats.DabaDict()
+        self.dictfile = dictfile
+        # on save, only glosses added since the last save are appended
+        self.dictwriter = daba.formats.DictWriter(self.localdict, dictfile, lang='default', name='localdict', ver='0', add=True)
+        if os.path.exists(dictfile):
+            self.dictwriter.mark_saved()
 
     def InitValues(self):
         """set main attributes"""
@@ -1788,7 +2397,10 @@ class MainFrame(wx.Frame):
         self.outfile = None
         self.processor = FileParser()
         self.searcher = SearchTool(self.processor)
+        self.layouts = SentLayoutCache(self.processor)
         self.logger = None
+        self.autosaver = None
+        self.autosavetimer = None
         self.fileopened = False
         self.undolist = defaultdict(list)
 
@@ -1878,13 +2490,14 @@ class MainFrame(wx.Frame):
     def OnSelectorUpdate(self, e):
         """record user's selections/edits into processor"""
         selector = e.GetEventObject()
-        if selector.selectlist:
-            self.processor.dirty = True
         token = selector.GetWordToken()
         snum, toknum = selector.index
         sent = self.processor.glosses[snum]
         sent.selectlist[toknum] = selector.selectlist
         sent.glosslist[toknum] = token
+        # record deselections too: the saved file is rebuilt from the journal
+        self.processor.touch(sent)
+        self.searcher.update_sentence(sent)
 
     def ShowSent(self, snum):
         """show sentence by its index"""
@@ -1907,7 +2520,8 @@ class MainFrame(wx.Frame):
             sent.selectlist.insert(toknum+shift, [])
             sent.glosslist.insert(toknum+shift, daba.formats.WordToken([Gloss(token, (), '', ())], token, '-1'))
             shift = shift+1
-        self.processor.dirty = True
+        self.searcher.update_sentence(sent)
+        self.processor.touch(sent)
         wx.CallAfter(self.ShowSent, snum)
 
     def OnTokenJoin(self, evt):
@@ -1928,7 +2542,8 @@ class MainFrame(wx.Frame):
         del sent.selectlist[second]
         sent.glosslist[first] = newtoken
         del sent.glosslist[second]
-        self.processor.dirty = True
+        self.searcher.update_sentence(sent)
+        self.processor.touch(sent)
         wx.CallAfter(self.ShowSent, snum)
 
     def OnTokenEdit(self, evt):
@@ -1945,45 +2560,53 @@ class MainFrame(wx.Frame):
         else:
             newtoken = daba.formats.PlainToken((evt.toktype, evt.token))
         sent.glosslist[toknum] = newtoken
-        self.processor.dirty = True
+        self.searcher.update_sentence(sent)
+        self.processor.touch(sent)
         wx.CallAfter(self.ShowSent, snum)
 
     def OnSentenceJoin(self, evt):
         """join sentences in the processor glosses data, update UI"""
         firstsent = self.processor.glosses[evt.first]
         nextsent = self.processor.glosses[evt.second]
+        self.processor.journal_delete(evt.second)
+        self.searcher.remove_sentence(nextsent)
         newsent = firstsent.join(nextsent)
+        self.searcher.update_sentence(newsent)
         self.processor.glosses[evt.first] = newsent
         del self.processor.glosses[evt.second]
         for sent in self.processor.glosses[evt.second:]:
             sent.snum -= 1
         self.processor.numsent -= 1
-        self.processor.dirty = True
+        self.processor.touch(newsent)
         wx.CallAfter(self.ShowSent, evt.first)
 
     def OnSentenceSplit(self, evt):
         """split sentences in the processor glosses data, update UI"""
         sent = self.processor.glosses[evt.snum]
         firstsent, nextsent = sent.split(evt.tnum, evt.charpos)
+        self.processor.journal_insert(evt.snum+1, nextsent)
         self.processor.glosses[evt.snum] = firstsent
         self.processor.glosses.insert(evt.snum+1, nextsent)
+        self.searcher.update_sentence(firstsent, nextsent)
         for sent in self.processor.glosses[evt.snum+2:]:
             sent.snum += 1
         self.processor.numsent += 1
-        self.processor.dirty = True
+        self.processor.touch(firstsent)
         wx.CallAfter(self.ShowSent, evt.snum)
 
     def OnSentenceEdit(self, evt):
         """save sentence text changes to processor glosses after token edits"""
         sent = self.processor.glosses[evt.snum]
         sent.senttoken = evt.sent
-        self.processor.dirty = True
+        sent.senttext = evt.sent.value
+        self.searcher.update_sentence(sent)
+        self.processor.touch(sent)
 
     def OnSentAttrsEdit(self, evt):
         """save sentence-level attributes edits in the processor glosses"""
         sent = self.processor.glosses[evt.snum]
         sent.senttoken.attrs = evt.attrs
-        self.processor.dirty = True
+        self.processor.touch(sent)
 
     def OnGlossEdited(self, evt):
         """remember that gloss has been edited"""
@@ -2022,6 +2645,8 @@ class MainFrame(wx.Frame):
                 sent.glosslist[savedstate.start:savedstate.end] = savedstate.toklist
             else:
                 print("Unimplemented undo operation!")
+            self.searcher.update_sentence(sent)
+            self.processor.touch(sent)
             self.ShowSent(snum)
 
     def OnMenuSearch(self, e):
@@ -2095,6 +2720,8 @@ class MainFrame(wx.Frame):
                 self.OnSave(e)
             if self.logger:
                 self.logger.OnExit()
+            self.StopAutosave()
+            self.layouts.close()
             self.InitValues()
             self.CleanUI()
 
@@ -2148,6 +2775,8 @@ class MainFrame(wx.Frame):
         self.dictfile = self.config.Read("/".join(["localdict", self.infile]), os.path.join(self.dirname, "localdict.txt"))
         self.SetLocaldict(self.dictfile)
         self.processor.read_file(self.infile)
+        self.StartAutosave()
+        self.searcher.build_index()
         self.InitUI()
         self.SetTitle(self.filename)
         self.filepanel.ShowFile(s.senttoken for s in self.processor.glosses)
@@ -2159,10 +2788,63 @@ class MainFrame(wx.Frame):
     def SaveFiles(self):
         """save annotated data, localdict and config values"""
         if self.localdict:
-            daba.formats.DictWriter(self.localdict, self.dictfile, lang='default', name='localdict', ver='0').write()
-        self.processor.write(self.outfile)
+            self.dictwriter.write()
+        self.FlushChanges()
+        self.autosaver.compact(self.outfile)
+        self.processor.dirty = False
         self.config.Flush()
 
+    def StartAutosave(self):
+        """start journaling changes, offer to recover unsaved changes from the previous session"""
+        journalfile = os.path.extsep.join([get_basename(self.infile), 'journal'])
+        journal = EditJournal(os.path.join(self.dirname, journalfile))
+        basefile = self.infile
+        pending = []
+        if journal.exists():
+            savedbase, records = journal.read()
+            if savedbase and os.path.exists(savedbase):
+                dlg = wx.MessageDialog(self, 'Found unsaved changes from the previous session. Recover them?', 'Recover changes', wx.YES_NO | wx.ICON_QUESTION)
+                if dlg.ShowModal() == wx.ID_YES:
+                    basefile = savedbase
+                    pending = records
+                    if basefile != self.infile:
+                        self.processor.read_file(basefile)
+                        self.outfile = basefile
+                    self.processor.replay(pending)
+                    self.processor.dirty = bool(pending)
+                dlg.Destroy()
+        self.autosaver = AutoSaver(journal, basefile, pending)
+        if self.outfile:
+            self.autosaver.compact(self.outfile)
+        self.autosaver.start()
+        self.autosavetimer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnAutosaveTimer, self.autosavetimer)
+        self.autosavetimer.Start(3000)
+
+    def StopAutosave(self):
+        """write out remaining changes and stop autosave worker"""
+        if self.autosavetimer:
+            self.autosavetimer.Stop()
+        if self.autosaver:
+            self.FlushChanges()
+            self.autosaver.close()
+
+    def FlushChanges(self):
+        """pass changes made since the last call to autosave worker"""
+        self.autosaver.submit(self.processor.collect_changes())
+
+    def OnAutosaveTimer(self, e):
+        """journal recent changes periodically"""
+        self.FlushChanges()
+
+    def OnSaveResults(self, e):
+        """save results: in background if output file is known, otherwise ask for it"""
+        if self.fileopened and self.outfile:
+            self.FlushChanges()
+            self.autosaver.compact(self.outfile)
+        else:
+            self.OnSave(e)
+
     def OnSave(self, e):
         """save files"""
         if not self.fileopened:
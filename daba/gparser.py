@@ -17,13 +17,22 @@
 #
 
 import wx
+import wx.lib.newevent
 import os
-from contextlib import contextmanager
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 import daba.mparser
 import daba.formats
 from daba.plugins import OrthographyConverter
 
+# EVENTS
+ParseProgressEvent, EVT_PARSE_PROGRESS = wx.lib.newevent.NewEvent()
+ParseDoneEvent, EVT_PARSE_DONE = wx.lib.newevent.NewEvent()
+BatchDoneEvent, EVT_BATCH_DONE = wx.lib.newevent.NewEvent()
+
 def get_outdir(fname):
     dirname = os.path.dirname(fname)
     basename = os.path.basename(fname)
@@ -41,6 +50,121 @@ def get_outfile(fname):
     return '.'.join([os.path.splitext(basename)[0], 'pars'])
 
 
+class ParseThread(threading.Thread):
+    'Parse opened file in background, post progress events to the window'
+    def __init__(self, window, processor, para, filename=None):
+        threading.Thread.__init__(self, name='parser')
+        self.daemon = True
+        self.window = window
+        self.processor = processor
+        self.para = para
+        self.filename = filename
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        start = time.time()
+        numpar = len(self.para)
+
+        def report(parnum, numtokens):
+            if self.cancelled.is_set():
+                raise daba.mparser.ParseCancelled(self.filename)
+            wx.PostEvent(self.window, ParseProgressEvent(
+                filename=self.filename, parnum=parnum, numpar=numpar,
+                numtokens=numtokens, elapsed=time.time() - start))
+
+        result = error = None
+        try:
+            result = self.processor.parse(self.para, progress=report)
+        except daba.mparser.ParseCancelled:
+            pass
+        except Exception as e:
+            error = e
+        wx.PostEvent(self.window, ParseDoneEvent(filename=self.filename, result=result, error=error))
+
+
+class BatchParser(threading.Thread):
+    'Parse several files concurrently in a pool of worker processes'
+    def __init__(self, window, files, runtimedir, tokenizer, converters, jobs=None):
+        threading.Thread.__init__(self, name='batchparser')
+        self.daemon = True
+        self.window = window
+        self.files = files
+        self.jobs = jobs
+        self.manager = multiprocessing.Manager()
+        self.progress = self.manager.Queue()
+        self.cancelled = self.manager.Event()
+        self.initargs = (runtimedir, tokenizer, tuple(converters), False,
+                         self.progress, self.cancelled)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def relay_progress(self):
+        while not self.progress.empty():
+            infile, parnum, numpar, numtokens, elapsed = self.progress.get()
+            wx.PostEvent(self.window, ParseProgressEvent(
+                filename=infile, parnum=parnum, numpar=numpar,
+                numtokens=numtokens, elapsed=elapsed))
+
+    def run(self):
+        results = {}
+        with ProcessPoolExecutor(max_workers=self.jobs,
+                                 initializer=daba.mparser.init_parse_worker,
+                                 initargs=self.initargs) as pool:
+            futures = dict((pool.submit(daba.mparser.parse_file_worker, infile, outfile), infile)
+                           for infile, outfile in self.files)
+            pending = set(futures)
+            while pending:
+                if self.cancelled.is_set():
+                    for future in pending:
+                        future.cancel()
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                self.relay_progress()
+                for future in done:
+                    infile = futures[future]
+                    error = None
+                    if not future.cancelled():
+                        error = future.exception()
+                    if isinstance(error, daba.mparser.ParseCancelled):
+                        error = None
+                    results[infile] = error
+                    wx.PostEvent(self.window, ParseDoneEvent(
+                        filename=infile, result=None, error=error))
+        cancelled = self.cancelled.is_set()
+        self.manager.shutdown()
+        wx.PostEvent(self.window, BatchDoneEvent(results=results, cancelled=cancelled))
+
+
+class ParseProgress(object):
+    'Progress dialog with a cancel button for one or several files being parsed'
+    def __init__(self, parent, worker, filenames):
+        self.worker = worker
+        self.filenames = filenames
+        self.done = dict((f, 0.0) for f in filenames)
+        self.dlg = wx.ProgressDialog('Parsing', 'Parsing in progress...', maximum=1000,
+                                     parent=parent, style=wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME)
+
+    def Update(self, evt):
+        if evt.numpar:
+            self.done[evt.filename] = float(evt.parnum) / evt.numpar
+        value = int(1000 * sum(self.done.values()) / len(self.done))
+        speed = evt.numtokens / evt.elapsed if evt.elapsed else 0
+        msg = u'{0}: {1}/{2} paragraphs, {3} tokens ({4:.0f} tokens/s)'.format(
+            os.path.basename(evt.filename or ''), evt.parnum, evt.numpar, evt.numtokens, speed)
+        cont, skip = self.dlg.Update(min(value, 999), msg)
+        if not cont:
+            self.worker.cancel()
+
+    def FileDone(self, filename):
+        self.done[filename] = 1.0
+
+    def Destroy(self):
+        self.dlg.Destroy()
+
+
 class FilePanel(wx.Panel):
     'Text fileview panel'
     def __init__(self, parent, *args, **kwargs):
@@ -221,6 +345,8 @@ class MainFrame(wx.Frame):
         self.Bind(wx.EVT_MENU, self.OnSave, menuSave)
         menuSaveAs = filemenu.Append(wx.ID_SAVEAS,"S&ave as"," Save an xhtml file")
         self.Bind(wx.EVT_MENU, self.OnSaveAs, menuSaveAs)
+        menuBatch = filemenu.Append(wx.ID_ANY,"Parse &files..."," Parse several files in parallel")
+        self.Bind(wx.EVT_MENU, self.OnParseFiles, menuBatch)
         menuClose = filemenu.Append(wx.ID_CLOSE,"C&lose","Close current file")
         self.Bind(wx.EVT_MENU,self.OnClose, menuClose)
         menuExit = filemenu.Append(wx.ID_EXIT,"E&xit"," Terminate the program")
@@ -228,6 +354,10 @@ class MainFrame(wx.Frame):
         menuBar = wx.MenuBar()
         menuBar.Append(filemenu,"&File") # Adding the "filemenu" to the MenuBar
         self.SetMenuBar(menuBar)  # Adding the MenuBar to the Frame content.
+
+        self.Bind(EVT_PARSE_PROGRESS, self.OnParseProgress)
+        self.Bind(EVT_PARSE_DONE, self.OnParseDone)
+        self.Bind(EVT_BATCH_DONE, self.OnBatchDone)
         
         Sizer = wx.BoxSizer(wx.HORIZONTAL)
         Sizer.Add(self.filepanel, 2, wx.EXPAND)
@@ -241,26 +371,83 @@ class MainFrame(wx.Frame):
         self.outfile = None
         self.io = daba.formats.FileWrapper()
         self.parsed = False
-
-    def OnParse(self,e):
-        @contextmanager
-        def wait_for_parser():
+        self.worker = None
+        self.progress = None
+        self.afterparse = None
+
+    def OnParse(self, e, afterparse=None):
+        if self.worker:
+            dlg = wx.MessageDialog(self, 'Parsing is already in progress', 'Please wait', wx.OK)
+            dlg.ShowModal()
+            dlg.Destroy()
+        elif not self.parsed:
             self.processor = daba.mparser.Processor(self.dl, self.gr,
                                                tokenizer=self.resourcepanel.toklist.tkz,
                                                converters=self.resourcepanel.convlist.selection)
-            yield self.processor.parse(self.io.para)
+            self.afterparse = afterparse
+            self.worker = ParseThread(self, self.processor, self.io.para, self.infile)
+            self.progress = ParseProgress(self, self.worker, [self.infile])
+            self.worker.start()
+        else:
+            if afterparse:
+                afterparse()
+            else:
+                #FIXME: proper error message or better avoid this case!
+                print("File already parsed!")
+
+    def OnParseFiles(self, e):
+        if self.worker:
+            return self.OnParse(e)
+        dlg = wx.FileDialog(self, "Choose files to parse", self.dirname, "", "*.*", wx.FD_OPEN | wx.FD_MULTIPLE)
+        if dlg.ShowModal() == wx.ID_OK:
+            files = [(f, os.path.join(get_outdir(f), get_outfile(f) + os.path.extsep + 'html'))
+                     for f in dlg.GetPaths()]
+            self.worker = BatchParser(self, files, self.dl.runtimedir,
+                                      self.resourcepanel.toklist.selection,
+                                      self.resourcepanel.convlist.selection)
+            self.progress = ParseProgress(self, self.worker, [f for f, o in files])
+            self.worker.start()
+        dlg.Destroy()
 
-        dlg = wx.MessageDialog(self, 'Please wait: parsing in progress', 'Please wait', wx.OK)
+    def OnParseProgress(self, evt):
+        if self.progress:
+            self.progress.Update(evt)
+
+    def OnParseDone(self, evt):
+        if not self.progress:
+            # file closed while parsing
+            return
+        if isinstance(self.worker, BatchParser):
+            self.progress.FileDone(evt.filename)
+            return
+        self.worker = None
+        self.progress.Destroy()
+        self.progress = None
+        if evt.error:
+            self.ParseError(evt.filename, evt.error)
+        elif evt.result is not None:
+            self.parsed = True
+            if self.afterparse:
+                self.afterparse()
+            self.FinishedParsing(evt)
+        self.afterparse = None
+
+    def OnBatchDone(self, evt):
+        if not self.progress:
+            return
+        self.worker = None
+        self.progress.Destroy()
+        self.progress = None
+        failed = [(f, err) for f, err in evt.results.items() if err]
+        for filename, error in failed:
+            self.ParseError(filename, error)
+        if not failed and not evt.cancelled:
+            self.FinishedParsing(evt)
+
+    def ParseError(self, filename, error):
+        dlg = wx.MessageDialog(self, u'Error parsing {0}: {1}'.format(filename, error), 'Parsing failed', wx.OK)
         dlg.ShowModal()
-
-        if not self.parsed:
-            with wait_for_parser():
-                self.parsed = True
-                dlg.Destroy()
-                self.FinishedParsing(e)
-        else:
-            #FIXME: proper error message or better avoid this case!
-            print("File already parsed!")
+        dlg.Destroy()
 
     def NoFileError(self,e):
         dlg = wx.MessageDialog(self, 'Error: no file opened!', 'No file opened', wx.OK)
@@ -292,6 +479,10 @@ class MainFrame(wx.Frame):
         dlg.Destroy()
 
     def OnClose(self,e):
+        if self.worker:
+            self.worker.cancel()
+            self.worker.join()
+            self.progress.Destroy()
         self.filepanel.control.Clear()
         self.InitValues()
 
@@ -301,8 +492,10 @@ class MainFrame(wx.Frame):
         if not self.outfile:
             self.OnSaveAs(e)
         else:
-            self.OnParse(e)
-            self.io.write(self.outfile, result=self.processor.parsed, parsed=True)
+            self.OnParse(e, afterparse=self.WriteResult)
+
+    def WriteResult(self):
+        self.io.write(self.outfile, result=self.processor.parsed, parsed=True)
 
     def OnSaveAs(self,e):
         if not self.infile:
@@ -313,8 +506,7 @@ class MainFrame(wx.Frame):
                 self.outfile = dlg.GetPath()
                 if not os.path.splitext(self.outfile)[1] == '.html' :
                     self.outfile = ''.join([self.outfile, os.path.extsep, 'html'])
-                    self.OnParse(e)
-                    self.io.write(self.outfile, result=self.processor.parsed, parsed=True)
+                self.OnParse(e, afterparse=self.WriteResult)
             dlg.Destroy()
 
 
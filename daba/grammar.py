@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 # -*- encoding: utf-8 -*-
 
+import os
 import re
 from daba.ntgloss import Pattern, Gloss
 from funcparserlib.parser import *
+from funcparserlib.parser import State
 from funcparserlib.lexer import make_tokenizer, Token, LexerError
 
 PSLIST = [
@@ -147,8 +149,9 @@ def parse(seq):
     f_firstmatch = n('firstmatch') + skip(space)
     f_parse = n('parse') + skip(space) + name >> list
     f_decompose = n('decompose') + skip(space) + name >> list
+    f_rules = n('rules') + skip(space) + name >> tuple
     func_clause = oneplus(f_add | f_apply | f_lookup | f_parallel | f_sequential | f_firstmatch) + maybe(f_parse | f_decompose) >> unfoldl >> tuple
-    stage_clause = skip(n('stage')) + skip(space) + name + skip(space) + func_clause + skip(maybe(space))
+    stage_clause = skip(n('stage')) + skip(space) + name + skip(space) + (func_clause | f_rules) + skip(maybe(space))
     return_clause = n('return') + skip(space) + skip(n('if')) + skip(space) + name + skip(maybe(space))
     for_clause = skip(n('for')) + skip(space) + name + skip(op(':')) + skip(maybe(space)) + many(stage_clause | return_clause ) >> tuple
     plan_dict = oneplus(for_clause) >> dict
@@ -163,6 +166,328 @@ def parse(seq):
 
     return grammar.parse(seq)
 
+
+# Hand-written recursive descent versions of the parsers above. They
+# give the same results as fullgloss_parser(), stringgloss_parser() and
+# parse() but do not build combinator graphs, so that thousands of
+# glosses can be parsed in milliseconds. Tokens are (type, value, offset)
+# tuples, parse functions return (value, position) or None on failure.
+
+GLOSS_SPECS = [
+        ('Comment', r'#.*'),
+        ('NL', r'[\r\n]+'),
+        ('Space', r'[ ]+'),
+        ('JunkSpace', r'[\t]+'),
+        ('Op', r'[\[\]|:{}]'),
+        ('Regex', r'<re>.*?</re>'),
+        ('QuotedName', r'"[^"\n]+"'),
+        ('Name', r'[^:<>\[\]{}| \n]+'),
+        ]
+
+STRING_SPECS = [
+        ('JunkSpace', r'[\r\n\t]+'),
+        ('Space', r'[ ]+'),
+        ('Op', r'[:/\[\]]'),
+        ('Name', r'[^:/ \[\]\r\t\n]+'),
+        ]
+
+NAMES = ('Name', 'QuotedName')
+PSLABELS = frozenset(PSLIST)
+
+
+def make_lexer(specs, useless):
+    """make a tokenizer function matching the specs in order at each position"""
+    regex = re.compile('|'.join('(?P<{0}>{1})'.format(kind, pattern) for kind, pattern in specs))
+
+    def lex(string):
+        tokens = []
+        match = regex.match
+        pos, end = 0, len(string)
+        while pos < end:
+            m = match(string, pos)
+            if m is None:
+                line = string.count('\n', 0, pos) + 1
+                raise LexerError((line, pos - string.rfind('\n', 0, pos)), string.splitlines()[line-1])
+            if m.lastgroup not in useless:
+                tokens.append((m.lastgroup, m.group(), pos))
+            pos = m.end()
+        return tokens
+    return lex
+
+lex_gloss = make_lexer(GLOSS_SPECS, ('Comment', 'NL', 'JunkSpace'))
+lex_string = make_lexer(STRING_SPECS, ('JunkSpace',))
+
+
+def is_op(tokens, pos, value):
+    return pos < len(tokens) and tokens[pos][0] == 'Op' and tokens[pos][1] == value
+
+
+def is_type(tokens, pos, kinds):
+    return pos < len(tokens) and tokens[pos][0] in kinds
+
+
+def is_keyword(tokens, pos, value):
+    return pos < len(tokens) and tokens[pos][0] == 'Name' and tokens[pos][1] == value
+
+
+def skip_space(tokens, pos):
+    return pos + 1 if is_type(tokens, pos, ('Space',)) else pos
+
+
+def parse_failure(string, tokens, pos):
+    if pos < len(tokens):
+        msg = u'got unexpected token at {0}: {1!r}'.format(tokens[pos][2], tokens[pos][1])
+    else:
+        msg = u'got unexpected end of input'
+    return NoParseError(u'{0} in {1!r}'.format(msg, string), State(pos, pos))
+
+
+def rd_form_expr(tokens, pos):
+    """{part|part...} splitter, pos is after the opening brace"""
+    parts = [None]
+    if is_type(tokens, pos, ('Regex',)):
+        parts[0] = tokens[pos][1]
+        pos += 1
+    elif is_type(tokens, pos, NAMES):
+        parts[0] = unquote(tokens[pos][1])
+        pos += 1
+    while is_op(tokens, pos, '|'):
+        pos += 1
+        part = None
+        if is_type(tokens, pos, ('Regex',)):
+            part = tokens[pos][1]
+            pos += 1
+        elif is_type(tokens, pos, NAMES):
+            part = unquote(tokens[pos][1])
+            pos += 1
+        parts.append(part)
+    if len(parts) < 2 or not is_op(tokens, pos, '}'):
+        return None
+    return unwrap_re(tuple(parts)), pos + 1
+
+
+def rd_fullgloss(tokens, pos):
+    """gloss pattern, as in fullgloss_parser()"""
+    pos = skip_space(tokens, pos)
+    form = None
+    if is_op(tokens, pos, '{'):
+        parsed = rd_form_expr(tokens, pos + 1)
+        if parsed:
+            form, pos = parsed
+    elif is_type(tokens, pos, ('Regex',)):
+        form = unwrap_re(tokens[pos][1])
+        pos += 1
+    elif is_type(tokens, pos, NAMES):
+        form = unquote(tokens[pos][1])
+        pos += 1
+    if not is_op(tokens, pos, ':'):
+        return None
+    pos += 1
+    ps = ()
+    if is_type(tokens, pos, NAMES):
+        ps = maketuple(unquote(tokens[pos][1]))
+        pos += 1
+    if not is_op(tokens, pos, ':'):
+        return None
+    pos += 1
+    gloss = None
+    if is_type(tokens, pos, NAMES):
+        gloss = unquote(tokens[pos][1])
+        pos += 1
+    elif is_type(tokens, pos, ('Regex',)):
+        gloss = unwrap_re(tokens[pos][1])
+        pos += 1
+    morphemes = ()
+    if is_type(tokens, pos, ('Space',)) and is_op(tokens, pos + 1, '['):
+        mpos = skip_space(tokens, pos + 2)
+        morphs = []
+        parsed = rd_fullgloss(tokens, mpos)
+        while parsed:
+            morphs.append(parsed[0])
+            mpos = parsed[1]
+            parsed = rd_fullgloss(tokens, mpos)
+        mpos = skip_space(tokens, mpos)
+        if is_op(tokens, mpos, ']'):
+            morphemes = tuple(morphs)
+            pos = mpos + 1
+    return Gloss(form, ps, gloss, morphemes), pos
+
+
+def rd_stringgloss(tokens, pos):
+    """plain gloss string, as in stringgloss_parser()"""
+    if not is_type(tokens, pos, NAMES) or not is_op(tokens, pos + 1, ':'):
+        return None
+    form = unquote(tokens[pos][1])
+    pos += 2
+    ps = []
+    if pos < len(tokens) and tokens[pos][1] in PSLABELS:
+        ps.append(tokens[pos][1])
+        pos += 1
+        while is_op(tokens, pos, '/') and pos + 1 < len(tokens) and tokens[pos+1][1] in PSLABELS:
+            ps.append(tokens[pos+1][1])
+            pos += 2
+    if not is_op(tokens, pos, ':'):
+        return None
+    pos += 1
+    gloss = None
+    if is_type(tokens, pos, NAMES):
+        gloss = unquote(tokens[pos][1])
+        pos += 1
+    morphemes = ()
+    if is_type(tokens, pos, ('Space',)) and is_op(tokens, pos + 1, '['):
+        parsed = rd_stringgloss(tokens, pos + 2)
+        if parsed:
+            morphs = [parsed[0]]
+            mpos = parsed[1]
+            while is_type(tokens, mpos, ('Space',)):
+                parsed = rd_stringgloss(tokens, mpos + 1)
+                if not parsed:
+                    break
+                morphs.append(parsed[0])
+                mpos = parsed[1]
+            if is_op(tokens, mpos, ']'):
+                morphemes = tuple(morphs)
+                pos = mpos + 1
+    return Gloss(form, tuple(ps), gloss, morphemes), pos
+
+
+def rd_func_clause(tokens, pos):
+    """add/apply/lookup/parallel/sequential/firstmatch ... [parse|decompose name] | rules name"""
+    if (
+            is_keyword(tokens, pos, 'rules') and is_type(tokens, pos + 1, ('Space',))
+            and is_type(tokens, pos + 2, NAMES)
+    ):
+        return ('rules', unquote(tokens[pos+2][1])), pos + 3
+    funcs = []
+    while pos < len(tokens) and tokens[pos][0] == 'Name':
+        value = tokens[pos][1]
+        if value == 'lookup':
+            pos = skip_space(tokens, pos + 1)
+        elif value in ('add', 'apply', 'parallel', 'sequential', 'firstmatch') and is_type(tokens, pos + 1, ('Space',)):
+            pos += 2
+        else:
+            break
+        funcs.append(value)
+    if not funcs:
+        return None
+    if (
+            (is_keyword(tokens, pos, 'parse') or is_keyword(tokens, pos, 'decompose'))
+            and is_type(tokens, pos + 1, ('Space',)) and is_type(tokens, pos + 2, NAMES)
+    ):
+        funcs.extend([tokens[pos][1], unquote(tokens[pos+2][1])])
+        pos += 3
+    return tuple(funcs), pos
+
+
+def rd_plan_step(tokens, pos):
+    """stage clause or return clause of a plan"""
+    if (
+            is_keyword(tokens, pos, 'stage') and is_type(tokens, pos + 1, ('Space',))
+            and is_type(tokens, pos + 2, NAMES) and is_type(tokens, pos + 3, ('Space',))
+    ):
+        parsed = rd_func_clause(tokens, pos + 4)
+        if parsed:
+            return (unquote(tokens[pos+2][1]), parsed[0]), skip_space(tokens, parsed[1])
+    if (
+            is_keyword(tokens, pos, 'return') and is_type(tokens, pos + 1, ('Space',))
+            and is_keyword(tokens, pos + 2, 'if') and is_type(tokens, pos + 3, ('Space',))
+            and is_type(tokens, pos + 4, NAMES)
+    ):
+        return ('return', unquote(tokens[pos+4][1])), skip_space(tokens, pos + 5)
+    return None
+
+
+def rd_pattern(tokens, pos):
+    """pattern select | mark"""
+    if not is_keyword(tokens, pos, 'pattern') or not is_type(tokens, pos + 1, ('Space',)):
+        return None
+    select = rd_fullgloss(tokens, pos + 2)
+    if not select:
+        return None
+    pos = select[1]
+    if not (
+            is_type(tokens, pos, ('Space',)) and is_op(tokens, pos + 1, '|')
+            and is_type(tokens, pos + 2, ('Space',))
+    ):
+        return None
+    mark = rd_fullgloss(tokens, pos + 3)
+    if not mark:
+        return None
+    return Pattern(select[0], mark[0]), skip_space(tokens, mark[1])
+
+
+def rd_grammar(tokens):
+    """plan and pattern sections, as in parse(); returns (dict, position)"""
+    if not is_keyword(tokens, 0, 'plan'):
+        return None, 0
+    pos = skip_space(tokens, 1)
+    plan = []
+    while (
+            is_keyword(tokens, pos, 'for') and is_type(tokens, pos + 1, ('Space',))
+            and is_type(tokens, pos + 2, NAMES) and is_op(tokens, pos + 3, ':')
+    ):
+        name = unquote(tokens[pos+2][1])
+        pos = skip_space(tokens, pos + 4)
+        steps = []
+        parsed = rd_plan_step(tokens, pos)
+        while parsed:
+            steps.append(parsed[0])
+            pos = parsed[1]
+            parsed = rd_plan_step(tokens, pos)
+        plan.append((name, steps))
+    if not plan:
+        return None, pos
+    sections = []
+    while (
+            is_keyword(tokens, pos, 'section') and is_type(tokens, pos + 1, ('Space',))
+            and is_type(tokens, pos + 2, NAMES)
+    ):
+        name = unquote(tokens[pos+2][1])
+        pos = skip_space(tokens, pos + 3)
+        patterns = []
+        parsed = rd_pattern(tokens, pos)
+        while parsed:
+            patterns.append(parsed[0])
+            pos = parsed[1]
+            parsed = rd_pattern(tokens, pos)
+        sections.append((name, patterns))
+    return {'plan': dict(plan), 'patterns': dict(sections)}, pos
+
+
+def parse_gloss(string):
+    """parse gloss pattern (with regexes and splitters) into Gloss
+
+    Same as fullgloss_parser().parse(tokenize(string)), trailing
+    tokens are ignored.
+    """
+    tokens = lex_gloss(string)
+    parsed = rd_fullgloss(tokens, 0)
+    if not parsed:
+        raise parse_failure(string, tokens, 0)
+    return parsed[0]
+
+
+def parse_gloss_string(string):
+    """parse plain gloss string into Gloss
+
+    Same as stringgloss_parser().parse(str_tokenize(string)).
+    """
+    tokens = lex_string(string)
+    parsed = rd_stringgloss(tokens, 0)
+    if not parsed or parsed[1] < len(tokens):
+        raise parse_failure(string, tokens, parsed[1] if parsed else 0)
+    return parsed[0]
+
+
+def parse_grammar(string):
+    """parse grammar text, same as parse(tokenize(string))"""
+    tokens = lex_gloss(string)
+    gdict, pos = rd_grammar(tokens)
+    if gdict is None or pos < len(tokens):
+        raise parse_failure(u'grammar', tokens, pos)
+    return gdict
+
+
 def preprocess(gstring):
     mdict = {}
     lines = gstring.split('\n')
@@ -180,9 +505,18 @@ class Grammar(object):
     def __init__(self,filename,encoding='utf-8'):
         with open(filename, 'r', encoding=encoding) as gf:
             text = preprocess(gf.read())
-            gdict = parse(tokenize(text))
+            gdict = parse_grammar(text)
             self.plan = gdict['plan']
             self.patterns = gdict['patterns']
+        # dabased scripts used by the sentence plan (stage N rules "file"),
+        # with paths relative to the grammar file
+        self.scripts = {}
+        for step in self.plan.get('sentence', ()):
+            if step[1][0] == 'rules':
+                # imported here since dabased depends on this module
+                from daba.dabased import ScriptParser
+                path = os.path.join(os.path.dirname(filename), step[1][1])
+                self.scripts[step[1][1]] = list(ScriptParser(path))
 
 import unittest
 
@@ -224,5 +558,90 @@ pattern :: [ la::] | :v: [:v: ::PROG]
         self.assertEquals(str(self.gmin), str(parse(tokenize(self.minimal))))
         self.assertEquals(str(self.greal), str(parse(tokenize(self.real))))
 
+    def assertSameError(self, new, old, string):
+        with self.assertRaises((NoParseError, LexerError)) as expected:
+            old(string)
+        with self.assertRaises(type(expected.exception)) as got:
+            new(string)
+        return expected.exception, got.exception
+
+    def test_rd_gloss(self):
+        for fg in [
+                u':v: [a:b:C [x::]]',
+                u':v: [ a:b:C  x:: ]',
+                u'"a b":n:"C D"',
+                u'<re>^b.*</re>:v:<re>A</re>',
+                u'{a|b}::',
+                u'{<re>.*</re>|la}:v: [::]',
+                u'a:b:C [x::',
+                ]:
+            self.assertEqual(parse_gloss(fg), fullgloss_parser().parse(tokenize(fg)))
+
+    def test_rd_gloss_string(self):
+        for sg in [
+                u'a:n:b',
+                u'a:n/v:b',
+                u'a::',
+                u'a:n:b [c:v:d e::f]',
+                u'a:v:b [c:v:d [e::f]]',
+                ]:
+            self.assertEqual(parse_gloss_string(sg), stringgloss_parser().parse(str_tokenize(sg)))
+
+    def test_rd_grammar(self):
+        plan = """
+plan
+for token:
+stage 0 add parallel parse inflection
+stage 0 apply lookup
+return if parsed
+stage 1 add sequential decompose "n_v"
+for sentence:
+stage 0 rules "disamb.txt"
+section inflection
+pattern :n: [ {@|<re>w</re>}:: ] | :n: [:n: w:mrph:PL]
+section n_v
+section empty
+"""
+        for grammar in (self.minimal, self.real, plan):
+            self.assertEqual(repr(parse_grammar(grammar)), repr(parse(tokenize(grammar))))
+        self.assertEqual(parse_grammar(plan)['plan']['sentence'], [('0', ('rules', 'disamb.txt'))])
+
+    def test_rd_errors(self):
+        fullgloss = lambda s: fullgloss_parser().parse(tokenize(s))
+        stringgloss = lambda s: stringgloss_parser().parse(str_tokenize(s))
+        grammar = lambda s: parse(tokenize(s))
+        # lexer errors
+        expected, got = self.assertSameError(parse_gloss, fullgloss, u'a<b::')
+        self.assertEqual(got.place, expected.place)
+        expected, got = self.assertSameError(parse_grammar, grammar, u'plan for token: stage 0 <b')
+        self.assertEqual(got.place, expected.place)
+        # parse errors in glosses are reported at the start of the gloss
+        # or at the first unconsumed token
+        for new, old, string, pos in [
+                (parse_gloss, fullgloss, u'a:v', 0),
+                (parse_gloss, fullgloss, u'[::]', 0),
+                (parse_gloss_string, stringgloss, u'a:x:b', 0),
+                (parse_gloss_string, stringgloss, u'a:n', 0),
+                (parse_gloss_string, stringgloss, u'a:n:b extra', 5),
+                (parse_gloss_string, stringgloss, u'a:n:b [c:v:d', 5),
+                ]:
+            expected, got = self.assertSameError(new, old, string)
+            self.assertEqual(got.state.pos, pos)
+        # parse errors in grammars point to the same token as parse()
+        for string in [
+                u'section n pattern :: | ::',
+                u'plan for token: stage x\n',
+                u'plan for token: stage 0 add lookup section n pattern :: ::',
+                u'plan for token: stage 0 add lookup\nreturn parsed',
+                ]:
+            expected, got = self.assertSameError(parse_grammar, grammar, string)
+            self.assertEqual(got.state.pos, expected.state.pos)
+
+    def test_rd_sample_grammar(self):
+        samples = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'docs', 'samples')
+        with open(os.path.join(samples, 'bamana.gram.txt'), encoding='utf-8') as gf:
+            text = preprocess(gf.read())
+        self.assertEqual(repr(parse_grammar(text)), repr(parse(tokenize(text))))
+
 if __name__ == '__main__':
     unittest.main()
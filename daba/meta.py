@@ -26,9 +26,8 @@ from xml.parsers.expat import ExpatError
 from collections import namedtuple, defaultdict
 import tempfile
 import shutil
-import csv
-import uuid
 import daba.formats
+from daba.metadb import open_metadb
 
 
 class MetaData(object):
@@ -215,144 +214,6 @@ class DataPanel(wx.ScrolledWindow):
         return self.builder.getWidgetValue(wtype, widget)
 
 
-class MetaDB(object):
-    'Storage for reusable metadata values'
-    def __init__(self, dbfile, secname, fieldnames, keyfield=None, idcolumn="uuid", namesep=":"):
-        self._map = {}
-        self._strmap = {}
-        self.dbfile = dbfile
-        self.secname = secname
-        self.namesep = namesep
-        self.fieldnames = fieldnames
-        self.idcolumn = idcolumn
-        self.keyfield = keyfield
-        if os.path.exists(self.dbfile):
-            with open(dbfile, 'r', encoding='utf-8') as csvfile:
-                dbreader = csv.DictReader(csvfile, restval='')
-                self.csvnames = dbreader.fieldnames
-                for row in dbreader:
-                    row = self._decode_row(row)
-                    key = row[self.idcolumn]
-                    self._map[key] = row
-                    self._strmap[self._make_keystring(row)] = key
-        else:
-            self.csvnames = self.fieldnames
-
-    def __contains__(self, key):
-        return key in self._map
-
-    def __getitem__(self, key):
-        return self._map[key]
-
-    def _strip_secname(self, mkey):
-        prefix = self.secname + self.namesep
-        if mkey.startswith(prefix):
-            return mkey[len(prefix):]
-        return mkey
-
-    def _decode_row(self, row):
-        utf = dict((self._strip_secname(k),v) for k,v in row.items())
-        if self.idcolumn not in utf.keys():
-            key = self._add_uuid(utf)
-        return utf
-
-    def _add_uuid(self, mdict):
-        key = str(uuid.uuid4())
-        mdict[self.idcolumn] = key
-        return key
-
-    def _remove_uuid(self, mdict):
-        return dict((k,v) for k,v in mdict.items() if k != self.idcolumn)
-
-    def _add_secname(self, key):
-        return self.namesep.join([self.secname, key])
-    
-    def _encode_row(self, row):
-        utf = {}
-        for k,v in row.items():
-            utf[self._add_secname(k)] = v
-        return utf
-
-    def _normalize_row(self, row):
-        for k,v in row.items():
-            if row[k] in [0, "0", 'inconnu']:
-                row[k] = ""
-        return row
-
-    def _row_as_string(self, row):
-        try:
-            return u' '.join([row[self._strip_secname(field)] for field in self.csvnames if self._strip_secname(field) != self.idcolumn])
-        except (KeyError, TypeError):
-            print(self.csvnames, row)
-    
-    def _make_keystring(self, mdict):
-        return self._row_as_string(self._normalize_row(mdict))
-
-    def is_not_trivial(self, mdict):
-        return any(self._normalize_row(mdict).values())
-
-    def has_keyfield(self, mdict):
-        return self.keyfield in mdict
-
-    def is_known_by_key(self, mdict):
-        if self.idcolumn in mdict:
-            return mdict[self.idcolumn] in self._map
-        else:
-            return False
-
-    def _match_content(self, mdict, dbentry):
-        return self._normalize_row(mdict) == self._remove_uuid(dbentry)
-
-    def content_matches(self, mdict):
-        return any([self._match_content(mdict, dbentry) for dbentry in self._map.values()])
-
-    def append(self, mdict):
-        key = self._add_uuid(mdict)
-        dbentry = self._normalize_row(mdict)
-        self._map[key] = dbentry
-        self._strmap[self._make_keystring(mdict)] = key
-        self.write()
-        return dbentry
-
-    def update(self, key, mdict):
-        self._map[key] = self._normalize_row(mdict)
-        self.write()
-
-    def getEntryByUUID(self, uuid):
-        return self._map[uuid]
-
-    def getEntryByKey(self, key):
-        return self._map[self._strmap[key]]
-
-    def getEntryUUID(self, mdict):
-        if self.is_not_trivial(mdict) and self.has_keyfield(mdict):
-            if self.is_known_by_key(mdict):
-                return mdict[self.idcolumn]
-            elif self.content_matches(mdict):
-                for key, dbentry in self._map.items():
-                    if self._match_content(mdict, dbentry):
-                        return key
-        else:
-            return None
-
-    def getList(self):
-        return list(self._strmap.keys())
-
-    def write(self):
-        if self._map:
-            with open(self.dbfile, 'w', encoding='utf-8') as csvfile:
-                dbwriter = csv.DictWriter(csvfile, self.fieldnames, restval='')
-                dbwriter.writeheader()
-                rows = self._map.values()
-                if self.keyfield:
-                    try:
-                        rows = sorted(rows, key=lambda d: d[self.keyfield])
-                    except(KeyError):
-                        pass
-                for row in rows:
-                    dbwriter.writerow(self._encode_row(row))
-
-
 class MetaPanel(wx.Panel):
     'Panel holding metadata'
     def __init__(self, parent, config=None, section=None, *args, **kwargs):
@@ -370,7 +231,7 @@ class MetaPanel(wx.Panel):
     
         if self.hasdbfile:
             fieldnames = self.config.getSectionFieldnames(self.section)
-            self.db = MetaDB(self.secattrs['dbfile'], self.section, fieldnames, keyfield=self.secattrs['keyfield'])
+            self.db = open_metadb(self.secattrs['dbfile'], self.section, fieldnames, keyfield=self.secattrs['keyfield'])
             searchbox = wx.BoxSizer(wx.HORIZONTAL)
             label = wx.StaticText(self, wx.ID_ANY, "Chercher dans la liste")
             choicelist = self.db.getList() or ['']
@@ -455,15 +316,16 @@ class MetaPanel(wx.Panel):
                 pass
 
     def saveDBEntries(self):
-        for panel in self.panels:
-            mdict = dict(panel.getPanelData())
-            dbentrykey = self.db.getEntryUUID(mdict)
-            if dbentrykey:
-                self.db.update(dbentrykey, mdict)
-            else:
-                dbentry = self.db.append(mdict)
-                panel.setPanelData(dbentry.items())
-                self.selector.AutoComplete(choices=self.db.getList())
+        with self.db.transaction():
+            for panel in self.panels:
+                mdict = dict(panel.getPanelData())
+                dbentrykey = self.db.getEntryUUID(mdict)
+                if dbentrykey:
+                    self.db.update(dbentrykey, mdict)
+                else:
+                    dbentry = self.db.append(mdict)
+                    panel.setPanelData(dbentry.items())
+                    self.selector.AutoComplete(choices=self.db.getList())
 
 
 class MetaNotebook(wx.Notebook):
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Storage for reusable metadata values of the metadata editor (meta.py):
+# CSV files, one per section, or an SQLite database.
+#
+# This file is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+import os
+import csv
+import json
+import uuid
+import hashlib
+import sqlite3
+import argparse
+from contextlib import contextmanager
+
+SQLITE_EXTENSIONS = ('.sqlite', '.sqlite3', '.db')
+
+
+class MetaDB(object):
+    'Storage for reusable metadata values'
+    def __init__(self, dbfile, secname, fieldnames, keyfield=None, idcolumn="uuid", namesep=":"):
+        self._map = {}
+        self._strmap = {}
+        self.dbfile = dbfile
+        self.secname = secname
+        self.namesep = namesep
+        self.fieldnames = fieldnames
+        self.idcolumn = idcolumn
+        self.keyfield = keyfield
+        self._batch = 0
+        self._dirty = False
+        if os.path.exists(self.dbfile):
+            with open(dbfile, 'r', encoding='utf-8') as csvfile:
+                dbreader = csv.DictReader(csvfile, restval='')
+                self.csvnames = dbreader.fieldnames
+                for row in dbreader:
+                    row = self._decode_row(row)
+                    key = row[self.idcolumn]
+                    self._map[key] = row
+                    self._strmap[self._make_keystring(row)] = key
+        else:
+            self.csvnames = self.fieldnames
+
+    def __contains__(self, key):
+        return key in self._map
+
+    def __getitem__(self, key):
+        return self._map[key]
+
+    def _strip_secname(self, mkey):
+        prefix = self.secname + self.namesep
+        if mkey.startswith(prefix):
+            return mkey[len(prefix):]
+        return mkey
+
+    def _decode_row(self, row):
+        utf = dict((self._strip_secname(k),v) for k,v in row.items())
+        if self.idcolumn not in utf.keys():
+            self._add_uuid(utf)
+        return utf
+
+    def _add_uuid(self, mdict):
+        key = str(uuid.uuid4())
+        mdict[self.idcolumn] = key
+        return key
+
+    def _remove_uuid(self, mdict):
+        return dict((k,v) for k,v in mdict.items() if k != self.idcolumn)
+
+    def _add_secname(self, key):
+        return self.namesep.join([self.secname, key])
+    
+    def _encode_row(self, row):
+        utf = {}
+        for k,v in row.items():
+            utf[self._add_secname(k)] = v
+        return utf
+
+    def _normalize_row(self, row):
+        for k,v in row.items():
+            if row[k] in [0, "0", 'inconnu']:
+                row[k] = ""
+        return row
+
+    def _row_as_string(self, row):
+        try:
+            return u' '.join([row[self._strip_secname(field)] for field in self.csvnames if self._strip_secname(field) != self.idcolumn])
+        except (KeyError, TypeError):
+            print(self.csvnames, row)
+    
+    def _make_keystring(self, mdict):
+        return self._row_as_string(self._normalize_row(mdict))
+
+    def is_not_trivial(self, mdict):
+        return any(self._normalize_row(mdict).values())
+
+    def has_keyfield(self, mdict):
+        return self.keyfield in mdict
+
+    def is_known_by_key(self, mdict):
+        if self.idcolumn in mdict:
+            return mdict[self.idcolumn] in self
+        else:
+            return False
+
+    def _match_content(self, mdict, dbentry):
+        return self._normalize_row(mdict) == self._remove_uuid(dbentry)
+
+    def content_matches(self, mdict):
+        return any([self._match_content(mdict, dbentry) for dbentry in self._map.values()])
+
+    def append(self, mdict):
+        key = self._add_uuid(mdict)
+        dbentry = self._normalize_row(mdict)
+        self._map[key] = dbentry
+        self._strmap[self._make_keystring(mdict)] = key
+        self._changed()
+        return dbentry
+
+    def update(self, key, mdict):
+        self._map[key] = self._normalize_row(mdict)
+        self._changed()
+
+    def _changed(self):
+        if self._batch:
+            self._dirty = True
+        else:
+            self.write()
+
+    @contextmanager
+    def transaction(self):
+        """group changes, the file is written once at the end of the block"""
+        self._batch += 1
+        try:
+            yield self
+        finally:
+            self._batch -= 1
+            if not self._batch and self._dirty:
+                self._dirty = False
+                self.write()
+
+    def getEntryByUUID(self, uuid):
+        return self._map[uuid]
+
+    def getEntryByKey(self, key):
+        return self._map[self._strmap[key]]
+
+    def getEntryUUID(self, mdict):
+        if self.is_not_trivial(mdict) and self.has_keyfield(mdict):
+            if self.is_known_by_key(mdict):
+                return mdict[self.idcolumn]
+            elif self.content_matches(mdict):
+                for key, dbentry in self._map.items():
+                    if self._match_content(mdict, dbentry):
+                        return key
+        else:
+            return None
+
+    def getList(self):
+        return list(self._strmap.keys())
+
+    def entries(self):
+        """all entries, sorted by keyfield if possible"""
+        rows = self._map.values()
+        if self.keyfield:
+            try:
+                rows = sorted(rows, key=lambda d: d[self.keyfield])
+            except(KeyError):
+                pass
+        return rows
+
+    def export_csv(self, filename):
+        with open(filename, 'w', encoding='utf-8') as csvfile:
+            dbwriter = csv.DictWriter(csvfile, self.fieldnames, restval='')
+            dbwriter.writeheader()
+            for row in self.entries():
+                dbwriter.writerow(self._encode_row(row))
+
+    def write(self):
+        if self._map:
+            self.export_csv(self.dbfile)
+
+
+class SqliteMetaDB(MetaDB):
+    """MetaDB stored in an SQLite database
+
+    Sections may share a database file. Each entry is stored as a JSON
+    object together with its keyfield value, its string representation
+    (see getList) and a hash of its content, all indexed, so lookups do
+    not scan the entries. Every change is committed at once, or at the
+    end of a transaction() block.
+    """
+    schema = [
+        """CREATE TABLE IF NOT EXISTS metadb_sections (
+            section TEXT PRIMARY KEY,
+            fieldnames TEXT NOT NULL,
+            keyfield TEXT)""",
+        """CREATE TABLE IF NOT EXISTS metadb_entries (
+            section TEXT NOT NULL,
+            uuid TEXT NOT NULL,
+            keyvalue TEXT,
+            keystring TEXT,
+            hash TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (section, uuid))""",
+        "CREATE INDEX IF NOT EXISTS metadb_keyvalue ON metadb_entries (section, keyvalue)",
+        "CREATE INDEX IF NOT EXISTS metadb_keystring ON metadb_entries (section, keystring)",
+        "CREATE INDEX IF NOT EXISTS metadb_hash ON metadb_entries (section, hash)",
+        ]
+
+    def __init__(self, dbfile, secname, fieldnames=None, keyfield=None, idcolumn="uuid", namesep=":"):
+        """fieldnames and keyfield are kept in the database, if not given
+        the stored ones are used"""
+        self.dbfile = dbfile
+        self.secname = secname
+        self.namesep = namesep
+        self.idcolumn = idcolumn
+        self._batch = 0
+        self.conn = sqlite3.connect(dbfile)
+        with self.conn:
+            for statement in self.schema:
+                self.conn.execute(statement)
+            stored = self.conn.execute(
+                "SELECT fieldnames, keyfield FROM metadb_sections WHERE section = ?", (secname,)).fetchone()
+            if stored:
+                if fieldnames is None:
+                    fieldnames = json.loads(stored[0])
+                if keyfield is None:
+                    keyfield = stored[1]
+            self.conn.execute(
+                "INSERT OR REPLACE INTO metadb_sections VALUES (?, ?, ?)",
+                (secname, json.dumps(fieldnames or []), keyfield))
+        self.fieldnames = fieldnames or []
+        self.csvnames = self.fieldnames
+        self.keyfield = keyfield
+
+    def close(self):
+        self.conn.close()
+
+    def __contains__(self, key):
+        return self.conn.execute(
+            "SELECT 1 FROM metadb_entries WHERE section = ? AND uuid = ?",
+            (self.secname, key)).fetchone() is not None
+
+    def __getitem__(self, key):
+        return self.getEntryByUUID(key)
+
+    def _row_as_string(self, row):
+        return u' '.join([str(row.get(self._strip_secname(field), '')) for field in self.csvnames if self._strip_secname(field) != self.idcolumn])
+
+    def _content_hash(self, row):
+        content = json.dumps(row, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def _store(self, key, dbentry):
+        keystring = self._make_keystring(dbentry)
+        keyvalue = dbentry.get(self._strip_secname(self.keyfield)) if self.keyfield else None
+        self.conn.execute(
+            """INSERT INTO metadb_entries VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (section, uuid) DO UPDATE SET keyvalue = excluded.keyvalue,
+            keystring = excluded.keystring, hash = excluded.hash, data = excluded.data""",
+            (self.secname, key, keyvalue, keystring,
+             self._content_hash(self._remove_uuid(dbentry)),
+             json.dumps(dbentry, ensure_ascii=False, default=str)))
+
+    def _changed(self):
+        if not self._batch:
+            self.conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """group changes into a single transaction, rolled back on error"""
+        self._batch += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch -= 1
+            if not self._batch:
+                self.conn.rollback()
+            raise
+        self._batch -= 1
+        if not self._batch:
+            self.conn.commit()
+
+    def append(self, mdict):
+        key = self._add_uuid(mdict)
+        dbentry = self._normalize_row(mdict)
+        self._store(key, dbentry)
+        self._changed()
+        return dbentry
+
+    def update(self, key, mdict):
+        self._store(key, self._normalize_row(mdict))
+        self._changed()
+
+    def _find_content(self, mdict):
+        """uuid of the first entry with the same content as mdict, or None"""
+        digest = self._content_hash(self._normalize_row(mdict))
+        for key, data in self.conn.execute(
+                "SELECT uuid, data FROM metadb_entries WHERE section = ? AND hash = ? ORDER BY rowid",
+                (self.secname, digest)):
+            if self._match_content(mdict, json.loads(data)):
+                return key
+        return None
+
+    def content_matches(self, mdict):
+        return self._find_content(mdict) is not None
+
+    def getEntryByUUID(self, uuid):
+        row = self.conn.execute(
+            "SELECT data FROM metadb_entries WHERE section = ? AND uuid = ?",
+            (self.secname, uuid)).fetchone()
+        if row is None:
+            raise KeyError(uuid)
+        return json.loads(row[0])
+
+    def getEntryByKey(self, key):
+        row = self.conn.execute(
+            "SELECT data FROM metadb_entries WHERE section = ? AND keystring = ? ORDER BY rowid DESC LIMIT 1",
+            (self.secname, key)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def getEntryUUID(self, mdict):
+        if self.is_not_trivial(mdict) and self.has_keyfield(mdict):
+            if self.is_known_by_key(mdict):
+                return mdict[self.idcolumn]
+            return self._find_content(mdict)
+        else:
+            return None
+
+    def getList(self):
+        return [keystring for (keystring,) in self.conn.execute(
+            """SELECT keystring FROM metadb_entries WHERE section = ? AND keystring IS NOT NULL
+            GROUP BY keystring ORDER BY MIN(rowid)""", (self.secname,))]
+
+    def entries(self):
+        """all entries, sorted by keyfield"""
+        return [json.loads(data) for (data,) in self.conn.execute(
+            "SELECT data FROM metadb_entries WHERE section = ? ORDER BY keyvalue, rowid",
+            (self.secname,))]
+
+    def write(self):
+        self.conn.commit()
+
+    def import_csv(self, filename):
+        """add entries from a CSV file written by MetaDB (entries with the
+        same uuid are replaced), return number of entries read"""
+        count = 0
+        with open(filename, 'r', encoding='utf-8') as csvfile, self.transaction():
+            for row in csv.DictReader(csvfile, restval=''):
+                row = self._decode_row(row)
+                self._store(row[self.idcolumn], row)
+                count += 1
+        return count
+
+
+def open_metadb(dbfile, *args, **kwargs):
+    """MetaDB for dbfile: SqliteMetaDB for .sqlite/.sqlite3/.db files,
+    CSV file otherwise"""
+    if os.path.splitext(dbfile)[1].lower() in SQLITE_EXTENSIONS:
+        return SqliteMetaDB(dbfile, *args, **kwargs)
+    return MetaDB(dbfile, *args, **kwargs)
+
+
+def sqlite_sections(dbfile):
+    """names of the sections stored in an SQLite database"""
+    conn = sqlite3.connect(dbfile)
+    try:
+        return [name for (name,) in conn.execute("SELECT section FROM metadb_sections ORDER BY section")]
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+
+def main():
+    aparser = argparse.ArgumentParser(description='Daba suite. Import and export metadata values between CSV files and SQLite database.')
+    aparser.add_argument('command', choices=['import', 'export'], help='import CSV file into database, or export a database section into CSV file')
+    aparser.add_argument('database', help='SQLite database file')
+    aparser.add_argument('csvfile', help='CSV file')
+    aparser.add_argument('-s', '--section', help='Metadata section (default: taken from CSV field names on import, the only section on export)')
+    aparser.add_argument('-k', '--keyfield', help='Key field of the section (on import)')
+    args = aparser.parse_args()
+
+    if args.command == 'import':
+        with open(args.csvfile, 'r', encoding='utf-8') as csvfile:
+            fieldnames = csv.DictReader(csvfile).fieldnames or []
+        section = args.section
+        if not section:
+            prefixes = set(name.split(':')[0] for name in fieldnames if ':' in name)
+            if len(prefixes) != 1:
+                aparser.error('can not guess section from CSV field names, use --section')
+            section = prefixes.pop()
+        db = SqliteMetaDB(args.database, section, fieldnames, keyfield=args.keyfield)
+        count = db.import_csv(args.csvfile)
+        print(u'Imported {0} entries into section {1}'.format(count, section))
+    else:
+        section = args.section
+        if not section:
+            sections = sqlite_sections(args.database)
+            if len(sections) != 1:
+                aparser.error('use --section to choose one of: {0}'.format(u', '.join(sections)))
+            section = sections[0]
+        db = SqliteMetaDB(args.database, section)
+        db.export_csv(args.csvfile)
+        print(u'Exported section {0}'.format(section))
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
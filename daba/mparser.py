@@ -16,9 +16,12 @@
 import os
 import argparse
 import sys
+import time
+import json
 import pickle
+import itertools
 import funcparserlib.lexer
-import pkg_resources
+from collections import Counter
 
 import daba.formats
 import daba.newmorph
@@ -26,7 +29,7 @@ import daba.grammar
 from daba.ntgloss import Gloss, emptyGloss
 from daba.plugins import OrthographyConverter
 from daba.plugins.tokenizer import TokenizerData
-from daba.orthography import tones_match, detone
+from daba.orthography import tones_match_any, detone
 
 class Tokenizer(object):
     def __init__(self):
@@ -107,6 +110,9 @@ class ChainDict(object):
                 result.add(prefix)
         return result
 
+    def has_prefix(self, prefix):
+        return any(dic.has_prefix(prefix) for dic in self.dictlist)
+
     def items(self):
         result = []
         keysseen = []
@@ -161,12 +167,26 @@ class DictLoader(object):
             sys.stderr.write(u'LOADED DICT {}\n'.format(dic))
         self.dictionary.add(dic)
 
-    def addfile(self, dictfile):
-        dic = daba.formats.DictReader(dictfile).get()
+    def addfile(self, dictfile, jobs=1):
+        dic = daba.formats.DictReader(dictfile, jobs=jobs).get()
         if not dic.hash in self.dictionary.ids:
             self.add(dic)
             return dic.hash
 
+    def addfiles(self, dictfiles, jobs=1):
+        """compile several dictionaries in parallel, add them in the given order"""
+        if jobs == 1:
+            return [self.addfile(dictfile) for dictfile in dictfiles]
+        added = []
+        for reader in daba.formats.read_dictionaries(dictfiles, jobs=jobs):
+            dic = reader.get()
+            if not dic.hash in self.dictionary.ids:
+                self.add(dic)
+                added.append(dic.hash)
+            else:
+                added.append(None)
+        return added
+
     def add(self, dic):
         for d in self.dictionary.dictlist:
             if (dic.lang, dic.name) == (d.lang, d.name):
@@ -230,15 +250,115 @@ class GrammarLoader(object):
             pickle.dump(self.grammar, o)
 
 
+class ParseStats(object):
+    """Collect timings and parser stage statistics per file and per batch"""
+    phases = ('read', 'tokenize', 'convert', 'lemmatize', 'disambiguate', 'write')
+
+    def __init__(self):
+        self.files = []
+        self.current = None
+
+    def start_file(self, filename):
+        self.current = {
+            'file': filename,
+            'time': dict.fromkeys(self.phases + ('total',), 0.0),
+            'tokens': 0,
+            'words': 0,
+            'unparsed': 0,
+            'stages': Counter(),
+            }
+        self.started = time.perf_counter()
+
+    def end_file(self):
+        self.current['time']['total'] = time.perf_counter() - self.started
+        self.files.append(self.current)
+        self.current = None
+
+    def add_time(self, phase, start):
+        if self.current is not None:
+            self.current['time'][phase] += time.perf_counter() - start
+
+    def timed(self, phase, func):
+        """wrap function to add its running time to a phase"""
+        def timed_func(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add_time(phase, start)
+        return timed_func
+
+    def timed_iter(self, phase, iterable):
+        """add time spent producing each item of an iterable to a phase"""
+        it = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add_time(phase, start)
+                return
+            self.add_time(phase, start)
+            yield item
+
+    def count(self, par):
+        """count tokens and word stages in a parsed paragraph"""
+        if self.current is None:
+            return
+        for sttoken, annot in par:
+            self.current['tokens'] += len(annot)
+            for token in annot:
+                if token.type == 'w':
+                    self.current['words'] += 1
+                    self.current['stages'][str(token.stage)] += 1
+                    if not any(g.gloss for g in token.glosslist):
+                        self.current['unparsed'] += 1
+
+    def summary(self, entry):
+        total = entry['time']['total']
+        out = dict(entry)
+        out['stages'] = dict(entry['stages'])
+        out['tokens_per_sec'] = entry['tokens'] / total if total else 0.0
+        out['unparsed_ratio'] = float(entry['unparsed']) / entry['words'] if entry['words'] else 0.0
+        return out
+
+    def report(self):
+        batch = {
+            'files': len(self.files),
+            'time': dict.fromkeys(self.phases + ('total',), 0.0),
+            'tokens': 0,
+            'words': 0,
+            'unparsed': 0,
+            'stages': Counter(),
+            }
+        for entry in self.files:
+            for phase, t in entry['time'].items():
+                batch['time'][phase] += t
+            for key in ('tokens', 'words', 'unparsed'):
+                batch[key] += entry[key]
+            batch['stages'].update(entry['stages'])
+        return {
+            'files': [self.summary(entry) for entry in self.files],
+            'batch': self.summary(batch),
+            }
+
+    def dump(self, filename):
+        with open(filename, 'w', encoding='utf-8') as out:
+            json.dump(self.report(), out, ensure_ascii=False, indent=2)
+
+
 class Processor(object):
     def __init__(self, dictloader=None, grammarloader=None,
                  tokenizer=None, converters=None, detone=False, nolemmas=False,
-                 normalize_orthography=False, has_sentences=False):
+                 normalize_orthography=False, has_sentences=False, stats=None,
+                 maxcandidates=None):
         if converters:
             plugins = OrthographyConverter.get_plugins()
             self.converters = [plugins[c] for c in converters]
         else:
             self.converters = ()
+        self.maxcandidates = maxcandidates
+        self.lexicon = None
         self.tokenizer = tokenizer
         self.detone = detone
         self.normalize_orthography = normalize_orthography
@@ -258,9 +378,19 @@ class Processor(object):
             self.parser = Noparser()
         else:
             self.dictloader = dictloader
+            self.lexicon = dictloader.dictionary
             self.grammar = grammarloader.grammar
             self.parser = daba.newmorph.Parser(self.dictloader.dictionary,
                                           self.grammar, detone=self.detone)
+        # rule-based disambiguation of whole sentences (grammar sentence plan)
+        self.sentence_plan = bool(getattr(self.parser, 'sentence_processing', None))
+        self.stats = stats
+        if stats:
+            self.convert_orthography = stats.timed('convert', self.convert_orthography)
+            self.parser.lemmatize = stats.timed('lemmatize', self.parser.lemmatize)
+            self.filter_parsed = stats.timed('lemmatize', self.filter_parsed)
+            if self.sentence_plan:
+                self.parser.disambiguate = stats.timed('disambiguate', self.parser.disambiguate)
 
     def get_case(self, string):
         string = detone(string)
@@ -278,8 +408,10 @@ class Processor(object):
         for plugin in self.converters:
             converted = []
             for w in wlist:
-                for result in plugin.convert(w):
-                    converted.append(result)
+                # ambiguous converters prune spellings against the
+                # dictionary and stop after maxcandidates
+                candidates = plugin.iter_candidates(w, self.lexicon)
+                converted.extend(itertools.islice(candidates, self.maxcandidates))
             wlist = converted
         # print("->", u'/'.join(wlist))
         return wlist or [word]
@@ -291,16 +423,26 @@ class Processor(object):
             filtered.extend(r[1])
         if not filtered:
             filtered = [g for glosslist in list(zip(*results))[1] for g in glosslist]
-        filtered = list(filter(lambda g: any(tones_match(s, g.form) for s in forms), filtered))
+        filtered = [g for g in filtered if tones_match_any(forms, g.form)]
         if not filtered:
             filtered = [emptyGloss._replace(form=w) for w in forms]
         return stage, filtered
 
-    def parse(self, txt):
+    def parse(self, txt, progress=None):
+        """parse a list of paragraphs
+
+        progress, if given, is called after each paragraph with the number
+        of paragraphs and the number of tokens done so far. It may raise
+        ParseCancelled to stop parsing.
+        """
         self.parsed = []
+        numtokens = 0
         for para in txt:
             par = []
-            for sent in self.sentence_splitter(para):
+            sentences = self.sentence_splitter(para)
+            if self.stats:
+                sentences = self.stats.timed_iter('tokenize', sentences)
+            for sent in sentences:
                 sttoken = daba.formats.PlainToken(('</s>', ''.join(t.value for t in sent)))
                 st = (sttoken, [])
                 par.append(st)
@@ -345,38 +487,126 @@ class Processor(object):
                             annot.append(daba.formats.WordToken(glosslist, normform, str(stage)))
                         else:
                             annot.append(daba.formats.WordToken(glosslist, token.value, str(stage)))
+                if self.sentence_plan:
+                    annot[:] = self.parser.disambiguate(annot)
 
             self.parsed.append(par)
+            if self.stats:
+                self.stats.count(par)
+            if progress:
+                numtokens += sum(len(annot) for sttoken, annot in par)
+                progress(len(self.parsed), numtokens)
         return self.parsed
 
 
-def load_plugins():
-    plugins = {
-        plugin.name: plugin.load()
-        for plugin
-        in pkg_resources.iter_entry_points('daba.plugins')
-    }
+class ParseCancelled(Exception):
+    pass
+
+
+# Pool workers: each worker process builds its own Processor once, from
+# the resources saved in the runtime directory.
+_worker = {}
+
+
+def init_parse_worker(runtimedir, tokenizer='default', converters=(), detone=False,
+                      progress=None, cancel=None, maxcandidates=None):
+    """initialize pool worker process
+
+    progress is a queue receiving (infile, parnum, numpar, numtokens, elapsed)
+    tuples, cancel is an event that stops all workers when set.
+    """
+    if converters:
+        load_plugins(converters)
+    tkz = Tokenizer()
+    tkz.use_method(tokenizer)
+    dl = DictLoader(runtimedir=runtimedir)
+    gr = GrammarLoader(runtimedir=runtimedir)
+    _worker['processor'] = Processor(dl, gr, tokenizer=tkz, converters=converters, detone=detone,
+                                    maxcandidates=maxcandidates)
+    _worker['progress'] = progress
+    _worker['cancel'] = cancel
+
+
+def parse_file_worker(infile, outfile, format='html'):
+    """parse a file in a pool worker, return number of tokens parsed"""
+    pp = _worker['processor']
+    progress = _worker['progress']
+    cancel = _worker['cancel']
+    io = daba.formats.FileWrapper()
+    io.read(infile)
+    numpar = len(io.para)
+    start = time.time()
+    done = [0]
+
+    def report(parnum, numtokens):
+        if cancel is not None and cancel.is_set():
+            raise ParseCancelled(infile)
+        done[0] = numtokens
+        if progress is not None:
+            progress.put((infile, parnum, numpar, numtokens, time.time() - start))
+
+    io.write(outfile, pp.parse(io.para, progress=report), parsed=True, format=format)
+    return done[0]
+
+
+def plugin_entry_points():
+    """return registered orthography plugins as a dict name -> entry point"""
+    # imported here since it is only needed when plugins are used
+    import importlib.metadata
+    eps = importlib.metadata.entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group='daba.plugins')
+    else:
+        eps = eps.get('daba.plugins', ())
+    return dict((ep.name, ep) for ep in eps)
+
+
+def load_plugins(names=None):
+    """import plugins given by names (all registered plugins by default)"""
+    eps = plugin_entry_points()
+    if names is None:
+        names = eps.keys()
+    plugins = {}
+    for name in names:
+        try:
+            plugins[name] = eps[name].load()
+        except KeyError:
+            raise ValueError(u'Unknown orthography conversion: {0} (available: {1})'.format(
+                name, u', '.join(sorted(eps))))
     return plugins
 
 
 def parse_file(infile, outfile, pp, args):
     print('Processing', infile)
+    stats = pp.stats
+    if stats:
+        stats.start_file(infile)
+        start = time.perf_counter()
     io = daba.formats.FileWrapper()
     io.read(infile, sentlist=args.sentlist)
-    io.write(outfile, pp.parse(io.para), parsed=True, format=args.format)
+    if stats:
+        stats.add_time('read', start)
+    parsed = pp.parse(io.para)
+    if stats:
+        start = time.perf_counter()
+    io.write(outfile, parsed, parsed=True, format=args.format)
+    if stats:
+        stats.add_time('write', start)
+        stats.end_file()
     print('Finished', outfile)
 
 
 def main():
-    plugins = load_plugins()
     tkz = Tokenizer()
 
     aparser = argparse.ArgumentParser(description='Daba suite. Command line morphological parser.')
     aparser.add_argument('-i', '--infile', help='Input file (.txt or .html)', default="sys.stdin")
     aparser.add_argument('-o', '--outfile', help='Output file', default="sys.stdout")
-    aparser.add_argument('-s', '--script', action='append', choices=plugins.keys(), default=None, help='Perform orthographic conversion operations (defined in plugins). Conversions will be applied in the order they appear on command line.')
+    aparser.add_argument('-s', '--script', action='append', metavar='PLUGIN', default=None, help='Perform orthographic conversion operations (defined in plugins). Conversions will be applied in the order they appear on command line.')
     aparser.add_argument('-c', '--convert', action='store_true', help="Convert orthography")
+    aparser.add_argument('--max-candidates', type=int, default=None, help="Maximum number of spellings per word produced by ambiguous orthographic conversions")
     aparser.add_argument("-d", "--dictionary", action="append", help="Toolbox dictionary file (may be added multiple times)")
+    aparser.add_argument("-j", "--jobs", type=int, default=1, help="Number of processes to compile dictionaries with")
     aparser.add_argument("-g", "--grammar", help="Grammar specification file")
     aparser.add_argument("-n", "--noparse", action='store_true', help="Do not parse, only process resources")
     aparser.add_argument("-N", "--nolemmas", action='store_true', help="Do not lemmatize, only tokenize input")
@@ -386,23 +616,29 @@ def main():
     aparser.add_argument("-z", "--tokenizer", action='store', choices=tkz.methods, default="default", help="Tokenizer to use")
     aparser.add_argument("-f", "--format", action='store', choices=daba.formats.FileWrapper().output_formats, default="html", help="Output file format")
     aparser.add_argument("-v", "--verbose", action='store_true', help="print info messages on loaded dictionaries")
+    aparser.add_argument("--stats", action='store', default=None, help="Write timings and parser stage statistics (JSON) into a file")
     args = aparser.parse_args()
 
+    if args.script:
+        try:
+            load_plugins(args.script)
+        except ValueError as e:
+            aparser.error(str(e))
     tkz.use_method(args.tokenizer)
+    stats = ParseStats() if args.stats else None
 
     if args.nolemmas:
-        pp = Processor(tokenizer=tkz, converters=args.script, detone=args.detone, nolemmas=True, normalize_orthography=args.convert)
+        pp = Processor(tokenizer=tkz, converters=args.script, detone=args.detone, nolemmas=True, normalize_orthography=args.convert, stats=stats, maxcandidates=args.max_candidates)
     else:
         dl = DictLoader(verbose=args.verbose)
         gr = GrammarLoader()
         if args.dictionary:
-            for dicfile in args.dictionary:
-                dl.addfile(dicfile)
+            dl.addfiles(args.dictionary, jobs=args.jobs)
         if args.grammar:
             gr.load(args.grammar)
     if not args.noparse:
         if not args.nolemmas:
-            pp = Processor(dictloader=dl, grammarloader=gr, tokenizer=tkz, converters=args.script, detone=args.detone, normalize_orthography=args.convert, has_sentences=args.sentlist)
+            pp = Processor(dictloader=dl, grammarloader=gr, tokenizer=tkz, converters=args.script, detone=args.detone, normalize_orthography=args.convert, has_sentences=args.sentlist, stats=stats, maxcandidates=args.max_candidates)
         if args.list:
             with open(args.list, encoding='utf-8') as filelist:
                 for line in filelist:
@@ -412,6 +648,8 @@ def main():
                         parse_file(infile, outfile, pp, args)
         else:
             parse_file(args.infile, args.outfile, pp, args)
+        if stats:
+            stats.dump(args.stats)
     exit(0)
 
 
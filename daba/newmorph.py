@@ -4,6 +4,8 @@
 import re
 from daba.ntgloss import Gloss, CompactGloss, emptyGloss, Pattern, Dictionary
 from daba.orthography import detone, tones_match
+from daba.dabased import StreamEditor
+from daba.formats import WordToken
 
 
 def nullgloss(word):
@@ -122,6 +124,7 @@ class Parser(object):
                 'decompose': self.decompose
                 }
         self.processing = []
+        self.sentence_processing = []
         self.detone = detone
         if grammar is None:
             self.processing.append((0, f_apply(self.lookup), ('apply', 'lookup')))
@@ -129,7 +132,7 @@ class Parser(object):
             self.grammar = grammar
             for step in self.grammar.plan['token']:
                 if step[0] == 'return':
-                    self.processing.append((step[0], lambda l: filter(self.funcdict[step[1]], l), step[1]))
+                    self.processing.append((step[0], lambda l, f=self.funcdict[step[1]]: filter(f, l), step[1]))
                 else:
                     funclist = []
                     for f in step[1]:
@@ -138,6 +141,13 @@ class Parser(object):
                         except KeyError:
                             funclist.append(self.grammar.patterns[f])
                     self.processing.append((step[0], funclist[0](*funclist[1:]), step[1]))
+            # sentence plan: dabased scripts compiled into indexed passes
+            self.editor = StreamEditor()
+            scripts = getattr(self.grammar, 'scripts', {})
+            for step in self.grammar.plan.get('sentence', ()):
+                if step[1][0] == 'rules':
+                    passes = self.editor.compile_script(scripts[step[1][1]])
+                    self.sentence_processing.append((step[0], passes, step[1]))
 
     def lookup_gloss(self, gloss, gdict):
         'Gloss, Dictionary -> tuple(Gloss)'
@@ -300,12 +310,19 @@ class Parser(object):
         filtered = self.filter_duplicates(parsedword)
         return (stage, filtered)
 
-    def disambiguate(sent):
-        # TODO: STUB
-        for step in self.grammar.plan['sentence']:
-            pass
-                
+    def disambiguate(self, sent):
+        '[token] -> [token]'
+        for step, passes, stagestr in self.sentence_processing:
+            sent = list(self.editor.apply_passes(passes, sent))
+        return sent
+
     def process(self, tokens):
-        '[[word]] -> [[(stage, [Gloss])]]'
+        '[[word]] -> [[WordToken]]'
+        result = []
         for sent in tokens:
-             return self.disambiguate([self.lemmatize(word) for word in sent])
+            annot = []
+            for word in sent:
+                stage, glosslist = self.lemmatize(word)
+                annot.append(WordToken(glosslist, word, str(stage)))
+            result.append(self.disambiguate(annot))
+        return result
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import re
+import functools
 import unicodedata
 from collections import namedtuple
 from collections.abc import MutableSequence
@@ -23,31 +24,49 @@ class Syllable(namedtuple('Syllable', 'raw consonant vowel1 tone1 vowel2 tone2 n
         return self.vowel1 + self.vowel2
 
 
+SYLLABLE = re.compile(r"""
+        (                                           # raw: whole syllable group
+            ([^auieoɛɔƐƆ\u030c\u0300\u0301\u0302]*)   # consonant: optional initiale
+            (?P<v>[auieoɛɔwnŋɲƐƆ'])                      # vowel: syllable core, obligatory
+            ([\u030c\u0300\u0301\u0302]?)           # tone: for the vowel
+            ((?P=v)?)                                # vowel2: long vowels (same vowel letter)
+            ([\u030c\u0300\u0301\u0302]?)           # tone2: possible tone marker on vowel2
+            (n?(?![auieoɛɔ\u0301]))                 # nasal: finale, not followed by vowel or tone
+        )""", re.I|re.X)
+
+
+@functools.lru_cache(maxsize=65536)
+def _syllabify(word):
+    # returns (syllables, error message), both are cached
+    nword = unicodedata.normalize('NFKD', word)
+    syllables = []
+    index = 0
+    for syl in SYLLABLE.finditer(nword):
+        if syl.start()-index > 0:
+            return None, u"Nonconforming syllabic structure: {0}, at pos: {1}-".format(nword, nword[:index+1])
+        index = syl.end()
+        syllables.append(Syllable(*syl.groups()))
+    if index < len(nword):
+        return None, u"Nonconforming syllabic structure: {0}, at pos: {1}-".format(nword, nword[:index])
+    return tuple(syllables), None
+
+
+def syllabify(word):
+    """Split word into a tuple of Syllables, raise ValueError if it is nonconforming"""
+    syllables, error = _syllabify(word)
+    if error:
+        raise ValueError(error)
+    return syllables
+
+
+def syllabify_all(words):
+    """Syllabify a sequence of words, return a list of tuples (None for nonconforming words)"""
+    return [_syllabify(word)[0] for word in words]
+
+
 class Syllabify(MutableSequence):
     def __init__(self, word):
-        nword = unicodedata.normalize('NFKD', word)        
-        self._syllables = []
-        index = 0
-        syllable = re.compile(r"""
-                (                                           # raw: whole syllable group
-                    ([^auieoɛɔƐƆ\u030c\u0300\u0301\u0302]*)   # consonant: optional initiale
-                    (?P<v>[auieoɛɔwnŋɲƐƆ'])                      # vowel: syllable core, obligatory
-                    ([\u030c\u0300\u0301\u0302]?)           # tone: for the vowel
-                    ((?P=v)?)                                # vowel2: long vowels (same vowel letter)
-                    ([\u030c\u0300\u0301\u0302]?)           # tone2: possible tone marker on vowel2
-                    (n?(?![auieoɛɔ\u0301]))                 # nasal: finale, not followed by vowel or tone
-                )""", re.I|re.X)
-        for syl in syllable.finditer(nword):
-            if syl.start()-index > 0:
-                raise ValueError(u"Nonconforming syllabic structure: {0}, at pos: {1}-".format(nword, nword[:index+1]))
-            else:
-                index = syl.end()
-                try:
-                    self._syllables.append(Syllable(*syl.groups()))
-                except (TypeError):
-                    print(syl.groups())
-        if index < len(nword):
-            raise ValueError(u"Nonconforming syllabic structure: {0}, at pos: {1}-".format(nword, nword[:index]))
+        self._syllables = list(syllabify(word))
 
     def __len__(self):
         return len(self._syllables)
@@ -99,23 +118,63 @@ def orth_compliant(word):
     else:
         return 1
 
+class _MarkTable(dict):
+    """Translation table deleting combining marks (category Mn)
+
+    Maps code points to None for combining marks and to themselves
+    otherwise; entries are computed on first use and kept.
+    """
+    def __missing__(self, code):
+        value = None if unicodedata.category(chr(code)) == 'Mn' else code
+        self[code] = value
+        return value
+
+
+_marks = _MarkTable()
+# precompute Latin, IPA, combining diacritics and N'Ko blocks
+for _code in list(range(0x370)) + list(range(0x7c0, 0x800)):
+    _marks[_code]
+del _code
+
+
+@functools.lru_cache(maxsize=65536)
+def _detone(string):
+    if string.isascii():
+        return string
+    return unicodedata.normalize('NFD', string).translate(_marks)
+
+
 def detone(string):
     # remove all tonemarking from string
-    return "".join([c for c in unicodedata.normalize('NFD', str(string)) if not unicodedata.category(c) == 'Mn'])
+    return _detone(str(string))
 
 
+def detone_all(strings):
+    """Detone a sequence of strings, return a list"""
+    return [_detone(str(s)) for s in strings]
+
+
+@functools.lru_cache(maxsize=65536)
 def tones_match(source, tonalized):
+    # every tone mark present in source should be present
+    # at the same position in tonalized
     source = unicodedata.normalize('NFD', source)
     tonalized = unicodedata.normalize('NFD', tonalized)
+    length = len(source)
+    pos = 0
     for c in tonalized:
-        if source:
-            if unicodedata.category(c) == 'Mn':
-                if unicodedata.category(source[0]) == 'Mn':
-                    if not c == source[0]:
-                        return False
-                    else:
-                        source = source[1:]
-            else:
-                source = source[1:]
+        if pos == length:
+            break
+        if _marks[ord(c)] is None:
+            if _marks[ord(source[pos])] is None:
+                if not c == source[pos]:
+                    return False
+                pos += 1
+        else:
+            pos += 1
     return True
 
+
+def tones_match_any(sources, tonalized):
+    """Check if tonalized form matches tones in any of source forms"""
+    return any(tones_match(s, tonalized) for s in sources)
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Run the whole annotation chain in a single pass: parse a text (as
+# mparser does), disambiguate it with dabased rules and/or a CRF model
+# (as disambiguation.py does) and export the result in one or several
+# formats. The annotated text is kept in memory between the stages, so
+# intermediate files are only written when requested.
+
+import os
+import time
+import shlex
+import argparse
+
+import daba.formats
+import daba.mparser
+import daba.daba2vert
+from daba.dabased import ScriptParser, StreamEditor
+
+# output filename suffixes by format
+SUFFIXES = {
+    'html': '.dis.html',
+    'txt': '.tok.txt',
+    'sentlist': '.sent.txt',
+    'tokens': '.tokens',
+    'vert': '.vert',
+    'conll': '.conllu',
+    }
+
+
+def basename(infile):
+    """filename without extension (and without .pars/.dis suffix)"""
+    for suffix in ('.pars.html', '.dis.html'):
+        if infile.endswith(suffix):
+            return infile[:-len(suffix)]
+    return os.path.splitext(infile)[0]
+
+
+class Pipeline(object):
+    """parse -> disambiguate -> export chain
+
+    processor is an mparser Processor used for files that are not parsed
+    yet, rules is a list of dabased scripts applied in turn to the whole
+    file (see disambiguate), tagger is a CRF model (see
+    disambiguation.load_tagger) used to order (or, with select, to
+    filter) the remaining ambiguous glosses.
+    vertargs are daba2vert options used for vert output.
+    """
+    def __init__(self, processor, rules=(), tagger=None, select=False,
+                 sentlist=False, vertargs=None, stats=None):
+        self.processor = processor
+        self.editor = StreamEditor()
+        self.passes = [self.editor.compile_script(script) for script in rules]
+        self.tagger = tagger
+        self.select = select
+        self.sentlist = sentlist
+        self.stats = stats
+        if vertargs is None:
+            vertargs = daba.daba2vert.make_parser().parse_args([])
+        self.vertargs = vertargs
+        if vertargs.variants:
+            self.vardict, self.polidict = daba.daba2vert.VariantsLoader(vertargs.variants).get()
+        else:
+            self.vardict, self.polidict = None, None
+        if tagger is not None:
+            # imported here since CRF dependencies are optional
+            from daba.disambiguation import disambiguate_tokens
+            self.disambiguate_tokens = disambiguate_tokens
+        if stats:
+            self.disambiguate = stats.timed('disambiguate', self.disambiguate)
+
+    @property
+    def disambiguates(self):
+        return bool(self.passes) or self.tagger is not None
+
+    def disambiguate(self, para):
+        """disambiguate parsed paragraphs, return new paragraphs
+
+        Rules are applied to the token stream of the whole file, with
+        <p> and <s> boundary tokens, as dabased does for html files.
+        """
+        if self.passes:
+            tokens = daba.formats.iter_tokens(para)
+            for passes in self.passes:
+                tokens = self.editor.apply_passes(passes, tokens)
+            para = daba.formats.make_compatible_glosses(tokens)
+        if self.tagger is not None:
+            for par in para:
+                for senttoken, annot in par:
+                    self.disambiguate_tokens(self.tagger, annot, self.select)
+        return para
+
+    def annotate(self, io):
+        """return parsed paragraphs for a file read into a FileWrapper"""
+        if io.parsed:
+            para = io.glosses
+            if self.stats:
+                for par in para:
+                    self.stats.count(par)
+        else:
+            para = self.processor.parse(io.para)
+        return para
+
+    def docid(self, infile, outputs):
+        """document id for vert output
+
+        daba2vert names documents after the html file it reads, so use
+        the html output if there is one, otherwise the name the
+        mparser/disambiguation chain would give to its last html file.
+        """
+        for format, outfile in outputs:
+            if format == 'html':
+                return os.path.basename(outfile)
+        if infile.endswith('.html') and not self.disambiguates:
+            return os.path.basename(infile)
+        suffix = '.dis.html' if self.disambiguates else '.pars.html'
+        return os.path.basename(basename(infile) + suffix)
+
+    def write_vert(self, outfile, docid, metadata, para):
+        with open(outfile, 'w', encoding='utf-8') as out:
+            daba.daba2vert.print_annotation(docid, metadata, para, self.vertargs,
+                                            self.vardict, self.polidict, out=out)
+
+    def process_file(self, infile, outputs, parsed_outfile=None):
+        """run the chain on infile
+
+        outputs is a list of (format, filename) pairs, parsed_outfile (if
+        given) receives parser output before disambiguation.
+        """
+        print('Processing', infile)
+        stats = self.stats
+        if stats:
+            stats.start_file(infile)
+            start = time.perf_counter()
+        io = daba.formats.FileWrapper()
+        io.read(infile, sentlist=self.sentlist)
+        if stats:
+            stats.add_time('read', start)
+        para = self.annotate(io)
+        if parsed_outfile:
+            io.write(parsed_outfile, para, parsed=True)
+        if self.disambiguates:
+            para = self.disambiguate(para)
+        if stats:
+            start = time.perf_counter()
+        for format, outfile in outputs:
+            if format == 'vert':
+                self.write_vert(outfile, self.docid(infile, outputs), io.metadata, para)
+            else:
+                io.write(outfile, para, parsed=True, format=format)
+        if stats:
+            stats.add_time('write', start)
+            stats.end_file()
+        print('Finished', ', '.join(outfile for format, outfile in outputs))
+
+
+def main():
+    tkz = daba.mparser.Tokenizer()
+    formats = daba.formats.FileWrapper().output_formats + ['vert']
+
+    aparser = argparse.ArgumentParser(description='Daba suite. Parse, disambiguate and export texts in a single pass.')
+    aparser.add_argument('-i', '--infile', help='Input file (.txt, or .html if already parsed)')
+    aparser.add_argument('-l', '--list', help='Read input filenames list from file')
+    aparser.add_argument('-o', '--outfile', help='Output file (single input file and output format only, by default derived from input filename)')
+    aparser.add_argument('-f', '--format', action='append', choices=formats, default=None, help='Output format, may be given several times (default: vert)')
+    aparser.add_argument('-V', '--vert-options', default='', metavar='OPTIONS', help='daba2vert options for vert output, as a single string (e.g. -V="-t -u")')
+    aparser.add_argument('-k', '--keep-parsed', action='store_true', help='Also write parser output before disambiguation (.pars.html)')
+    aparser.add_argument('-s', '--script', action='append', metavar='PLUGIN', default=None, help='Perform orthographic conversion operations (defined in plugins), in the order they appear on command line')
+    aparser.add_argument('-c', '--convert', action='store_true', help="Convert orthography")
+    aparser.add_argument('--max-candidates', type=int, default=None, help="Maximum number of spellings per word produced by ambiguous orthographic conversions")
+    aparser.add_argument("-d", "--dictionary", action="append", help="Toolbox dictionary file (may be added multiple times)")
+    aparser.add_argument("-j", "--jobs", type=int, default=1, help="Number of processes to compile dictionaries with")
+    aparser.add_argument("-g", "--grammar", help="Grammar specification file")
+    aparser.add_argument("-S", "--sentlist", action='store_true', help="Read txt file with sentence boundary tags")
+    aparser.add_argument("-t", "--detone", action='store_true', help="Ignore tones in dictionary lookups")
+    aparser.add_argument("-z", "--tokenizer", action='store', choices=tkz.methods, default="default", help="Tokenizer to use")
+    aparser.add_argument('-r', '--rules', action='append', default=[], metavar='SCRIPT', help='Disambiguate with dabased script (may be added multiple times, applied in order)')
+    aparser.add_argument('-m', '--model', help='Disambiguate with CRF model (see disambiguation.py)')
+    aparser.add_argument('--select', action='store_true', help='Keep only the most likely glosses (with --model)')
+    aparser.add_argument("-v", "--verbose", action='store_true', help="print info messages on loaded dictionaries")
+    aparser.add_argument("--stats", action='store', default=None, help="Write timings and parser stage statistics (JSON) into a file")
+    args = aparser.parse_args()
+
+    if not args.infile and not args.list:
+        aparser.error('either --infile or --list is required')
+    formats = args.format or ['vert']
+    if args.outfile and (args.list or len(formats) > 1):
+        aparser.error('--outfile requires a single input file and output format')
+    if args.script:
+        try:
+            daba.mparser.load_plugins(args.script)
+        except ValueError as e:
+            aparser.error(str(e))
+    tagger = None
+    if args.model:
+        try:
+            from daba.disambiguation import load_tagger
+        except ImportError as e:
+            aparser.error('CRF disambiguation is not available: {0}'.format(e))
+        tagger = load_tagger(args.model)
+    rules = [list(ScriptParser(script)) for script in args.rules]
+    vertargs = daba.daba2vert.make_parser().parse_args(shlex.split(args.vert_options))
+    tkz.use_method(args.tokenizer)
+    stats = daba.mparser.ParseStats() if args.stats else None
+
+    dl = daba.mparser.DictLoader(verbose=args.verbose)
+    gr = daba.mparser.GrammarLoader()
+    if args.dictionary:
+        dl.addfiles(args.dictionary, jobs=args.jobs)
+    if args.grammar:
+        gr.load(args.grammar)
+    pp = daba.mparser.Processor(dictloader=dl, grammarloader=gr, tokenizer=tkz, converters=args.script,
+                                detone=args.detone, normalize_orthography=args.convert,
+                                has_sentences=args.sentlist, stats=stats, maxcandidates=args.max_candidates)
+    pipeline = Pipeline(pp, rules=rules, tagger=tagger, select=args.select,
+                        sentlist=args.sentlist, vertargs=vertargs, stats=stats)
+
+    if args.list:
+        with open(args.list, encoding='utf-8') as filelist:
+            infiles = [os.path.normpath(line.strip()) for line in filelist if line.strip()]
+        infiles = [infile for infile in infiles if os.path.exists(infile)]
+    else:
+        infiles = [args.infile]
+    jobs = []
+    for infile in infiles:
+        base = basename(infile)
+        if args.outfile:
+            outputs = [(formats[0], args.outfile)]
+        else:
+            outputs = []
+            for format in formats:
+                suffix = SUFFIXES[format]
+                if format == 'html' and not pipeline.disambiguates:
+                    suffix = '.pars.html'
+                outputs.append((format, base + suffix))
+        parsed_outfile = base + '.pars.html' if args.keep_parsed else None
+        # e.g. an already parsed .pars.html file written back as html
+        # without disambiguation
+        for outfile in [outfile for format, outfile in outputs] + [parsed_outfile]:
+            if outfile and os.path.abspath(outfile) == os.path.abspath(infile):
+                aparser.error('output file {0} would overwrite input file, use --outfile or another format'.format(outfile))
+        jobs.append((infile, outputs, parsed_outfile))
+    for infile, outputs, parsed_outfile in jobs:
+        pipeline.process_file(infile, outputs, parsed_outfile)
+    if stats:
+        stats.dump(args.stats)
+
+
+import unittest
+import tempfile
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        from daba.ntgloss import Gloss
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        i = daba.formats.WordToken([Gloss(u'i', ('pers',), u'', ())], u'i')
+        taa = daba.formats.WordToken([Gloss(u'taa', ('v',), u'', ())], u'taa')
+        sent = lambda text, annot: (daba.formats.PlainToken(('</s>', text)), annot)
+        self.infile = os.path.join(self.tmpdir, 'test.pars.html')
+        para = [[sent(u'i taa', [i, taa]), sent(u'taa', [taa])], [sent(u'taa i', [taa, i]), sent(u'i', [i])]]
+        daba.formats.HtmlWriter(({}, para), self.infile).write()
+
+    def test_boundary_rules(self):
+        script = os.path.join(self.tmpdir, 'rules.txt')
+        with open(script, 'w', encoding='utf-8') as rules:
+            rules.write(u'@<s> ++ i:pers: >> @<s> ++ i:pers:1SG\n')
+        pipeline = Pipeline(None, rules=[list(ScriptParser(script))])
+        outfile = os.path.join(self.tmpdir, 'test.dis.html')
+        pipeline.process_file(self.infile, [('html', outfile)])
+        glosses = daba.formats.HtmlReader(outfile).glosses
+        self.assertEqual([[senttoken.value for senttoken, annot in par] for par in glosses],
+                         [[u'i taa', u'taa'], [u'taa i', u'i']])
+        self.assertEqual([[token.gloss.gloss for token in annot] for par in glosses for senttoken, annot in par],
+                         [[u'1SG', u''], [u''], [u'', u''], [u'1SG']])
+
+
+if __name__ == '__main__':
+    main()
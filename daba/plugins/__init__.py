@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import os,sys
+import re
+import itertools
 sys.path.insert(1, os.path.join(sys.path[0], '..'))
 from collections import defaultdict
 from daba.orthography import Syllabify
@@ -42,9 +44,74 @@ class OrthographyConverter(metaclass=PluginMount):
 
     @convert    Main conversion method. Takes single token as input, returns
     list of possible conversions
+
+    @iter_candidates    Lazy version of convert. Takes a token and optionally
+    a lexicon (see iter_spellings), yields possible conversions one by one
     """
     #__metaclass__ = PluginMount
 
+    def iter_candidates(self, token, lexicon=None):
+        return iter(self.convert(token))
+
+
+def iter_spellings(graphemes, lexicon=None):
+    """
+    Generate all concatenations taking a single option from each
+    list of options in graphemes, in order.
+
+    With lexicon (an object with iter_prefixes and has_prefix methods,
+    like mparser.ChainDict), spellings that can be segmented into lexicon
+    keys are generated first. Then come spellings made of lexicon keys
+    followed by a tail matching no key (affixed forms, as mrph entries
+    are not stored as keys), those with the longest segmented part first.
+    A partial spelling is only expanded as long as it can be completed
+    into keys, its tails are generated after that. If no spelling starts
+    with a lexicon key, all spellings are generated.
+    """
+    if lexicon is None:
+        for spelling in itertools.product(*graphemes):
+            yield ''.join(spelling)
+        return
+
+    # (segmented length, prefix, index of the first grapheme of the tail)
+    tails = []
+
+    def expand(prefix, index, starts):
+        # starts: positions in prefix where a lexicon key may begin,
+        # i.e. prefix is segmented into keys up to there
+        if index == len(graphemes):
+            if len(prefix) in starts:
+                yield prefix
+            elif max(starts):
+                tails.append((max(starts), prefix, index))
+            return
+        for option in graphemes[index]:
+            form = prefix + option
+            lower = form.lower()
+            ends = set(starts)
+            for start in starts:
+                for key in lexicon.iter_prefixes(lower[start:]):
+                    if start + len(key) > len(prefix):
+                        ends.add(start + len(key))
+            new = tuple(sorted(s for s in ends if s == len(form) or lexicon.has_prefix(lower[s:])))
+            if new:
+                yield from expand(form, index+1, new)
+            elif max(ends):
+                tails.append((max(ends), form, index+1))
+
+    empty = True
+    for spelling in expand('', 0, (0,)):
+        empty = False
+        yield spelling
+    tails.sort(key=lambda tail: -tail[0])
+    for segmented, prefix, index in tails:
+        for spelling in itertools.product(*graphemes[index:]):
+            empty = False
+            yield prefix + ''.join(spelling)
+    if empty:
+        for spelling in itertools.product(*graphemes):
+            yield ''.join(spelling)
+
 
 class TonesConverter(object):
     def __init__(self, word, debug=False):
@@ -81,3 +148,78 @@ class TonesConverter(object):
             else:
                 return [self.word]
 
+
+
+class Transliterator(object):
+    """
+    Compiled rewrite chain for orthography converters.
+
+    Stages are applied in order. A stage is either a mapping table (dict)
+    from source strings to replacements, converted in a single left to
+    right pass taking the longest matching key at each position, or a
+    list of contextual (pattern, replacement) regex rules applied with
+    re.sub one after another.
+    """
+    def __init__(self, *stages):
+        self.stages = []
+        for stage in stages:
+            if isinstance(stage, dict):
+                self.stages.append(self.compile_table(stage))
+            else:
+                self.stages.append(self.compile_rules(stage))
+
+    @staticmethod
+    def compile_table(table):
+        chars = {ord(k): v for k, v in table.items() if len(k) == 1}
+        multi = {k: v for k, v in table.items() if len(k) > 1}
+        if not multi:
+            return lambda w: w.translate(chars)
+        # trie of multicharacter keys, keys sharing a prefix are
+        # tried longest first
+        trie = {}
+        for key in multi:
+            node = trie
+            for c in key:
+                node = node.setdefault(c, {})
+            node[''] = None
+        pattern = re.compile(Transliterator.trie_regex(trie))
+        if any(ord(c) in chars for v in multi.values() for c in v):
+            # replacements should not be rewritten again, fall back to
+            # a single regex over all keys
+            pattern = re.compile(u'|'.join([pattern.pattern] + [re.escape(k) for k in table if len(k) == 1]))
+            return lambda w: pattern.sub(lambda m: table[m.group()], w)
+        # multicharacter keys and single characters never overlap in a
+        # longest match scan, so the latter can be translated afterwards
+        return lambda w: pattern.sub(lambda m: multi[m.group()], w).translate(chars)
+
+    @staticmethod
+    def trie_regex(trie):
+        branches = []
+        final = False
+        for c, node in sorted(trie.items()):
+            if not c:
+                final = True
+            elif list(node) == ['']:
+                branches.append(re.escape(c))
+            else:
+                branches.append(re.escape(c) + Transliterator.trie_regex(node))
+        if not branches:
+            return ''
+        regex = u'(?:{0})'.format(u'|'.join(branches))
+        if final:
+            regex += '?'
+        return regex
+
+    @staticmethod
+    def compile_rules(rules):
+        rules = [(re.compile(pattern), repl) for pattern, repl in rules]
+        def apply(w):
+            for pattern, repl in rules:
+                w = pattern.sub(repl, w)
+            return w
+        return apply
+
+    def __call__(self, word):
+        for stage in self.stages:
+            word = stage(word)
+        return word
@@ -1,61 +1,79 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from . import OrthographyConverter
+from . import OrthographyConverter, iter_spellings
 import funcparserlib.lexer
 import re
 import unicodedata
+import unittest
 
 
 class BambaraOldtoNew(OrthographyConverter):
     def __init__(self, *args, **kwargs):
         self.title = 'bamlatinold'
         self.desc = 'Convertor from old latin Bambara orthography (ambiguous)'
+        self.conversion_table = {u'è':[u'ɛ'], u'ò':[u'ɔ'], u'èe':[u'ɛɛ'], u'òo':[u'ɔɔ'], u'ng':[u'ng',u'ŋ'], u'ny':[u'ny',u'ɲ']}
+        specs = [
+                ('NG', (r'ng', re.I | re.U)),
+                ('NY', (r'ny', re.I | re.U)),
+                ('EE', (r'è[eè]', re.I | re.U)),
+                ('OO', (r'ò[oò]', re.I | re.U)),
+                ('NL', (r'[\n]+', re.U)),
+                ('QUOT', (r'["]', re.U)),
+                ('ANY', (r'.', re.U)),
+                ]
+        self.tokenizer = funcparserlib.lexer.make_tokenizer(specs)
+
+    def graphemes_old(self, word):
+        # split word into maximal length graphemes (old orthography)
+        return [x.value for x in self.tokenizer(unicodedata.normalize('NFKC', word)) if x.type != 'NL']
+
+    def convertg(self, grapheme):
+        # convert a single grapheme into a list of corresponding graphemes in new orthography
+        try:
+            # !!HACK: converts graphemes to lowercase!!
+            return self.conversion_table[grapheme.lower()]
+        except KeyError:
+            return [grapheme]
+
+    def iter_candidates(self, token, lexicon=None):
+        """
+        Lazily yield possible translations of a word to new orthography,
+        pruned against lexicon if given
+        """
+        graphemes = [self.convertg(g) for g in self.graphemes_old(token)]
+        return iter_spellings(graphemes, lexicon)
 
     def convert(self, token):
         """
         Main conversion method
         """
-        conversion_table = {u'è':[u'ɛ'], u'ò':[u'ɔ'], u'èe':[u'ɛɛ'], u'òo':[u'ɔɔ'], u'ng':[u'ng',u'ŋ'], u'ny':[u'ny',u'ɲ']}
-
-        def graphemes_old(word):
-            # split word into maximal length graphemes (old orthography)
-            specs = [
-                    ('NG', (r'ng', re.I | re.U)),
-                    ('NY', (r'ny', re.I | re.U)),
-                    ('EE', (r'è[eè]', re.I | re.U)),
-                    ('OO', (r'ò[oò]', re.I | re.U)),
-                    ('NL', (r'[\n]+', re.U)),
-                    ('QUOT', (r'["]', re.U)),
-                    ('ANY', (r'.', re.U)),
-                    ]
-            tok = funcparserlib.lexer.make_tokenizer(specs)
-            r = [x.value for x in tok(unicodedata.normalize('NFKC', word)) if x.type != 'NL']
-            return r
-
-        def multiply_list(amblist):
-            # given list of lists, returns list of all possible concatenations
-            # taking a single element from each list
-            def multiply_list_aux(l, amblist):
-                if len(amblist)>0:
-                    m = [ l[k]+[amblist[0][i]] for k in range(len(l)) for i in range(len(amblist[0]))]
-                    return multiply_list_aux(m, amblist[1:])
-                else:
-                    return l
-            return multiply_list_aux([[]], amblist)
-
-        def convertg(grapheme):
-            # convert a single grapheme into a list of corresponding graphemes in new orthography
-            try:
-                # !!HACK: converts graphemes to lowercase!!
-                return conversion_table[grapheme.lower()]
-            except KeyError:
-                return [grapheme]
-
-        def convertw(word):
-            # given single word in old orthography returns 
-            # list of all possible translations to new orthography
-            graphemes = [convertg(g) for g in graphemes_old(word)]
-            return [''.join(w) for w in multiply_list(graphemes)]
-        
-        return convertw(token)
+        return list(self.iter_candidates(token))
+
+
+class TestCandidates(unittest.TestCase):
+    def setUp(self):
+        # imported here to keep plugin loading light
+        from daba.formats import DabaDict
+        from daba.mparser import ChainDict
+        from daba.ntgloss import Gloss
+        dic = DabaDict()
+        for form in [u'ɲɔgɔn', u'n', u'ye']:
+            dic[form] = Gloss(form, ('n',), 'x', ())
+        self.lexicon = ChainDict(dic)
+        self.conv = BambaraOldtoNew()
+
+    def candidates(self, word):
+        return list(self.conv.iter_candidates(word, self.lexicon))
+
+    def test_segmented_first(self):
+        self.assertEqual(self.candidates(u'nyògòn'), [u'ɲɔgɔn', u'nyɔgɔn'])
+
+    def test_affixed(self):
+        # mrph entries (-w PL) are not lexicon keys
+        self.assertEqual(self.candidates(u'nyògònw'), [u'ɲɔgɔnw', u'nyɔgɔnw'])
+        self.assertEqual(sorted(self.candidates(u'nyògònw')), sorted(self.conv.convert(u'nyògònw')))
+
+    def test_unknown(self):
+        self.assertEqual(self.candidates(u'bangè'), self.conv.convert(u'bangè'))
+        self.assertEqual(self.candidates(u'bangè'), [u'bangɛ', u'baŋɛ'])
@@ -141,7 +141,10 @@ setup(
             'mparser=daba.mparser:main',
             'wordparser=daba.wordparser:main',
             'dabased=daba.dabased:main',
-            'daba2align=daba.daba2align:main'
+            'daba2align=daba.daba2align:main',
+            'daba2vert=daba.daba2vert:main',
+            'dabapipe=daba.pipeline:main',
+            'metadb=daba.metadb:main'
         ],
         'gui_scripts': [
             'meta=daba.meta:main',